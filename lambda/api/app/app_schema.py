@@ -1,19 +1,18 @@
 import json
 import logging
 import os
-import boto3
 import re
 import imghdr
+from boto3.dynamodb.conditions import Key
 from botocore.exceptions import ClientError
 
+from clients import get_dynamodb_resource
+
 logger = logging.getLogger(__name__)
 
 # デフォルトアプリ
 DEFAULT_APP = "shipping_ocr"
 
-# DynamoDB クライアント
-dynamodb = boto3.resource('dynamodb')
-
 
 def load_app_schemas():
     """
@@ -29,11 +28,11 @@ def load_app_schemas():
             raise ValueError("SCHEMAS_TABLE_NAME environment variable is not set")
             
         logger.info(f"DynamoDB からスキーマを取得します: {schemas_table_name}")
-        schemas_table = dynamodb.Table(schemas_table_name)
+        schemas_table = get_dynamodb_resource().Table(schemas_table_name)
         
         # schema_type='app' の全てのレコードを取得
         response = schemas_table.query(
-            KeyConditionExpression=boto3.dynamodb.conditions.Key('schema_type').eq('app')
+            KeyConditionExpression=Key('schema_type').eq('app')
         )
         
         if 'Items' in response and response['Items']:
@@ -99,9 +98,8 @@ def get_extraction_fields_for_app(app_name):
     return {"fields": []}
 
 
-def get_field_names_for_app(app_name):
-    """指定されたアプリの抽出フィールド名リストを取得（階層構造対応）"""
-    fields = get_extraction_fields_for_app(app_name)["fields"]
+def collect_field_names(fields):
+    """抽出フィールド定義からフィールド名リストを作成（階層構造対応）"""
     field_names = []
     
     def extract_field_names(fields, prefix=""):
@@ -126,6 +124,12 @@ def get_field_names_for_app(app_name):
     return field_names
 
 
+def get_field_names_for_app(app_name):
+    """指定されたアプリの抽出フィールド名リストを取得（階層構造対応）"""
+    fields = get_extraction_fields_for_app(app_name)["fields"]
+    return collect_field_names(fields)
+
+
 def get_app_display_name(app_name):
     """アプリの表示名を取得"""
     app_schemas = get_app_schemas()
@@ -164,7 +168,7 @@ def update_app_schema(app_name, app_data):
             logger.error("SCHEMAS_TABLE_NAME 環境変数が設定されていません")
             return False
             
-        schemas_table = dynamodb.Table(schemas_table_name)
+        schemas_table = get_dynamodb_resource().Table(schemas_table_name)
         
         # 現在の日時を取得
         from datetime import datetime
@@ -199,6 +203,10 @@ def update_app_schema(app_name, app_data):
             item['custom_prompt'] = app_data['custom_prompt']
         
         schemas_table.put_item(Item=item)
+
+        # コンパイル済みプロンプトを破棄
+        from utils.prompt_artifacts import invalidate_compiled_prompt
+        invalidate_compiled_prompt(app_name)
         
         logger.info(f"スキーマを更新しました: {app_name}")
         return True
@@ -218,7 +226,7 @@ def delete_app_schema(app_name):
             logger.error("SCHEMAS_TABLE_NAME 環境変数が設定されていません")
             return False
             
-        schemas_table = dynamodb.Table(schemas_table_name)
+        schemas_table = get_dynamodb_resource().Table(schemas_table_name)
         
         # スキーマを削除
         schemas_table.delete_item(
@@ -228,6 +236,10 @@ def delete_app_schema(app_name):
             }
         )
         
+        # コンパイル済みプロンプトを破棄
+        from utils.prompt_artifacts import invalidate_compiled_prompt
+        invalidate_compiled_prompt(app_name)
+
         logger.info(f"スキーマを削除しました: {app_name}")
         return True
         
@@ -248,7 +260,7 @@ def generate_schema_fields_from_image(image_data, instructions=None):
     """
     try:
         # extraction.pyから必要な関数をimport
-        from utils.bedrock import call_bedrock, parse_converse_response
+        from utils.bedrock import call_bedrock_with_retry, parse_converse_response
         
         # 画像のMIMEタイプを判定
         image_type = imghdr.what(None, h=image_data)
@@ -545,8 +557,8 @@ def generate_schema_fields_from_image(image_data, instructions=None):
 
         messages = [user_message]
 
-        # Bedrock APIを呼び出し
-        response = call_bedrock(messages, system_prompts)
+        # Bedrock APIを呼び出し（スロットリング時は再試行）
+        response = call_bedrock_with_retry(messages, system_prompts)
 
         # レスポンスからテキストを抽出
         fields_text = parse_converse_response(response)
@@ -0,0 +1,169 @@
+"""
+バッチ推論による一括情報抽出
+一括OCRジョブの抽出リクエストをまとめてバッチ推論に投入し、完了後に結果を各画像へ取り込む
+"""
+import logging
+
+from database import get_image, update_extracted_info, update_image_status, update_extraction_status
+from extraction import (
+    build_extraction_plan, iter_plan_requests, plan_shard_fields,
+    merge_plan_responses, save_extraction_result
+)
+from utils.batch_inference import (
+    get_batch_inference_client, to_batch_model_input,
+    STATUS_IN_PROGRESS, STATUS_COMPLETED
+)
+from utils.bedrock import parse_converse_response
+
+logger = logging.getLogger(__name__)
+
+# バッチ推論に投入済みで結果の取り込みを待っている画像の抽出ステータス
+# （複数ページ統合のOCRは完了時に抽出ステータスをcompletedにするため、投入時に上書きする）
+BATCH_PENDING_EXTRACTION_STATUS = "processing"
+
+
+def batch_job_name(job_id: str) -> str:
+    """OCRジョブIDからバッチ推論のジョブ名を作成"""
+    return f"extraction-{job_id}"
+
+
+def _mark_extraction_failed(image_id: str):
+    """抽出の失敗をデータベースに記録"""
+    try:
+        update_extracted_info(image_id, {}, {}, "failed")
+        update_image_status(image_id, "failed")
+    except Exception as db_error:
+        logger.error(f"Error updating extraction status: {str(db_error)}")
+
+
+def submit_batch_extraction(image_ids: list, job_id: str, client=None):
+    """
+    画像ごとの抽出リクエストをバッチ推論に投入する
+
+    抽出計画（スキーマ分割・ページ分割を含む）を画像ごとに作成し、全リクエストを
+    1つのJSONLにまとめる。結果の取り込みに必要なレコードと画像の対応はマニフェストとして保存する
+
+    Args:
+        image_ids (list): 抽出対象の画像IDのリスト（OCR済み）
+        job_id (str): OCRジョブID
+        client (BatchInferenceClient, optional): 未指定時は設定に応じたクライアント
+
+    Returns:
+        list: バッチ推論に投入しなかった画像IDのリスト（最小レコード数に満たない場合は全件）
+    """
+    client = client or get_batch_inference_client()
+    records = []
+    images = {}
+
+    for image_id in image_ids:
+        try:
+            plan = build_extraction_plan(image_id)
+        except Exception as e:
+            logger.error(f"抽出計画の作成に失敗しました: {image_id}, {str(e)}")
+            _mark_extraction_failed(image_id)
+            continue
+        if plan is None:
+            continue
+
+        entry_records = []
+        for shard_index, chunk_index, messages, system_prompts in iter_plan_requests(plan):
+            # レコードIDは英数字11文字の連番とする
+            record_id = f"R{len(records):010d}"
+            records.append({
+                "recordId": record_id,
+                "modelInput": to_batch_model_input(messages, system_prompts)
+            })
+            entry_records.append([record_id, shard_index, chunk_index])
+
+        images[image_id] = {
+            "app_fields": plan["compiled_prompt"]["extraction_fields"].get("fields", []),
+            "shard_fields": plan_shard_fields(plan),
+            "line_to_words": plan["line_to_words"],
+            "records": entry_records
+        }
+
+    if not records:
+        logger.warning(f"バッチ推論に投入する抽出リクエストがありません: job_id={job_id}")
+        return []
+
+    if len(records) < client.min_records:
+        logger.info(
+            f"レコード数が最小件数に満たないため同期呼び出しで抽出します: {len(records)} < {client.min_records}")
+        return list(images.keys())
+
+    job_name = batch_job_name(job_id)
+    batch_job_id = client.submit(job_name, records)
+    client.save_manifest(job_name, {
+        "job_id": job_id,
+        "batch_job_id": batch_job_id,
+        "images": images
+    })
+    for image_id in images:
+        update_extraction_status(image_id, BATCH_PENDING_EXTRACTION_STATUS)
+    logger.info(
+        f"バッチ抽出を投入しました: job_id={job_id}, 画像 {len(images)}件, レコード {len(records)}件")
+    return []
+
+
+def collect_batch_extraction(job_id: str, client=None) -> str:
+    """
+    バッチ推論の状態を確認し、完了していれば結果を各画像に取り込む
+
+    取り込み待ちの画像（投入時に抽出ステータスを処理中にしたもの）のみを処理し、
+    取り込み済みの画像は再度処理しないため、何度呼び出してもよい
+
+    Args:
+        job_id (str): OCRジョブID
+        client (BatchInferenceClient, optional): 未指定時は設定に応じたクライアント
+
+    Returns:
+        str: バッチ推論の状態（in_progress / completed / failed）
+    """
+    client = client or get_batch_inference_client()
+    manifest = client.load_manifest(batch_job_name(job_id))
+    if manifest is None:
+        raise ValueError(f"バッチ抽出が見つかりません: {job_id}")
+
+    status = client.get_status(manifest["batch_job_id"])
+    if status == STATUS_IN_PROGRESS:
+        return status
+
+    results = client.get_results(manifest["batch_job_id"]) if status == STATUS_COMPLETED else {}
+
+    completed_count = 0
+    for image_id, entry in manifest["images"].items():
+        image_data = get_image(image_id)
+        if not image_data or image_data.get("extraction_status") != BATCH_PENDING_EXTRACTION_STATUS:
+            continue
+
+        try:
+            responses = {}
+            for record_id, shard_index, chunk_index in entry["records"]:
+                response = results.get(record_id)
+                responses[(shard_index, chunk_index)] = (
+                    parse_converse_response(response) if response is not None else None)
+
+            if all(response is None for response in responses.values()):
+                logger.error(f"バッチ推論の結果がありません: {image_id}")
+                _mark_extraction_failed(image_id)
+                continue
+
+            extracted_info, mapping = merge_plan_responses(
+                entry["shard_fields"], entry["app_fields"], responses)
+
+            # JSONに保存した行IDのキーは文字列になっているため数値に戻す
+            line_to_words = entry["line_to_words"]
+            if line_to_words is not None:
+                line_to_words = {int(line_id): word_ids for line_id, word_ids in line_to_words.items()}
+
+            save_extraction_result(image_id, extracted_info, mapping, line_to_words)
+            completed_count += 1
+        except Exception as e:
+            logger.error(f"バッチ抽出結果の取り込みに失敗しました: {image_id}, {str(e)}")
+            _mark_extraction_failed(image_id)
+
+    logger.info(
+        f"バッチ抽出結果を取り込みました: job_id={job_id}, 状態 {status}, "
+        f"完了 {completed_count}/{len(manifest['images'])}件")
+    return status
+
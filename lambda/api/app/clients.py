@@ -1,10 +1,37 @@
 """
 共通のAWSクライアント設定
 """
+import asyncio
+import functools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 import boto3
 from botocore.config import Config
 from config import settings
 
+logger = logging.getLogger(__name__)
+
+# リージョン別のBedrock Runtimeクライアント
+_bedrock_clients = {}
+_bedrock_clients_lock = threading.Lock()
+
+# 遅延生成したクライアントのキャッシュ
+_clients = {}
+_clients_lock = threading.Lock()
+
+# スレッドごとのDynamoDBリソース（boto3のリソースはスレッドセーフではないため共有しない）
+_thread_local = threading.local()
+
+# 非同期APIからAWSを呼び出すためのスレッドプール
+_io_executor = None
+_io_executor_lock = threading.Lock()
+
+# 非同期APIから情報抽出（Bedrock呼び出し）を実行するためのスレッドプール
+_extraction_executor = None
+_extraction_executor_lock = threading.Lock()
+
 
 def create_s3_client():
     """
@@ -17,7 +44,9 @@ def create_s3_client():
             signature_version='s3v4',
             s3={
                 'addressing_style': 'virtual'  # バケット仮想ホスト名を使用
-            }
+            },
+            # I/O用スレッドプールの全スレッドが同時に接続できるようにする
+            max_pool_connections=max(settings.AWS_IO_MAX_WORKERS, 10)
         )
     )
 
@@ -34,11 +63,59 @@ def create_bedrock_client(region_name=None):
         region_name=region_name or settings.MODEL_REGION,
         config=Config(
             read_timeout=900,  # 15分のタイムアウト
-            retries={'max_attempts': 3}
+            # リトライはutils.retryのポリシーで一元管理するためSDK側では行わない
+            retries={'max_attempts': 1, 'mode': 'standard'},
+            max_pool_connections=settings.BEDROCK_MAX_POOL_CONNECTIONS,
+            tcp_keepalive=True  # 長時間の推論中も接続を維持
         )
     )
 
 
+def get_bedrock_client(region_name=None):
+    """
+    リージョン別にキャッシュされたBedrock Runtime クライアントを取得
+
+    boto3クライアントの生成（エンドポイント解決・認証情報チェーン・
+    コネクションプール作成）は呼び出しごとに行わず、リージョンごとに1度だけ行う。
+    boto3クライアントはスレッドセーフなため、バックグラウンドタスク間で共有できる
+
+    Args:
+        region_name (str, optional): リージョン名。未指定時はsettings.MODEL_REGIONを使用
+    """
+    region_name = region_name or settings.MODEL_REGION
+
+    client = _bedrock_clients.get(region_name)
+    if client is not None:
+        return client
+
+    with _bedrock_clients_lock:
+        client = _bedrock_clients.get(region_name)
+        if client is None:
+            start_time = time.perf_counter()
+            client = create_bedrock_client(region_name)
+            _bedrock_clients[region_name] = client
+            logger.info(
+                f"Bedrockクライアントを作成しました (リージョン: {region_name}, "
+                f"{(time.perf_counter() - start_time) * 1000:.1f}ms)")
+
+    return client
+
+
+def create_bedrock_control_client(region_name=None):
+    """
+    Bedrock（コントロールプレーン）クライアントを作成
+
+    バッチ推論ジョブの作成・状態確認に使用する
+
+    Args:
+        region_name (str, optional): リージョン名。未指定時はsettings.MODEL_REGIONを使用
+    """
+    return boto3.client(
+        'bedrock',
+        region_name=region_name or settings.MODEL_REGION
+    )
+
+
 def create_dynamodb_client():
     """
     DynamoDB クライアントを作成
@@ -59,6 +136,16 @@ def create_sagemaker_runtime_client():
     )
 
 
+def create_sqs_client():
+    """
+    SQS クライアントを作成
+    """
+    return boto3.client(
+        'sqs',
+        region_name=settings.AWS_REGION
+    )
+
+
 def create_dynamodb_resource():
     """
     DynamoDB リソースを作成
@@ -69,9 +156,129 @@ def create_dynamodb_resource():
     )
 
 
-# グローバルクライアントインスタンス
-s3_client = create_s3_client()
-bedrock_client = create_bedrock_client()
-dynamodb_client = create_dynamodb_client()
-dynamodb_resource = create_dynamodb_resource()
-sagemaker_runtime_client = create_sagemaker_runtime_client()
+def _get_or_create_client(name, factory):
+    """
+    クライアントを初回アクセス時に生成してキャッシュする
+
+    インポート時に全クライアントを生成するとコールドスタートが遅くなるため、
+    実際に使用されるまで生成を遅延させる
+    """
+    client = _clients.get(name)
+    if client is not None:
+        return client
+
+    with _clients_lock:
+        client = _clients.get(name)
+        if client is None:
+            client = factory()
+            _clients[name] = client
+            logger.info(f"AWSクライアントを作成しました: {name}")
+
+    return client
+
+
+def get_s3_client():
+    """共有のS3クライアントを取得"""
+    return _get_or_create_client('s3', create_s3_client)
+
+
+def get_dynamodb_client():
+    """共有のDynamoDB クライアントを取得"""
+    return _get_or_create_client('dynamodb', create_dynamodb_client)
+
+
+def get_dynamodb_resource():
+    """
+    現在のスレッドのDynamoDB リソースを取得
+
+    クライアントと異なりリソースはスレッドセーフではないため、
+    パイプラインのワーカースレッドごとに1度だけ生成して再利用する
+    """
+    resource = getattr(_thread_local, 'dynamodb_resource', None)
+    if resource is None:
+        resource = create_dynamodb_resource()
+        _thread_local.dynamodb_resource = resource
+        logger.info(
+            f"DynamoDB リソースを作成しました (スレッド: {threading.current_thread().name})")
+    return resource
+
+
+def get_sagemaker_runtime_client():
+    """共有のSageMaker Runtime クライアントを取得"""
+    return _get_or_create_client('sagemaker_runtime', create_sagemaker_runtime_client)
+
+
+def get_bedrock_control_client():
+    """共有のBedrock（コントロールプレーン）クライアントを取得"""
+    return _get_or_create_client('bedrock', create_bedrock_control_client)
+
+
+def get_sqs_client():
+    """共有のSQS クライアントを取得"""
+    return _get_or_create_client('sqs', create_sqs_client)
+
+
+def get_io_executor():
+    """AWS呼び出し用のスレッドプールを取得（初回アクセス時に生成）"""
+    global _io_executor
+    if _io_executor is not None:
+        return _io_executor
+
+    with _io_executor_lock:
+        if _io_executor is None:
+            _io_executor = ThreadPoolExecutor(
+                max_workers=settings.AWS_IO_MAX_WORKERS,
+                thread_name_prefix="aws-io"
+            )
+    return _io_executor
+
+
+async def run_io(func, *args, **kwargs):
+    """
+    ブロッキングなAWS呼び出し（boto3・DynamoDBアクセス関数）をスレッドプールで実行して結果を待つ
+
+    async defのAPIから直接boto3を呼び出すとイベントループが止まり、
+    同じワーカーの他のリクエストが直列化されるため、必ずこの関数を経由する
+
+    Args:
+        func: 呼び出す関数
+        *args, **kwargs: 関数に渡す引数
+
+    Returns:
+        関数の戻り値
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_io_executor(), functools.partial(func, *args, **kwargs))
+
+
+def get_extraction_executor():
+    """情報抽出用のスレッドプールを取得（初回アクセス時に生成）"""
+    global _extraction_executor
+    if _extraction_executor is not None:
+        return _extraction_executor
+
+    with _extraction_executor_lock:
+        if _extraction_executor is None:
+            _extraction_executor = ThreadPoolExecutor(
+                max_workers=settings.EXTRACTION_REQUEST_MAX_WORKERS,
+                thread_name_prefix="extraction"
+            )
+    return _extraction_executor
+
+
+async def run_extraction(func, *args, **kwargs):
+    """
+    情報抽出（数分かかるBedrock呼び出し）を専用のスレッドプールで実行して結果を待つ
+
+    run_ioのスレッドプールで実行すると、同時に行う抽出がスレッドを占有して
+    他のリクエストのS3・DynamoDB呼び出しが待たされるため、抽出はこの関数を経由する
+
+    Args:
+        func: 呼び出す関数
+        *args, **kwargs: 関数に渡す引数
+
+    Returns:
+        関数の戻り値
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_extraction_executor(), functools.partial(func, *args, **kwargs))
@@ -11,6 +11,8 @@ class Settings:
     # DynamoDB設定
     IMAGES_TABLE_NAME: str = os.getenv("IMAGES_TABLE_NAME", "")
     JOBS_TABLE_NAME: str = os.getenv("JOBS_TABLE_NAME", "")
+    # S3同期で取り込み済みのオブジェクト（アプリ名・同期元URIごとに1アイテム）
+    SYNC_MANIFEST_TABLE_NAME: str = os.getenv("SYNC_MANIFEST_TABLE_NAME", "")
 
     # 機能フラグ
     ENABLE_OCR: bool = os.getenv("ENABLE_OCR", "true").lower() == "true"
@@ -19,6 +21,161 @@ class Settings:
     MODEL_ID: str = os.getenv(
         "MODEL_ID", "anthropic.claude-3-5-sonnet-20241022-v2:0")
     MODEL_REGION: str = os.getenv("MODEL_REGION", "us-east-1")
+    BEDROCK_MAX_POOL_CONNECTIONS: int = int(
+        os.getenv("BEDROCK_MAX_POOL_CONNECTIONS", "20"))
+
+    # Bedrockリトライ設定
+    BEDROCK_RETRY_MAX_ATTEMPTS: int = int(
+        os.getenv("BEDROCK_RETRY_MAX_ATTEMPTS", "5"))
+    BEDROCK_RETRY_BASE_DELAY: float = float(
+        os.getenv("BEDROCK_RETRY_BASE_DELAY", "1.0"))
+    BEDROCK_RETRY_MAX_DELAY: float = float(
+        os.getenv("BEDROCK_RETRY_MAX_DELAY", "60.0"))
+    BEDROCK_REQUESTS_PER_SECOND: float = float(
+        os.getenv("BEDROCK_REQUESTS_PER_SECOND", "2.0"))
+    BEDROCK_BURST_CAPACITY: float = float(
+        os.getenv("BEDROCK_BURST_CAPACITY", "4"))
+
+    # プロンプトキャッシュ設定（対応モデルのみ有効化すること）
+    ENABLE_PROMPT_CACHING: bool = os.getenv(
+        "ENABLE_PROMPT_CACHING", "false").lower() == "true"
+
+    # ストリーミング抽出設定
+    ENABLE_EXTRACTION_STREAMING: bool = os.getenv(
+        "ENABLE_EXTRACTION_STREAMING", "false").lower() == "true"
+    EXTRACTION_STREAM_MAX_CHARS: int = int(
+        os.getenv("EXTRACTION_STREAM_MAX_CHARS", "200000"))
+
+    # 抽出結果キャッシュ設定
+    # 有効時は同じリクエストの再抽出にもキャッシュした応答を返すため、デフォルトは無効
+    ENABLE_EXTRACTION_CACHE: bool = os.getenv(
+        "ENABLE_EXTRACTION_CACHE", "false").lower() == "true"
+    EXTRACTION_CACHE_TTL_SECONDS: int = int(
+        os.getenv("EXTRACTION_CACHE_TTL_SECONDS", "3600"))
+    EXTRACTION_CACHE_MAX_ENTRIES: int = int(
+        os.getenv("EXTRACTION_CACHE_MAX_ENTRIES", "256"))
+
+    # プロンプトのトークン予算設定
+    # 見積もりがしきい値を超えたらOCRテキストを行単位に圧縮し、
+    # 圧縮後も予算を超える場合は分割抽出に切り替える
+    PROMPT_TOKEN_BUDGET: int = int(
+        os.getenv("PROMPT_TOKEN_BUDGET", "120000"))
+    OCR_COMPACTION_THRESHOLD_TOKENS: int = int(
+        os.getenv("OCR_COMPACTION_THRESHOLD_TOKENS", "20000"))
+    # OCRテキストの送信単位（word: 単語ごと / line: 行ごとに行IDを付与）
+    # lineの場合、モデルが返した行IDは単語IDに展開して保存する
+    OCR_PROMPT_GRANULARITY: str = os.getenv("OCR_PROMPT_GRANULARITY", "word")
+
+    # スキーマ分割抽出設定
+    # フィールドの多いアプリはスキーマを分割し、シャードごとに並列でBedrockを呼び出す
+    ENABLE_SCHEMA_SHARDING: bool = os.getenv(
+        "ENABLE_SCHEMA_SHARDING", "false").lower() == "true"
+    SCHEMA_SHARD_MAX_WEIGHT: int = int(
+        os.getenv("SCHEMA_SHARD_MAX_WEIGHT", "20"))
+    SCHEMA_SHARD_MAX_COUNT: int = int(
+        os.getenv("SCHEMA_SHARD_MAX_COUNT", "4"))
+    EXTRACTION_MAX_WORKERS: int = int(
+        os.getenv("EXTRACTION_MAX_WORKERS", "4"))
+
+    # ページ窓分割抽出設定（複数ページ文書をページ窓ごとに並列抽出して統合）
+    ENABLE_PAGE_WINDOW_EXTRACTION: bool = os.getenv(
+        "ENABLE_PAGE_WINDOW_EXTRACTION", "false").lower() == "true"
+    PAGE_WINDOW_SIZE: int = int(os.getenv("PAGE_WINDOW_SIZE", "2"))
+    PAGE_WINDOW_MIN_PAGES: int = int(
+        os.getenv("PAGE_WINDOW_MIN_PAGES", "4"))
+
+    # 画像準備設定
+    # 1リクエストに添付する画像の合計トークン予算（ページ数に応じて1ページあたりの解像度を下げる）
+    IMAGE_TOKEN_BUDGET: int = int(os.getenv("IMAGE_TOKEN_BUDGET", "16000"))
+    # OCRの平均認識スコアがしきい値以上のページは画像を添付しない
+    ENABLE_IMAGE_SKIP_ON_HIGH_CONFIDENCE: bool = os.getenv(
+        "ENABLE_IMAGE_SKIP_ON_HIGH_CONFIDENCE", "false").lower() == "true"
+    IMAGE_SKIP_CONFIDENCE_THRESHOLD: float = float(
+        os.getenv("IMAGE_SKIP_CONFIDENCE_THRESHOLD", "0.97"))
+
+    # ジョブパイプライン設定（ステージごとの同時実行数）
+    # OCRはSageMakerエンドポイントの処理能力、抽出はBedrockのクォータに合わせて設定する
+    PIPELINE_OCR_CONCURRENCY: int = int(
+        os.getenv("PIPELINE_OCR_CONCURRENCY", "2"))
+    PIPELINE_EXTRACTION_CONCURRENCY: int = int(
+        os.getenv("PIPELINE_EXTRACTION_CONCURRENCY", "4"))
+
+    # バッチ推論設定（一括OCRジョブの抽出をBedrockのバッチ推論でまとめて実行する）
+    ENABLE_BATCH_EXTRACTION: bool = os.getenv(
+        "ENABLE_BATCH_EXTRACTION", "false").lower() == "true"
+    # バッチ推論の実行先（bedrock: Bedrockバッチ推論 / local: ローカルファイルによる代替実装）
+    BATCH_INFERENCE_BACKEND: str = os.getenv("BATCH_INFERENCE_BACKEND", "bedrock")
+    BATCH_INFERENCE_ROLE_ARN: str = os.getenv("BATCH_INFERENCE_ROLE_ARN", "")
+    BATCH_INFERENCE_LOCAL_DIR: str = os.getenv(
+        "BATCH_INFERENCE_LOCAL_DIR", "/tmp/batch-inference")
+    # Bedrockバッチ推論の最小レコード数（これ未満の場合は同期呼び出しで抽出する）
+    BATCH_INFERENCE_MIN_RECORDS: int = int(
+        os.getenv("BATCH_INFERENCE_MIN_RECORDS", "100"))
+
+    # タスクキュー設定
+    # inprocess: 実行環境内のバックグラウンドタスク / sqs: Amazon SQS / sqlite: ローカルのSQLite（開発・テスト用）
+    TASK_QUEUE_BACKEND: str = os.getenv("TASK_QUEUE_BACKEND", "inprocess")
+    TASK_QUEUE_URL: str = os.getenv("TASK_QUEUE_URL", "")
+    TASK_DEAD_LETTER_QUEUE_URL: str = os.getenv("TASK_DEAD_LETTER_QUEUE_URL", "")
+    TASK_QUEUE_SQLITE_PATH: str = os.getenv(
+        "TASK_QUEUE_SQLITE_PATH", "/tmp/task-queue.sqlite3")
+    # 可視性タイムアウトはLambdaのタイムアウト（15分）より長くする
+    TASK_VISIBILITY_TIMEOUT_SECONDS: int = int(
+        os.getenv("TASK_VISIBILITY_TIMEOUT_SECONDS", "960"))
+    TASK_QUEUE_WAIT_SECONDS: int = int(os.getenv("TASK_QUEUE_WAIT_SECONDS", "10"))
+    TASK_MAX_RECEIVE_COUNT: int = int(os.getenv("TASK_MAX_RECEIVE_COUNT", "5"))
+    TASK_RETRY_BASE_DELAY_SECONDS: float = float(
+        os.getenv("TASK_RETRY_BASE_DELAY_SECONDS", "30"))
+    TASK_RETRY_MAX_DELAY_SECONDS: float = float(
+        os.getenv("TASK_RETRY_MAX_DELAY_SECONDS", "900"))
+
+    # AWS呼び出し用のスレッドプール設定
+    # 非同期APIからのS3・DynamoDB呼び出しはこのスレッド数まで並行に実行する
+    AWS_IO_MAX_WORKERS: int = int(os.getenv("AWS_IO_MAX_WORKERS", "32"))
+    # 非同期APIから同時に実行する情報抽出の数（超えた分は待ち合わせる）
+    EXTRACTION_REQUEST_MAX_WORKERS: int = int(
+        os.getenv("EXTRACTION_REQUEST_MAX_WORKERS", "4"))
+
+    # ダウンロード用署名付きURL設定
+    DOWNLOAD_URL_EXPIRES_SECONDS: int = int(
+        os.getenv("DOWNLOAD_URL_EXPIRES_SECONDS", "3600"))
+    # 同じ画像のURLを再利用する時間（キャッシュから返したURLも有効期限までの余裕が残るようにする）
+    DOWNLOAD_URL_CACHE_SECONDS: int = int(
+        os.getenv("DOWNLOAD_URL_CACHE_SECONDS", "300"))
+    DOWNLOAD_URL_CACHE_MAX_ENTRIES: int = int(
+        os.getenv("DOWNLOAD_URL_CACHE_MAX_ENTRIES", "1024"))
+
+    # 画像配信時に1回で転送するチャンクサイズ（バイト）
+    IMAGE_STREAM_CHUNK_SIZE: int = int(
+        os.getenv("IMAGE_STREAM_CHUNK_SIZE", str(64 * 1024)))
+
+    # 一覧・プレビュー用の縮小画像（thumbnail / preview）を変換時に作成する
+    ENABLE_IMAGE_TIERS: bool = os.getenv(
+        "ENABLE_IMAGE_TIERS", "true").lower() == "true"
+
+    # S3フォルダの一括インポート設定
+    # 一覧1ページ（最大1000件）ごとにこの並列数でコピーし、チェックポイントを保存する
+    S3_IMPORT_CONCURRENCY: int = int(os.getenv("S3_IMPORT_CONCURRENCY", "16"))
+    S3_IMPORT_PAGE_SIZE: int = int(os.getenv("S3_IMPORT_PAGE_SIZE", "1000"))
+    # このサイズ（バイト）以上のオブジェクトはマルチパートでコピーする
+    S3_IMPORT_MULTIPART_THRESHOLD: int = int(
+        os.getenv("S3_IMPORT_MULTIPART_THRESHOLD", str(64 * 1024 * 1024)))
+    # 1回のタスクで処理する最大時間（Lambdaのタイムアウト前に続きのタスクを投入する）
+    S3_IMPORT_MAX_SECONDS_PER_TASK: float = float(
+        os.getenv("S3_IMPORT_MAX_SECONDS_PER_TASK", "600"))
+    # 進捗がこの秒数更新されていない一括インポートは停止したものとみなし、再開を受け付ける
+    # （Lambdaのタイムアウト（15分）を過ぎていれば実行中のタスクは残っていない）
+    S3_IMPORT_RESUME_AFTER_SECONDS: float = float(
+        os.getenv("S3_IMPORT_RESUME_AFTER_SECONDS", "900"))
+
+    # アップロード取り込み設定
+    # 同じアプリに同じ内容（SHA-256）の処理済みドキュメントがあれば、変換・OCR・情報抽出の結果を引き継ぐ
+    # 有効時はアプリの項目を変更した後の再アップロードにも以前の抽出結果を引き継ぐため、デフォルトは無効
+    ENABLE_CONTENT_DEDUP: bool = os.getenv(
+        "ENABLE_CONTENT_DEDUP", "false").lower() == "true"
+    # S3のObjectCreatedイベント（またはアップロード完了通知）で取り込んだ後、OCRを自動で開始する
+    AUTO_START_OCR_ON_UPLOAD: bool = os.getenv(
+        "AUTO_START_OCR_ON_UPLOAD", "false").lower() == "true"
 
     # SageMaker設定
     SAGEMAKER_ENDPOINT_NAME: str = os.getenv(
@@ -1,4 +1,4 @@
-from clients import dynamodb_resource
+from clients import get_dynamodb_resource
 import logging
 from boto3.dynamodb.conditions import Key, Attr
 from botocore.exceptions import ClientError
@@ -25,7 +25,7 @@ def get_images_table():
         raise HTTPException(
             status_code=500, detail="Database configuration error")
 
-    return dynamodb_resource.Table(table_name)
+    return get_dynamodb_resource().Table(table_name)
 
 
 def get_jobs_table():
@@ -41,11 +41,72 @@ def get_jobs_table():
         raise HTTPException(
             status_code=500, detail="Database configuration error")
 
-    return dynamodb_resource.Table(table_name)
+    return get_dynamodb_resource().Table(table_name)
+
+
+def get_sync_manifest_table():
+    """
+    S3同期マニフェストテーブルのリソースを取得する
+
+    Returns:
+        boto3.resources.factory.dynamodb_resource.Table: DynamoDB テーブルリソース
+    """
+    table_name = settings.SYNC_MANIFEST_TABLE_NAME
+    if not table_name:
+        logger.error("SYNC_MANIFEST_TABLE_NAME 環境変数が設定されていません")
+        raise HTTPException(
+            status_code=500, detail="Database configuration error")
+
+    return get_dynamodb_resource().Table(table_name)
+
+
+def build_image_record_item(image_id, filename, s3_key, app_name="default", status="pending", converted_s3_key=None,
+                            page_processing_mode="combined", total_pages=None, page_number=None,
+                            parent_document_id=None, content_type=None, force_reprocess=False):
+    """
+    画像レコードのアイテムを作成する（create_image_recordと同じ引数）
+
+    Returns:
+        dict: DynamoDBに保存するアイテム
+    """
+    if not image_id:
+        image_id = str(uuid.uuid4())
+
+    item = {
+        "id": image_id,
+        "filename": filename,
+        "s3_key": s3_key,
+        "upload_time": datetime.now().isoformat(),
+        "status": status,
+        "app_name": app_name,
+        "page_processing_mode": page_processing_mode
+    }
+
+    # ページ関連の情報を追加
+    if total_pages is not None:
+        item["total_pages"] = total_pages
+    if page_number is not None:
+        item["page_number"] = page_number
+    if parent_document_id is not None:
+        item["parent_document_id"] = parent_document_id
+    # ダウンロードURL生成時にhead_objectで取得しなくて済むよう保存しておく
+    if content_type:
+        item["content_type"] = content_type
+    # 同じ内容の処理済みドキュメントがあっても再処理する
+    if force_reprocess:
+        item["force_reprocess"] = True
+
+    # 変換後のS3キーがある場合は追加
+    if converted_s3_key:
+        item["converted_s3_key"] = converted_s3_key
+        item["s3_key"] = converted_s3_key  # 変換後のキーを優先
+
+    return item
 
 
 def create_image_record(image_id, filename, s3_key, app_name="default", status="pending", converted_s3_key=None,
-                        page_processing_mode="combined", total_pages=None, page_number=None, parent_document_id=None):
+                        page_processing_mode="combined", total_pages=None, page_number=None, parent_document_id=None,
+                        content_type=None, force_reprocess=False):
     """
     画像レコードを作成する
 
@@ -60,44 +121,85 @@ def create_image_record(image_id, filename, s3_key, app_name="default", status="
         total_pages (int, optional): 総ページ数
         page_number (int, optional): ページ番号（個別処理の場合）
         parent_document_id (str, optional): 親ドキュメントID（個別処理の場合）
+        content_type (str, optional): s3_keyのファイルのContent-Type
+        force_reprocess (bool): 同じ内容の処理済みドキュメントがあっても再処理する
 
     Returns:
         str: 作成された画像のID
     """
-    if not image_id:
-        image_id = str(uuid.uuid4())
+    table = get_images_table()
+
+    try:
+        item = build_image_record_item(
+            image_id, filename, s3_key, app_name, status, converted_s3_key,
+            page_processing_mode, total_pages, page_number, parent_document_id, content_type,
+            force_reprocess)
+
+        table.put_item(Item=item)
+        return item["id"]
+    except Exception as e:
+        logger.error(f"画像レコード作成エラー: {str(e)}")
+        raise HTTPException(
+            status_code=500, detail=f"Database error: {str(e)}")
+
+
+def batch_create_image_records(items: list) -> None:
+    """
+    画像レコードをまとめて作成する
+
+    batch_writerで25件ずつ書き込み、未処理のアイテムは自動で再送される。
+    同じIDのアイテムは上書きされるため、再実行しても重複しない
+
+    Args:
+        items (list): build_image_record_itemで作成したアイテムのリスト
+    """
+    if not items:
+        return
 
     table = get_images_table()
-    current_time = datetime.now().isoformat()
 
     try:
-        item = {
-            "id": image_id,
-            "filename": filename,
-            "s3_key": s3_key,
-            "upload_time": current_time,
-            "status": status,
-            "app_name": app_name,
-            "page_processing_mode": page_processing_mode
-        }
+        with table.batch_writer(overwrite_by_pkeys=["id"]) as batch:
+            for item in items:
+                batch.put_item(Item=item)
+    except Exception as e:
+        logger.error(f"画像レコード一括作成エラー: {str(e)}")
+        raise HTTPException(
+            status_code=500, detail=f"Database error: {str(e)}")
 
-        # ページ関連の情報を追加
-        if total_pages is not None:
-            item["total_pages"] = total_pages
-        if page_number is not None:
-            item["page_number"] = page_number
-        if parent_document_id is not None:
-            item["parent_document_id"] = parent_document_id
 
-        # 変換後のS3キーがある場合は追加
-        if converted_s3_key:
-            item["converted_s3_key"] = converted_s3_key
-            item["s3_key"] = converted_s3_key  # 変換後のキーを優先
+def get_existing_image_ids(image_ids: list) -> set:
+    """
+    指定した画像IDのうち、レコードが存在するものを取得する
+
+    BatchGetItemで100件ずつ取得し、未処理のキーは再度取得する
 
-        table.put_item(Item=item)
-        return image_id
+    Args:
+        image_ids (list): 画像IDのリスト
+
+    Returns:
+        set: レコードが存在する画像IDの集合
+    """
+    if not image_ids:
+        return set()
+
+    table = get_images_table()
+    existing_ids = set()
+
+    try:
+        unique_ids = list(dict.fromkeys(image_ids))
+        for start in range(0, len(unique_ids), 100):
+            request_items = {table.name: {
+                "Keys": [{"id": image_id} for image_id in unique_ids[start:start + 100]],
+                "ProjectionExpression": "id"
+            }}
+            while request_items:
+                response = get_dynamodb_resource().batch_get_item(RequestItems=request_items)
+                existing_ids.update(item["id"] for item in response.get("Responses", {}).get(table.name, []))
+                request_items = response.get("UnprocessedKeys") or None
+        return existing_ids
     except Exception as e:
-        logger.error(f"画像レコード作成エラー: {str(e)}")
+        logger.error(f"画像レコード存在確認エラー: {str(e)}")
         raise HTTPException(
             status_code=500, detail=f"Database error: {str(e)}")
 
@@ -259,6 +361,243 @@ def update_extracted_info(image_id, extracted_info, extraction_mapping, status="
             status_code=500, detail=f"Database error: {str(e)}")
 
 
+def update_extraction_status(image_id: str, status: str) -> None:
+    """
+    抽出ステータスのみを更新する
+
+    Args:
+        image_id (str): 画像ID
+        status (str): 抽出ステータス
+    """
+    table = get_images_table()
+
+    try:
+        table.update_item(
+            Key={"id": image_id},
+            UpdateExpression="SET extraction_status = :status",
+            ExpressionAttributeValues={":status": status}
+        )
+    except Exception as e:
+        logger.error(f"抽出ステータス更新エラー: {str(e)}")
+        raise HTTPException(
+            status_code=500, detail=f"Database error: {str(e)}")
+
+
+def claim_ingestion(image_id: str, ingest_key: str, content_type: str = None) -> bool:
+    """
+    アップロードされたオブジェクトの取り込みを1回だけ行うための冪等性キーを記録する
+
+    S3イベントとクライアントからの完了通知のどちらが先に届いても、
+    同じオブジェクト（キーとETag）の取り込みは最初の1回だけ成功する
+
+    Args:
+        image_id (str): 画像ID
+        ingest_key (str): 冪等性キー（S3キーとETag）
+        content_type (str, optional): 判定したファイルのContent-Type（あわせて保存する）
+
+    Returns:
+        bool: 取り込みを開始してよい場合True（取り込み済み・レコードなしの場合False）
+    """
+    table = get_images_table()
+
+    update_expression = "SET ingest_key = :ingest_key, ingested_at = :ingested_at"
+    expression_values = {
+        ":ingest_key": ingest_key,
+        ":ingested_at": datetime.now().isoformat()
+    }
+    if content_type:
+        update_expression += ", content_type = :content_type"
+        expression_values[":content_type"] = content_type
+
+    try:
+        table.update_item(
+            Key={"id": image_id},
+            UpdateExpression=update_expression,
+            ConditionExpression="attribute_exists(id) AND "
+                                "(attribute_not_exists(ingest_key) OR ingest_key <> :ingest_key)",
+            ExpressionAttributeValues=expression_values
+        )
+        return True
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") == "ConditionalCheckFailedException":
+            return False
+        logger.error(f"取り込みキーの記録エラー: {str(e)}")
+        raise
+
+
+def release_ingestion(image_id: str, ingest_key: str) -> None:
+    """
+    取り込みに失敗したオブジェクトの冪等性キーを削除し、再度取り込めるようにする
+
+    別の取り込み（異なるキー）で上書きされている場合は削除しない
+
+    Args:
+        image_id (str): 画像ID
+        ingest_key (str): claim_ingestionで記録した冪等性キー
+    """
+    table = get_images_table()
+
+    try:
+        table.update_item(
+            Key={"id": image_id},
+            UpdateExpression="REMOVE ingest_key, ingested_at",
+            ConditionExpression="ingest_key = :ingest_key",
+            ExpressionAttributeValues={":ingest_key": ingest_key}
+        )
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") == "ConditionalCheckFailedException":
+            return
+        logger.error(f"取り込みキーの削除エラー: {str(e)}")
+        raise
+
+
+# 重複ドキュメントに引き継ぐ変換・OCR・情報抽出の結果
+# （アップロードされた元ファイル（s3_key）は重複ドキュメント自身のものを残す）
+DUPLICATE_ARTIFACT_ATTRIBUTES = (
+    "converted_s3_key", "content_type", "image_tiers", "original_size", "resized_size",
+    "new_size", "total_pages", "ocr_result", "extracted_info", "extraction_mapping", "extraction_status"
+)
+
+
+def update_content_hash(image_id: str, content_hash: str) -> None:
+    """
+    ファイル内容のハッシュを更新する（ContentHashIndexで同じ内容のドキュメントを検索できるようになる）
+
+    Args:
+        image_id (str): 画像ID
+        content_hash (str): ファイル内容のSHA-256
+    """
+    table = get_images_table()
+
+    try:
+        table.update_item(
+            Key={"id": image_id},
+            UpdateExpression="SET content_hash = :content_hash",
+            ExpressionAttributeValues={":content_hash": content_hash}
+        )
+    except Exception as e:
+        logger.error(f"コンテンツハッシュ更新エラー: {str(e)}")
+        raise HTTPException(
+            status_code=500, detail=f"Database error: {str(e)}")
+
+
+def find_images_by_content_hash(app_name: str, content_hash: str):
+    """
+    同じアプリで同じ内容のドキュメントを取得する
+
+    Args:
+        app_name (str): アプリケーション名
+        content_hash (str): ファイル内容のSHA-256
+
+    Returns:
+        list: 画像レコードのリスト
+    """
+    table = get_images_table()
+
+    try:
+        response = table.query(
+            IndexName="ContentHashIndex",
+            KeyConditionExpression=Key('content_hash').eq(content_hash) & Key('app_name').eq(app_name)
+        )
+        return response.get('Items', [])
+    except Exception as e:
+        logger.error(f"コンテンツハッシュ検索エラー: {str(e)}")
+        return []
+
+
+def link_duplicate_image(image_id: str, source: dict, status: str = None) -> None:
+    """
+    処理済みドキュメントの変換・OCR・情報抽出の結果を重複ドキュメントに引き継ぐ
+
+    S3上の変換画像・縮小画像は複製せず、元のドキュメントと同じキーを参照する。
+    縮小画像は変換画像のキーから作成しているため、変換画像がない場合は引き継がない
+
+    Args:
+        image_id (str): 重複ドキュメントの画像ID
+        source (dict): 元のドキュメントのレコード
+        status (str, optional): 設定するステータス（未指定時は元のドキュメントと同じ）
+    """
+    table = get_images_table()
+
+    update_expression = "SET #status = :status, duplicate_of = :duplicate_of"
+    expression_attribute_names = {"#status": "status"}
+    expression_attribute_values = {
+        ":status": status or source.get("status"),
+        ":duplicate_of": source["id"]
+    }
+    for attribute in DUPLICATE_ARTIFACT_ATTRIBUTES:
+        if attribute == "image_tiers" and not source.get("converted_s3_key"):
+            continue
+        if source.get(attribute) is not None:
+            update_expression += f", {attribute} = :{attribute}"
+            expression_attribute_values[f":{attribute}"] = source[attribute]
+
+    try:
+        table.update_item(
+            Key={"id": image_id},
+            UpdateExpression=update_expression,
+            ExpressionAttributeNames=expression_attribute_names,
+            ExpressionAttributeValues=expression_attribute_values
+        )
+        logger.info(f"重複ドキュメントに処理結果を引き継ぎました: {image_id} <- {source['id']}")
+    except Exception as e:
+        logger.error(f"重複ドキュメントの引き継ぎエラー: {str(e)}")
+        raise HTTPException(
+            status_code=500, detail=f"Database error: {str(e)}")
+
+
+def update_image_tiers(image_id: str, image_tiers: list) -> None:
+    """
+    作成済みの縮小画像の階層名を更新する
+
+    Args:
+        image_id (str): 画像ID
+        image_tiers (list): 作成済みの縮小画像の階層名
+    """
+    table = get_images_table()
+
+    try:
+        table.update_item(
+            Key={"id": image_id},
+            UpdateExpression="SET image_tiers = :image_tiers",
+            ExpressionAttributeValues={":image_tiers": image_tiers}
+        )
+    except Exception as e:
+        logger.error(f"縮小画像情報の更新エラー: {str(e)}")
+
+
+def update_extraction_progress(image_id, partial_info, completed_fields, total_fields):
+    """
+    ストリーミング抽出中の途中結果と進捗を更新する
+
+    Args:
+        image_id (str): 画像ID
+        partial_info (dict): 完成済みフィールドのみを含む抽出情報
+        completed_fields (list): 完成済みのフィールド名リスト
+        total_fields (int): 抽出対象のトップレベルフィールド数
+    """
+    table = get_images_table()
+
+    try:
+        table.update_item(
+            Key={"id": image_id},
+            UpdateExpression="SET extracted_info = :extracted_info, extraction_progress = :progress, extraction_status = :status",
+            ExpressionAttributeValues={
+                ":extracted_info": partial_info,
+                ":progress": {
+                    "completed_fields": completed_fields,
+                    "completed_count": len(completed_fields),
+                    "total_count": total_fields,
+                    "updated_at": datetime.now().isoformat()
+                },
+                ":status": "processing"
+            }
+        )
+    except Exception as e:
+        # 進捗の保存失敗で抽出自体は止めない
+        logger.warning(f"抽出進捗の更新エラー: {str(e)}")
+
+
 def get_image(image_id):
     """
     画像情報を取得する
@@ -345,6 +684,35 @@ def update_job_status(job_id, status):
             status_code=500, detail=f"Database error: {str(e)}")
 
 
+def update_job_progress(job_id, status, progress):
+    """
+    ジョブの進捗（再開用のチェックポイントを含む）を更新する
+
+    Args:
+        job_id (str): ジョブID
+        status (str): ジョブステータス
+        progress (dict): 進捗情報（件数・再開位置など）
+    """
+    table = get_jobs_table()
+    current_time = datetime.now().isoformat()
+
+    try:
+        table.update_item(
+            Key={"id": job_id},
+            UpdateExpression="SET #status = :status, progress = :progress, updated_at = :updated_at",
+            ExpressionAttributeNames={"#status": "status"},
+            ExpressionAttributeValues={
+                ":status": status,
+                ":progress": progress,
+                ":updated_at": current_time
+            }
+        )
+    except Exception as e:
+        logger.error(f"ジョブ進捗更新エラー: {str(e)}")
+        raise HTTPException(
+            status_code=500, detail=f"Database error: {str(e)}")
+
+
 def get_job(job_id):
     """
     ジョブ情報を取得する
@@ -406,7 +774,7 @@ def get_images_by_job_id(job_id):
 
 
 def update_converted_image(image_id, converted_s3_key, status=None, original_size=None, resized_size=None,
-                           page_processing_mode=None, total_pages=None):
+                           page_processing_mode=None, total_pages=None, content_type=None, image_tiers=None):
     """
     変換後の画像情報を更新する
 
@@ -418,6 +786,8 @@ def update_converted_image(image_id, converted_s3_key, status=None, original_siz
         resized_size (tuple, optional): リサイズ後の画像サイズ (width, height)
         page_processing_mode (str, optional): ページ処理モード
         total_pages (int, optional): 総ページ数
+        content_type (str, optional): 変換後画像のContent-Type
+        image_tiers (list, optional): 作成済みの縮小画像の階層名
 
     Returns:
         bool: 更新が成功したかどうか
@@ -456,6 +826,14 @@ def update_converted_image(image_id, converted_s3_key, status=None, original_siz
             update_expression += ", total_pages = :total_pages"
             expression_values[":total_pages"] = total_pages
 
+        if content_type:
+            update_expression += ", content_type = :content_type"
+            expression_values[":content_type"] = content_type
+
+        if image_tiers is not None:
+            update_expression += ", image_tiers = :image_tiers"
+            expression_values[":image_tiers"] = image_tiers
+
         expression_names = {}
         if status:
             expression_names["#status"] = "status"
@@ -543,7 +921,8 @@ def delete_jobs_by_app_name(app_name: str):
 def create_individual_page_record(page_id: str, parent_image_id: str, filename: str,
                                   converted_s3_key: str,
                                   page_number: int, total_pages: int, app_name: str,
-                                  original_size: tuple, new_size: tuple):
+                                  original_size: tuple, new_size: tuple, content_type: str = None,
+                                  image_tiers: list = None):
     """
     個別ページのレコードを作成する
 
@@ -558,6 +937,8 @@ def create_individual_page_record(page_id: str, parent_image_id: str, filename:
         app_name (str): アプリケーション名
         original_size (tuple): 元のサイズ
         new_size (tuple): 新しいサイズ
+        content_type (str, optional): 変換後画像のContent-Type
+        image_tiers (list, optional): 作成済みの縮小画像の階層名
     """
     table = get_images_table()
     current_time = datetime.now().isoformat()
@@ -578,6 +959,10 @@ def create_individual_page_record(page_id: str, parent_image_id: str, filename:
             "original_size": list(original_size) if original_size else None,
             "new_size": list(new_size) if new_size else None
         }
+        if content_type:
+            item["content_type"] = content_type
+        if image_tiers is not None:
+            item["image_tiers"] = image_tiers
 
         table.put_item(Item=item)
         logger.info(
@@ -694,3 +1079,75 @@ def check_and_update_parent_status(parent_id: str):
 
     except Exception as e:
         logger.error(f"親ステータス更新エラー: {str(e)}")
+
+
+def _sync_manifest_source(bucket_name: str, key: str = "") -> str:
+    """同期マニフェストのソートキー（同期元のS3 URI）"""
+    return f"s3://{bucket_name}/{key}"
+
+
+def put_sync_manifest_entries(app_name: str, bucket_name: str, files: list) -> None:
+    """
+    取り込んだオブジェクトを同期マニフェストに記録する
+
+    オブジェクトごとに1アイテムを書き込むため、複数のプロセスから同時に記録しても失われない
+
+    Args:
+        app_name (str): アプリケーション名
+        bucket_name (str): 同期元のバケット名
+        files (list): 取り込んだファイル情報（key・etag・last_modified）
+    """
+    if not files:
+        return
+
+    table = get_sync_manifest_table()
+    imported_at = datetime.now().isoformat()
+
+    try:
+        with table.batch_writer(overwrite_by_pkeys=["app_name", "source"]) as batch:
+            for file in files:
+                batch.put_item(Item={
+                    "app_name": app_name,
+                    "source": _sync_manifest_source(bucket_name, file["key"]),
+                    "key": file["key"],
+                    "etag": file.get("etag", ""),
+                    "last_modified": file.get("last_modified", ""),
+                    "imported_at": imported_at
+                })
+    except Exception as e:
+        logger.error(f"同期マニフェスト記録エラー: {str(e)}")
+        raise HTTPException(
+            status_code=500, detail=f"Database error: {str(e)}")
+
+
+def get_sync_manifest_entries(app_name: str, bucket_name: str) -> list:
+    """
+    同期元のバケットから取り込み済みのオブジェクトを取得する
+
+    Args:
+        app_name (str): アプリケーション名
+        bucket_name (str): 同期元のバケット名
+
+    Returns:
+        list: 同期マニフェストのアイテムのリスト（key・etag・last_modified）
+    """
+    table = get_sync_manifest_table()
+
+    try:
+        params = {
+            "KeyConditionExpression": Key("app_name").eq(app_name)
+            & Key("source").begins_with(_sync_manifest_source(bucket_name)),
+            "ProjectionExpression": "#key, etag, last_modified",
+            "ExpressionAttributeNames": {"#key": "key"}
+        }
+        items = []
+        while True:
+            response = table.query(**params)
+            items.extend(response.get("Items", []))
+            if "LastEvaluatedKey" not in response:
+                return items
+            params["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+    except Exception as e:
+        logger.error(f"同期マニフェスト取得エラー: {str(e)}")
+        raise HTTPException(
+            status_code=500, detail=f"Database error: {str(e)}")
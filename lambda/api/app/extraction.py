@@ -1,415 +1,690 @@
 from utils.prompts import (
-    create_single_with_ocr_prompt, create_single_without_ocr_prompt,
-    create_multi_with_ocr_prompt, create_multi_without_ocr_prompt
+    create_single_with_ocr_document_prompt, create_single_without_ocr_prompt,
+    create_multi_with_ocr_document_prompt, create_multi_without_ocr_prompt,
+    build_user_content, create_chunk_note
 )
+from utils.prompt_artifacts import get_compiled_prompt
+from utils.token_budget import prepare_ocr_pages, plan_ocr_prompt, estimate_text_tokens, assign_line_ids, expand_line_indices
+from utils.result_merge import merge_extraction_results, merge_shard_results
+from utils.image_prep import prepare_image_block, should_skip_image
 from utils.helpers import safe_get_from_dynamo_data, float_to_decimal
 from config import settings
-from utils.bedrock import call_bedrock, call_bedrock_with_retry, parse_converse_response, extract_json_from_response, parse_extraction_response
-from clients import s3_client
-from utils.template import generate_unified_template
+from utils.bedrock import call_bedrock_with_retry, call_bedrock_with_cache, call_bedrock_stream, parse_converse_response, extract_json_from_response, parse_extraction_response
+from clients import get_s3_client
+from utils.json_stream import IncrementalJsonScanner
+import json
 import logging
 import base64
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 
-from app_schema import get_app_schema, get_extraction_fields_for_app, get_field_names_for_app, get_custom_prompt_for_app, DEFAULT_APP
-from database import get_image, update_extracted_info, update_image_status
+from app_schema import DEFAULT_APP
+from database import get_image, update_extracted_info, update_image_status, update_extraction_progress
 
 logger = logging.getLogger(__name__)
 
 
-def extract_information_from_single_image_with_ocr(image_id: str):
-    """
-    単一画像+OCR結果での情報抽出（統一版：関数内でOCR結果取得）
+def create_streaming_invoker(image_id: str, app_extraction_fields: dict):
     """
-    try:
-        logger.info(f"単一画像情報抽出を開始: {image_id}")
+    ストリーミング抽出用のBedrock呼び出し関数を作成する
 
-        # 画像情報を取得
-        image_data = get_image(str(image_id) if isinstance(
-            image_id, uuid.UUID) else image_id)
+    応答JSONを逐次解析し、extracted_data直下のフィールドが完成するたびに
+    途中結果と進捗をデータベースに保存する
 
-        if not image_data:
-            logger.error(f"画像 {image_id} が見つかりません")
+    Args:
+        image_id (str): 画像ID
+        app_extraction_fields (dict): アプリの抽出フィールド定義
+
+    Returns:
+        callable: call_bedrock と同じ引数で呼び出せる関数
+    """
+    top_level_names = [
+        field.get("name") for field in app_extraction_fields.get("fields", [])
+        if isinstance(field, dict)
+    ]
+    partial_info = {}
+
+    def on_value(path, raw_value):
+        if len(path) != 2 or path[0] != "extracted_data" or path[1] not in top_level_names:
             return
+        partial_info[path[1]] = json.loads(raw_value)
+        logger.info(
+            f"ストリーミング抽出進捗: {len(partial_info)}/{len(top_level_names)} フィールド完了 ({path[1]})")
+        update_extraction_progress(
+            image_id, float_to_decimal(partial_info), list(partial_info.keys()), len(top_level_names))
+
+    def stream(messages, system_prompts=None):
+        scanner = IncrementalJsonScanner(on_value)
+        return call_bedrock_stream(
+            messages, system_prompts,
+            on_text=scanner.feed,
+            max_output_chars=settings.EXTRACTION_STREAM_MAX_CHARS
+        )
 
-        # OCR結果を関数内で取得（統一）
-        ocr_result = image_data.get("ocr_result", {})
-        ocr_text = ocr_result.get("text", "")
-        if not ocr_text:
-            # フォールバック: wordsから結合
-            ocr_text = "\n".join(
-                [word.get("content", "") for word in ocr_result.get("words", [])])
+    def invoke(messages, system_prompts=None):
+        return call_bedrock_with_retry(messages, system_prompts, invoke=stream)
 
-        # converted_s3_keyを使用（リスト形式に対応）
-        converted_s3_keys = image_data.get("converted_s3_key", [])
-        if not converted_s3_keys:
-            # フォールバックとしてs3_keyを確認
-            s3_keys = image_data.get("s3_key", [])
-            if isinstance(s3_keys, list) and s3_keys:
-                converted_s3_keys = s3_keys
-            elif isinstance(s3_keys, str):
-                converted_s3_keys = [s3_keys]
-            else:
-                logger.error(f"S3キーが見つかりません: {image_id}")
-                update_image_status(
-                    str(image_id) if isinstance(
-                        image_id, uuid.UUID) else image_id,
-                    "failed"
-                )
-                return
+    return invoke
 
-        # リストから最初のキーを取得
-        if isinstance(converted_s3_keys, list):
-            s3_key = converted_s3_keys[0] if converted_s3_keys else None
-        else:
-            s3_key = converted_s3_keys
-
-        if not s3_key:
-            logger.error(f"有効なS3キーが見つかりません: {image_id}")
-            update_image_status(
-                str(image_id) if isinstance(image_id, uuid.UUID) else image_id,
-                "failed"
-            )
-            return
 
-        # アプリ名を取得（なければデフォルト）
-        app_name = image_data.get("app_name", DEFAULT_APP)
-
-        logger.info(f"使用するS3キー: {s3_key}")
+def estimate_fixed_prompt_tokens(static_prompt: str, system_prompts: list, image_tokens: int = 0) -> int:
+    """OCRテキスト以外（指示・システムプロンプト・画像）の入力トークン数を見積もる"""
+    system_text = "".join(prompt.get("text", "") for prompt in system_prompts)
+    return (estimate_text_tokens(static_prompt) + estimate_text_tokens(system_text)
+            + image_tokens)
 
-        # アプリケーションスキーマを取得
-        app_schema = get_app_schema(app_name)
-        if not app_schema:
-            logger.error(f"App schema not found: {app_name}")
-            return
 
-        # このアプリ用の抽出フィールド定義を取得
-        app_extraction_fields = get_extraction_fields_for_app(app_name)
-        field_names = get_field_names_for_app(app_name)
+def collect_partial_results(futures: list, label: str) -> list:
+    """
+    並列実行した抽出の結果を順に取得する
 
-        # カスタムプロンプトを取得
-        custom_prompt = get_custom_prompt_for_app(app_name)
+    Bedrock呼び出しの例外（リトライ上限に達したスロットリングなど）は解析失敗と同じ
+    エラー結果として扱い、成功した結果を統合できるようにする。すべて失敗した場合は最初の例外を送出する
 
-        logger.info(
-            f"処理アプリ: {app_name}, フィールド数: {len(app_extraction_fields.get('fields', []))}")
+    Args:
+        futures (list): 抽出結果 (extracted_info, mapping) を返すFutureのリスト
+        label (str): ログ出力用の処理名
 
-        # 画像データを取得
+    Returns:
+        list: (extracted_info, mapping) のリスト（futuresと同じ順序）
+    """
+    results = []
+    errors = []
+    for index, future in enumerate(futures):
         try:
-            s3_response = s3_client.get_object(
-                Bucket=settings.BUCKET_NAME,
-                Key=s3_key
-            )
-            image_data = s3_response['Body'].read()
-            image_base64 = base64.b64encode(image_data).decode('utf-8')
-
-            # コンテンツタイプからフォーマットを取得
-            content_type = s3_response.get('ContentType', 'image/jpeg')
-            logger.info(
-                f"画像 {image_id} を取得しました: {content_type}, サイズ: {len(image_data)} バイト")
+            results.append(future.result())
         except Exception as e:
-            logger.error(f"画像データ取得エラー: {str(e)}")
-            update_image_status(
-                str(image_id) if isinstance(image_id, uuid.UUID) else image_id,
-                "failed"
-            )
-            return
+            logger.error(f"{label}の呼び出しに失敗しました: {index + 1}/{len(futures)}, {str(e)}")
+            errors.append(e)
+            results.append(({"error": f"Bedrock call failed: {str(e)}"}, {}))
 
-        # 抽出対象の項目リストを生成
-        extraction_fields = []
-
-        def generate_extraction_fields(fields, prefix=""):
-            result = []
-            for i, field in enumerate(fields):
-                display_name = field['display_name']
-                field_type = field.get('type', 'string')
-
-                if prefix:
-                    field_desc = f"{prefix} > {display_name} ({field_type}型)"
-                else:
-                    field_desc = f"{display_name} ({field_type}型)"
-
-                result.append(field_desc)
-
-                # map型の場合は子フィールドも追加
-                if field_type == "map" and "fields" in field:
-                    child_fields = generate_extraction_fields(
-                        field["fields"], display_name)
-                    result.extend(child_fields)
-
-                # list型の場合はitem内のフィールドも追加
-                elif field_type == "list" and "items" in field:
-                    items = field["items"]
-                    if items.get("type") == "map" and "fields" in items:
-                        child_prefix = f"{display_name} (各項目)"
-                        child_fields = generate_extraction_fields(
-                            items["fields"], child_prefix)
-                        result.extend(child_fields)
-
-            return result
-
-        extraction_fields = generate_extraction_fields(
-            app_extraction_fields["fields"])
-        extraction_targets = "\n".join(
-            [f"{i+1}. {field}" for i, field in enumerate(extraction_fields)])
-
-        # JSONテンプレートとindicesテンプレートを生成（templateモジュールを使用）
-        unified_template = generate_unified_template(app_extraction_fields)
-
-        # 例示用のOCR結果とその抽出例
-        example_ocr = {
-            "words": [
-                {"id": 0, "content": "注文日：2023年5月1日", "points": [
-                    [50, 120], [250, 120], [250, 150], [50, 150]]},
-                {"id": 1, "content": "委託業務内容：配送業務", "points": [
-                    [50, 180], [300, 180], [300, 210], [50, 210]]},
-                {"id": 2, "content": "運行日：2023年5月15日", "points": [
-                    [50, 240], [250, 240], [250, 270], [50, 270]]},
-                {"id": 3, "content": "A001", "points": [
-                    [50, 400], [100, 400], [100, 430], [50, 430]]},
-                {"id": 4, "content": "東京", "points": [
-                    [150, 400], [200, 400], [200, 430], [150, 430]]},
-                {"id": 5, "content": "大阪", "points": [
-                    [250, 400], [300, 400], [300, 430], [250, 430]]}
-            ]
-        }
-
-        example_output = {
-            "order_date": "2023年5月1日",
-            "operation_info": {
-                "contract_work": "配送業務",
-                "operation_date": "2023年5月15日"
-            },
-            "shipment_details": [
-                {
-                    "reception_number": "A001",
-                    "destination": "東京",
-                    "origin": "大阪",
-                    "vehicle_number": "",
-                    "fare": ""
-                }
-            ],
-            "indices": {
-                "order_date": [0],
-                "operation_info": {
-                    "contract_work": [1],
-                    "operation_date": [2]
-                },
-                "shipment_details": [
-                    {
-                        "reception_number": [3],
-                        "destination": [4],
-                        "origin": [5],
-                        "vehicle_number": [],
-                        "fare": []
-                    }
-                ]
-            }
-        }
+    if errors and len(errors) == len(futures):
+        raise errors[0]
+    return results
 
-        # プロンプト作成
-        prompt = create_single_with_ocr_prompt(
-            extraction_targets, unified_template, example_ocr, example_output,
-            ocr_result, custom_prompt
-        )
 
-        # メッセージ構築
-        # システムプロンプト
-        system_prompts = [{
-            "text": "あなたはOCR結果から情報を抽出するアシスタントです。指定されたフィールドに対応する情報を抽出し、JSONフォーマットで返してください。"
+def run_chunked_extraction(static_prompt: str, system_prompts: list, chunk_requests: list,
+                           app_extraction_fields: dict, field_names: list, max_workers: int = None) -> tuple:
+    """
+    分割したプロンプトごとに並列で抽出を実行し、結果をスキーマに従って統合する
+
+    単語IDは全ページ通しのため、分割ごとの結果をそのまま統合できる。
+    不変部分は全分割で共通のため、プロンプトキャッシュ有効時は入力が再利用される
+
+    Args:
+        static_prompt (str): アプリごとに不変なプロンプト
+        system_prompts (list): システムプロンプト
+        chunk_requests (list): (文書プロンプト, 画像ブロックのリスト) のタプルのリスト
+        app_extraction_fields (dict): アプリの抽出フィールド定義
+        field_names (list): フィールド名リスト
+        max_workers (int, optional): 同時に実行する分割数の上限。未指定時はsettings.EXTRACTION_MAX_WORKERS
+
+    Returns:
+        tuple: (extracted_info, mapping)
+    """
+    max_workers = max_workers or settings.EXTRACTION_MAX_WORKERS
+
+    def extract_chunk(index, chunk_request):
+        document_prompt, image_blocks = chunk_request
+        logger.info(f"分割抽出を実行中: {index + 1}/{len(chunk_requests)}")
+        messages = [{
+            "role": "user",
+            "content": build_user_content(
+                static_prompt, document_prompt, image_blocks,
+                enable_cache=settings.ENABLE_PROMPT_CACHING)
         }]
+        response = call_bedrock_with_cache(messages, system_prompts)
+        return parse_extraction_response(
+            parse_converse_response(response), field_names,
+            app_extraction_fields.get("fields", []))
+
+    # map: 分割ごとの抽出を並列に実行（結果は分割順に並ぶ）
+    if len(chunk_requests) == 1:
+        results = [extract_chunk(0, chunk_requests[0])]
+    else:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(chunk_requests))) as executor:
+            futures = [executor.submit(extract_chunk, index, chunk_request)
+                       for index, chunk_request in enumerate(chunk_requests)]
+            results = collect_partial_results(futures, "分割抽出")
+
+    # reduce: スキーマに従って統合（list型は分割順に連結、失敗した分割は除外）
+    return merge_extraction_results(results, app_extraction_fields.get("fields", []))
+
+
+def run_sharded_extraction(shards: list, static_prompt_key: str, system_prompts: list,
+                           chunk_requests: list, app_extraction_fields: dict) -> tuple:
+    """
+    スキーマのシャードごとに並列で抽出を実行し、結果をスキーマ順に統合する
 
-        # マルチモーダルでプロンプト作成（画像がある場合）
-        if image_base64:
-            logger.info("画像を含むマルチモーダルプロンプトを作成します")
+    出力の長さはシャードごとに抑えられるため、全体の待ち時間は最大のシャードで決まる。
+    各シャードはさらに分割ごとに並列で抽出するため、同時に行うBedrock呼び出しが
+    EXTRACTION_MAX_WORKERSを超えないよう、シャードの並列数で割った数を各シャードの上限とする
 
-            # 画像フォーマットを取得
-            image_format = content_type.split(
-                '/')[1] if content_type and '/' in content_type else 'jpeg'
+    Args:
+        shards (list): コンパイル済みプロンプトのシャードのリスト
+        static_prompt_key (str): 使用する不変プロンプトのキー（single_static_prompt / multi_static_prompt）
+        system_prompts (list): システムプロンプト
+        chunk_requests (list): (文書プロンプト, 画像ブロックのリスト) のタプルのリスト
+        app_extraction_fields (dict): アプリ全体の抽出フィールド定義
 
-            # ユーザーメッセージ
-            messages = [{
-                "role": "user",
-                "content": [
-                    {
-                        "image": {
-                            "format": image_format,
-                            "source": {
-                                "bytes": image_data  # バイナリデータを直接使用
-                            }
-                        }
-                    },
-                    {
-                        "text": prompt
-                    }
-                ]
-            }]
+    Returns:
+        tuple: (extracted_info, mapping)
+    """
+    logger.info(f"スキーマ分割抽出を実行します: {len(shards)} シャード")
+
+    shard_workers = max(1, min(settings.EXTRACTION_MAX_WORKERS, len(shards)))
+    chunk_workers = max(1, settings.EXTRACTION_MAX_WORKERS // shard_workers)
+
+    with ThreadPoolExecutor(max_workers=shard_workers) as executor:
+        futures = [
+            executor.submit(
+                run_chunked_extraction, shard[static_prompt_key], system_prompts,
+                chunk_requests, shard["extraction_fields"], shard["field_names"], chunk_workers)
+            for shard in shards
+        ]
+        shard_results = collect_partial_results(futures, "スキーマ分割抽出")
+
+    # 失敗したシャードの担当フィールドは空の値として統合する
+    return merge_shard_results(
+        shard_results,
+        [shard["extraction_fields"]["fields"] for shard in shards],
+        app_extraction_fields.get("fields", []))
+
+
+def build_single_image_with_ocr_plan(image_id: str):
+    """
+    単一画像+OCR結果での抽出リクエストを作成する
+
+    画像・OCR結果の取得、プロンプト作成、トークン予算に応じた分割までを行い、
+    Bedrockの呼び出し方法（同期・バッチ）に依存しない抽出計画を返す
+
+    Args:
+        image_id (str): 画像ID
+
+    Returns:
+        dict: 抽出計画（画像やS3キーが見つからない場合はステータスを更新してNone）
+    """
+    image_id = str(image_id) if isinstance(image_id, uuid.UUID) else image_id
+
+    # 画像情報を取得
+    image_data = get_image(image_id)
+
+    if not image_data:
+        logger.error(f"画像 {image_id} が見つかりません")
+        return None
+
+    # OCR結果を関数内で取得（統一）
+    ocr_result = image_data.get("ocr_result", {})
+
+    # converted_s3_keyを使用（リスト形式に対応）
+    converted_s3_keys = image_data.get("converted_s3_key", [])
+    if not converted_s3_keys:
+        # フォールバックとしてs3_keyを確認
+        s3_keys = image_data.get("s3_key", [])
+        if isinstance(s3_keys, list) and s3_keys:
+            converted_s3_keys = s3_keys
+        elif isinstance(s3_keys, str):
+            converted_s3_keys = [s3_keys]
         else:
-            # 画像がない場合はテキストのみのプロンプト
-            logger.info("テキストのみのプロンプトを作成します")
+            logger.error(f"S3キーが見つかりません: {image_id}")
+            update_image_status(image_id, "failed")
+            return None
 
-            # ユーザーメッセージ
-            messages = [{
-                "role": "user",
-                "content": [{
-                    "text": prompt
-                }]
-            }]
+    # リストから最初のキーを取得
+    if isinstance(converted_s3_keys, list):
+        s3_key = converted_s3_keys[0] if converted_s3_keys else None
+    else:
+        s3_key = converted_s3_keys
 
-        # Bedrock API呼び出し（リトライロジック付き）
-        response = call_bedrock_with_retry(messages, system_prompts)
+    if not s3_key:
+        logger.error(f"有効なS3キーが見つかりません: {image_id}")
+        update_image_status(image_id, "failed")
+        return None
 
-        # レスポンスからテキストを抽出
-        ai_response = parse_converse_response(response)
+    # アプリ名を取得（なければデフォルト）
+    app_name = image_data.get("app_name", DEFAULT_APP)
 
-        # JSONを抽出してマッピング情報を処理
-        extracted_info, mapping = parse_extraction_response(
-            ai_response, field_names)
+    logger.info(f"使用するS3キー: {s3_key}")
 
-        # float値をDecimal型に変換してからデータベースに保存
-        extracted_info = float_to_decimal(extracted_info)
-        mapping = float_to_decimal(mapping)
-
-        # 抽出結果とマッピング情報をデータベースに保存
-        update_extracted_info(
-            str(image_id) if isinstance(image_id, uuid.UUID) else image_id,
-            extracted_info,
-            mapping,
-            'completed'
-        )
+    # コンパイル済みプロンプト（スキーマのみに依存する部品）を取得
+    compiled_prompt = get_compiled_prompt(app_name)
+    app_extraction_fields = compiled_prompt["extraction_fields"]
 
-        # 画像のステータスも完了に更新
-        update_image_status(
-            str(image_id) if isinstance(image_id, uuid.UUID) else image_id,
-            "completed"
-        )
+    logger.info(
+        f"処理アプリ: {app_name}, フィールド数: {len(app_extraction_fields.get('fields', []))}")
 
-        logger.info(f"単一画像情報抽出完了: {image_id}")
+    # 画像データを取得
+    try:
+        s3_response = get_s3_client().get_object(
+            Bucket=settings.BUCKET_NAME,
+            Key=s3_key
+        )
+        image_bytes = s3_response['Body'].read()
 
+        # コンテンツタイプからフォーマットを取得
+        content_type = s3_response.get('ContentType', 'image/jpeg')
+        logger.info(
+            f"画像 {image_id} を取得しました: {content_type}, サイズ: {len(image_bytes)} バイト")
     except Exception as e:
-        logger.error(f"単一画像情報抽出エラー: {str(e)}")
-        try:
-            # エラー時はステータスを失敗に更新
-            update_extracted_info(
-                str(image_id) if isinstance(image_id, uuid.UUID) else image_id,
-                {},
-                {},
-                'failed'
-            )
+        logger.error(f"画像データ取得エラー: {str(e)}")
+        update_image_status(image_id, "failed")
+        return None
+
+    # プロンプト作成（不変部分はコンパイル済み、文書ごとの部分のみ生成）
+    static_prompt = compiled_prompt["single_static_prompt"]
+    document_prompt = create_single_with_ocr_document_prompt(ocr_result)
+
+    # メッセージ構築
+    # システムプロンプト
+    system_prompts = [{
+        "text": "あなたはOCR結果から情報を抽出するアシスタントです。指定されたフィールドに対応する情報を抽出し、JSONフォーマットで返してください。"
+    }]
+
+    # マルチモーダルでプロンプト作成（画像がある場合）
+    image_blocks = []
+    image_tokens = 0
+    if image_bytes and should_skip_image(safe_get_from_dynamo_data(ocr_result, "words", [])):
+        # OCRの認識スコアが十分に高い場合は画像を添付しない
+        logger.info("OCRの認識スコアが高いため、テキストのみのプロンプトを作成します")
+    elif image_bytes:
+        logger.info("画像を含むマルチモーダルプロンプトを作成します")
+
+        # モデルの画像トークンコストに合わせて縮小・フォーマット変換した画像を使用
+        image_block, image_tokens = prepare_image_block(
+            s3_key, image_bytes, content_type, page_count=1)
+        image_blocks.append(image_block)
+    else:
+        # 画像がない場合はテキストのみのプロンプト
+        logger.info("テキストのみのプロンプトを作成します")
+
+    # トークン予算に応じてOCRテキストの圧縮・分割を計画（画像は各リクエストに添付）
+    ocr_pages = prepare_ocr_pages([{
+        "page": 1,
+        "words": safe_get_from_dynamo_data(ocr_result, "words", [])
+    }], use_word_ids=True)
+    line_ids = settings.OCR_PROMPT_GRANULARITY == "line"
+    line_to_words = assign_line_ids(ocr_pages) if line_ids else None
+    plan = plan_ocr_prompt(
+        ocr_pages,
+        fixed_tokens=estimate_fixed_prompt_tokens(
+            static_prompt, system_prompts, image_tokens),
+        verbose_tokens=estimate_text_tokens(document_prompt),
+        line_ids=line_ids
+    )
+
+    # 計画に従って送信するOCRテキストを作成（分割時は注意書きを付加）
+    chunk_count = len(plan["chunks"])
+    if plan["compact"]:
+        chunk_requests = [
+            (create_single_with_ocr_document_prompt(
+                ocr_result, chunk,
+                chunk_note=create_chunk_note(i, chunk_count) if chunk_count > 1 else "",
+                line_ids=line_ids),
+             image_blocks)
+            for i, chunk in enumerate(plan["chunks"])
+        ]
+    else:
+        chunk_requests = [(document_prompt, image_blocks)]
+
+    return {
+        "image_id": image_id,
+        "app_name": app_name,
+        "compiled_prompt": compiled_prompt,
+        "static_prompt_key": "single_static_prompt",
+        "system_prompts": system_prompts,
+        "chunk_requests": chunk_requests,
+        "line_to_words": line_to_words
+    }
+
+
+def build_multi_images_with_ocr_plan(image_id: str) -> dict:
+    """
+    複数画像+OCR結果での抽出リクエストを作成する
 
-            # 画像のステータスも失敗に更新
-            update_image_status(
-                str(image_id) if isinstance(image_id, uuid.UUID) else image_id,
-                "failed"
-            )
-        except Exception as db_error:
-            logger.error(f"Error updating extraction status: {str(db_error)}")
-        raise
+    画像・OCR結果の取得、プロンプト作成、ページ窓・トークン予算に応じた分割までを行い、
+    Bedrockの呼び出し方法（同期・バッチ）に依存しない抽出計画を返す
 
+    Args:
+        image_id (str): 画像ID
 
-def extract_information_from_multi_images_with_ocr(image_id: str):
-    """
-    複数画像+OCR結果での情報抽出
+    Returns:
+        dict: 抽出計画
     """
-    try:
-        logger.info(f"複数画像情報抽出を開始: {image_id}")
+    # 画像データを取得
+    image_data = get_image(image_id)
+    app_name = image_data.get("app_name", DEFAULT_APP)
 
-        # 画像データを取得
-        image_data = get_image(image_id)
-        app_name = image_data.get("app_name", DEFAULT_APP)
+    # コンパイル済みプロンプト（スキーマのみに依存する部品）を取得
+    compiled_prompt = get_compiled_prompt(app_name)
+    app_extraction_fields = compiled_prompt["extraction_fields"]
 
-        # アプリケーションスキーマを取得
-        app_schema = get_app_schema(app_name)
-        if not app_schema:
-            logger.error(f"App schema not found: {app_name}")
-            return
+    logger.info(
+        f"処理アプリ: {app_name}, フィールド数: {len(app_extraction_fields.get('fields', []))}")
 
-        # このアプリ用の抽出フィールド定義を取得
-        app_extraction_fields = get_extraction_fields_for_app(app_name)
-        field_names = get_field_names_for_app(app_name)
+    # 画像データとOCR結果を取得
+    converted_s3_keys = safe_get_from_dynamo_data(
+        image_data, "converted_s3_key", [])
 
-        # カスタムプロンプトを取得
-        custom_prompt = get_custom_prompt_for_app(app_name)
+    if not converted_s3_keys:
+        raise ValueError("変換済み画像が見つかりません")
 
-        logger.info(f"複数画像情報抽出を開始: {image_id}")
+    # リスト形式でない場合は単一画像として扱う
+    if not isinstance(converted_s3_keys, list):
+        converted_s3_keys = [converted_s3_keys]
+
+    # OCR結果を取得
+    ocr_results = get_multipage_ocr_results(image_id)
+
+    if not ocr_results:
+        raise ValueError("OCR結果が見つかりません")
+
+    # プロンプト生成（不変部分はコンパイル済み、OCR結果部分のみ生成）
+    static_prompt = compiled_prompt["multi_static_prompt"]
+    ocr_pages = prepare_ocr_pages(ocr_results)
+    document_prompt = create_multi_with_ocr_document_prompt(ocr_pages)
+
+    # ページ数が多い場合はページ窓に分割し、窓ごとに並列で抽出して統合する（map-reduce）
+    window_size = max(settings.PAGE_WINDOW_SIZE, 1)
+    if settings.ENABLE_PAGE_WINDOW_EXTRACTION and len(ocr_pages) >= settings.PAGE_WINDOW_MIN_PAGES:
+        windows = [ocr_pages[i:i + window_size]
+                   for i in range(0, len(ocr_pages), window_size)]
         logger.info(
-            f"処理アプリ: {app_name}, フィールド数: {len(app_extraction_fields.get('fields', []))}")
+            f"ページ窓分割で抽出します: {len(ocr_pages)}ページ, 窓サイズ {window_size}, {len(windows)}窓")
+    else:
+        windows = [ocr_pages]
+    images_per_request = max(len(window) for window in windows) if windows else 0
+
+    # 複数画像を取得し、1リクエストあたりの枚数に合わせて縮小した画像ブロックを作成
+    # （ページ位置を保つため、取得失敗・省略したページはNoneとする）
+    image_blocks = []
+    image_token_costs = []
+    for page_index, s3_key in enumerate(converted_s3_keys):
+        page_words = safe_get_from_dynamo_data(
+            ocr_results[page_index], "words", []) if page_index < len(ocr_results) else []
+        if should_skip_image(page_words):
+            logger.info(f"ページ {page_index + 1} はOCRの認識スコアが高いため画像を添付しません")
+            image_blocks.append(None)
+            continue
+        try:
+            image_bytes = get_s3_object_bytes(s3_key)
+        except Exception as s3_error:
+            logger.error(f"S3画像取得エラー {s3_key}: {str(s3_error)}")
+            image_blocks.append(None)
+            continue
+        image_block, tokens = prepare_image_block(
+            s3_key, image_bytes, "image/jpeg", page_count=max(images_per_request, 1))
+        image_blocks.append(image_block)
+        image_token_costs.append(tokens)
+
+    if not image_token_costs and not settings.ENABLE_IMAGE_SKIP_ON_HIGH_CONFIDENCE:
+        raise ValueError("画像データを取得できませんでした")
+
+    logger.info(
+        f"画像数: {len(image_token_costs)}, OCRページ数: {len(ocr_results)}")
+
+    # システムプロンプトを設定
+    system_prompts = [{
+        "text": "あなたは複数ページの文書から情報を抽出するアシスタントです。指定されたフィールドに対応する情報を抽出し、純粋なJSONオブジェクトのみを返してください。説明文、コメント、マークダウン記法は一切使用しないでください。"
+    }]
+
+    # トークン予算に応じてOCRテキストの圧縮・分割を窓ごとに計画（画像はページごとに添付）
+    line_ids = settings.OCR_PROMPT_GRANULARITY == "line"
+    line_to_words = assign_line_ids(ocr_pages) if line_ids else None
+    fixed_tokens = estimate_fixed_prompt_tokens(static_prompt, system_prompts)
+    chunk_pages = []  # (ページリスト, 圧縮形式かどうか) のリスト
+    for window in windows:
+        window_prompt = document_prompt if len(windows) == 1 else create_multi_with_ocr_document_prompt(window)
+        plan = plan_ocr_prompt(
+            window,
+            fixed_tokens=fixed_tokens,
+            verbose_tokens=estimate_text_tokens(window_prompt),
+            image_tokens_per_page=max(image_token_costs, default=0),
+            line_ids=line_ids
+        )
+        chunk_pages.extend((chunk, plan["compact"]) for chunk in plan["chunks"])
+
+    # 計画に従って送信するOCRテキストと画像を作成（分割時は注意書きを付加）
+    chunk_count = len(chunk_pages)
+    if chunk_count == 1 and not chunk_pages[0][1]:
+        chunk_requests = [(document_prompt, [block for block in image_blocks if block])]
+    else:
+        chunk_requests = []
+        for i, (chunk, compact) in enumerate(chunk_pages):
+            # 同じページが行単位で分割された場合も画像は1回だけ添付する
+            page_indexes = sorted({page["index"] for page in chunk}) if chunk_count > 1 else range(len(image_blocks))
+            chunk_image_blocks = [
+                image_blocks[index] for index in page_indexes
+                if index < len(image_blocks) and image_blocks[index]
+            ]
+            chunk_requests.append((
+                create_multi_with_ocr_document_prompt(
+                    chunk, compact=compact,
+                    chunk_note=create_chunk_note(i, chunk_count) if chunk_count > 1 else "",
+                    line_ids=line_ids),
+                chunk_image_blocks
+            ))
+
+    return {
+        "image_id": image_id,
+        "app_name": app_name,
+        "compiled_prompt": compiled_prompt,
+        "static_prompt_key": "multi_static_prompt",
+        "system_prompts": system_prompts,
+        "chunk_requests": chunk_requests,
+        "line_to_words": line_to_words
+    }
+
+
+def is_multi_image_combined(image_data: dict) -> bool:
+    """複数画像をcombinedモードで抽出するかを判定"""
+    page_processing_mode = image_data.get("page_processing_mode", "combined")
+    converted_s3_keys = image_data.get("converted_s3_key")
+    return (
+        page_processing_mode == "combined" and
+        isinstance(converted_s3_keys, list) and
+        len(converted_s3_keys) > 1
+    )
+
+
+def build_extraction_plan(image_id: str):
+    """
+    画像の処理モードに応じてOCRありの抽出計画を作成する
+
+    Returns:
+        dict: 抽出計画（作成できない場合はNone）
+    """
+    image_data = get_image(image_id)
+    if not image_data:
+        logger.error(f"画像 {image_id} が見つかりません")
+        return None
+    if is_multi_image_combined(image_data):
+        return build_multi_images_with_ocr_plan(image_id)
+    return build_single_image_with_ocr_plan(image_id)
+
+
+def iter_plan_requests(plan: dict):
+    """
+    抽出計画をBedrockへの個々のリクエストに展開する
 
-        # 画像データとOCR結果を取得
-        converted_s3_keys = safe_get_from_dynamo_data(
-            image_data, "converted_s3_key", [])
+    スキーマ分割時はシャード×分割ごと、それ以外は分割ごとに1リクエストとなる
 
-        if not converted_s3_keys:
-            raise ValueError("変換済み画像が見つかりません")
+    Yields:
+        tuple: (シャード番号, 分割番号, messages, system_prompts)
+    """
+    compiled_prompt = plan["compiled_prompt"]
+    shards = compiled_prompt["shards"] or [compiled_prompt]
+    for shard_index, shard in enumerate(shards):
+        for chunk_index, (document_prompt, image_blocks) in enumerate(plan["chunk_requests"]):
+            messages = [{
+                "role": "user",
+                "content": build_user_content(
+                    shard[plan["static_prompt_key"]], document_prompt, image_blocks,
+                    enable_cache=settings.ENABLE_PROMPT_CACHING)
+            }]
+            yield shard_index, chunk_index, messages, plan["system_prompts"]
 
-        # リスト形式でない場合は単一画像として扱う
-        if not isinstance(converted_s3_keys, list):
-            converted_s3_keys = [converted_s3_keys]
 
-        # OCR結果を取得
-        ocr_results = get_multipage_ocr_results(image_id)
+def plan_shard_fields(plan: dict) -> list:
+    """抽出計画のシャードごとの (抽出フィールド定義, フィールド名リスト) のリストを返す"""
+    compiled_prompt = plan["compiled_prompt"]
+    shards = compiled_prompt["shards"] or [compiled_prompt]
+    return [(shard["extraction_fields"], shard["field_names"]) for shard in shards]
 
-        if not ocr_results:
-            raise ValueError("OCR結果が見つかりません")
 
-        # 抽出指示を作成
-        instructions = f"以下のスキーマに従って、文書から情報を抽出してください。"
+def merge_plan_responses(shard_fields: list, app_fields: list, responses: dict) -> tuple:
+    """
+    抽出計画の各リクエストの応答テキストを解析し、1つの抽出結果に統合する
 
-        # プロンプト生成（カスタムプロンプトを渡す）
-        prompt = create_multi_with_ocr_prompt(
-            ocr_results, app_extraction_fields, instructions, custom_prompt)
+    Args:
+        shard_fields (list): plan_shard_fieldsの戻り値
+        app_fields (list): アプリ全体の抽出フィールド定義のリスト
+        responses (dict): (シャード番号, 分割番号) -> 応答テキスト（失敗したリクエストはNone）
 
-        # 複数画像を取得
-        page_images = []
-        for s3_key in converted_s3_keys:
-            try:
-                image_bytes = get_s3_object_bytes(s3_key)
-                page_images.append(image_bytes)
-            except Exception as s3_error:
-                logger.error(f"S3画像取得エラー {s3_key}: {str(s3_error)}")
+    Returns:
+        tuple: (extracted_info, mapping)
+    """
+    shard_results = []
+    for shard_index, (extraction_fields, field_names) in enumerate(shard_fields):
+        chunk_keys = sorted(key for key in responses if key[0] == shard_index)
+        results = []
+        for key in chunk_keys:
+            if responses[key] is None:
+                results.append(({"error": "バッチ推論のリクエストが失敗しました"}, {}))
                 continue
+            results.append(parse_extraction_response(
+                responses[key], field_names, extraction_fields.get("fields", [])))
+        if len(results) == 1:
+            shard_results.append(results[0])
+        else:
+            shard_results.append(merge_extraction_results(
+                results, extraction_fields.get("fields", [])))
 
-        if not page_images:
-            raise ValueError("画像データを取得できませんでした")
+    if len(shard_results) == 1:
+        return shard_results[0]
+    return merge_shard_results(
+        shard_results,
+        [extraction_fields["fields"] for extraction_fields, _ in shard_fields],
+        app_fields)
 
-        logger.info(f"画像数: {len(page_images)}, OCRページ数: {len(ocr_results)}")
 
-        # システムプロンプトを設定
-        system_prompts = [{
-            "text": "あなたは複数ページの文書から情報を抽出するアシスタントです。指定されたフィールドに対応する情報を抽出し、純粋なJSONオブジェクトのみを返してください。説明文、コメント、マークダウン記法は一切使用しないでください。"
-        }]
+def run_extraction_plan(plan: dict) -> tuple:
+    """
+    抽出計画を同期のBedrock呼び出しで実行する
 
-        # メッセージコンテンツを構築
-        content = [{"text": prompt}]
+    Returns:
+        tuple: (extracted_info, mapping)
+    """
+    compiled_prompt = plan["compiled_prompt"]
+    app_extraction_fields = compiled_prompt["extraction_fields"]
+    field_names = compiled_prompt["field_names"]
+    static_prompt = compiled_prompt[plan["static_prompt_key"]]
+    system_prompts = plan["system_prompts"]
+    chunk_requests = plan["chunk_requests"]
+
+    shards = compiled_prompt["shards"]
+    if len(shards) > 1:
+        # スキーマを分割し、シャードごとに並列で抽出して統合
+        return run_sharded_extraction(
+            shards, plan["static_prompt_key"], system_prompts, chunk_requests,
+            app_extraction_fields)
+
+    if len(chunk_requests) > 1:
+        # ページ窓・予算超過で分割した場合は並列で抽出し、結果を統合
+        return run_chunked_extraction(
+            static_prompt, system_prompts, chunk_requests,
+            app_extraction_fields, field_names)
+
+    document_prompt, image_blocks = chunk_requests[0]
+
+    # ユーザーメッセージ（不変部分→キャッシュポイント→画像→OCR結果の順）
+    messages = [{
+        "role": "user",
+        "content": build_user_content(
+            static_prompt, document_prompt, image_blocks,
+            enable_cache=settings.ENABLE_PROMPT_CACHING)
+    }]
+
+    # Bedrock API呼び出し（リトライロジック・結果キャッシュ付き）
+    if settings.ENABLE_EXTRACTION_STREAMING:
+        invoke = create_streaming_invoker(plan["image_id"], app_extraction_fields)
+    else:
+        invoke = call_bedrock_with_retry
+    response = call_bedrock_with_cache(
+        messages, system_prompts, invoke=invoke)
+
+    # レスポンスからテキストを抽出し、JSONを抽出してマッピング情報を処理
+    ai_response = parse_converse_response(response)
+    return parse_extraction_response(
+        ai_response, field_names, app_extraction_fields.get("fields", []))
+
+
+def save_extraction_result(image_id: str, extracted_info: dict, mapping: dict, line_to_words: dict = None):
+    """
+    抽出結果をデータベースに保存し、画像のステータスを完了に更新する
 
-        # 各ページの画像を追加
-        for i, image_bytes in enumerate(page_images):
-            content.append({
-                "image": {
-                    "format": "jpeg",
-                    "source": {"bytes": image_bytes}
-                }
-            })
+    Args:
+        image_id (str): 画像ID
+        extracted_info (dict): 抽出結果
+        mapping (dict): 抽出結果のindices
+        line_to_words (dict, optional): 行IDで送信した場合の行ID -> 単語IDリストの対応表
+    """
+    # 行IDで返されたindicesを単語IDに展開
+    if line_to_words is not None:
+        mapping = expand_line_indices(mapping, line_to_words)
 
-        # メッセージを構築
-        messages = [{"role": "user", "content": content}]
+    # float値をDecimal型に変換してからデータベースに保存
+    extracted_info = float_to_decimal(extracted_info)
+    mapping = float_to_decimal(mapping)
 
-        # converse_with_model関数を使用してBedrock呼び出し
-        response = call_bedrock(messages, system_prompts)
+    # 抽出結果とマッピング情報をデータベースに保存
+    update_extracted_info(image_id, extracted_info, mapping, "completed")
 
-        # レスポンスを解析
-        response_text = parse_converse_response(response)
+    # 画像のステータスも完了に更新
+    update_image_status(image_id, "completed")
 
-        # parse_extraction_responseを使用して統一的に解析
-        extracted_info, mapping = parse_extraction_response(
-            response_text, field_names)
 
-        # float値をDecimal型に変換してからデータベースに保存
-        extracted_info = float_to_decimal(extracted_info)
-        mapping = float_to_decimal(mapping)
+def extract_information_from_single_image_with_ocr(image_id: str):
+    """
+    単一画像+OCR結果での情報抽出（統一版：関数内でOCR結果取得）
+    """
+    image_id = str(image_id) if isinstance(image_id, uuid.UUID) else image_id
+    try:
+        logger.info(f"単一画像情報抽出を開始: {image_id}")
+
+        plan = build_single_image_with_ocr_plan(image_id)
+        if plan is None:
+            return
+
+        extracted_info, mapping = run_extraction_plan(plan)
+        save_extraction_result(
+            image_id, extracted_info, mapping, plan["line_to_words"])
+
+        logger.info(f"単一画像情報抽出完了: {image_id}")
+
+    except Exception as e:
+        logger.error(f"単一画像情報抽出エラー: {str(e)}")
+        try:
+            # エラー時はステータスを失敗に更新
+            update_extracted_info(image_id, {}, {}, 'failed')
+
+            # 画像のステータスも失敗に更新
+            update_image_status(image_id, "failed")
+        except Exception as db_error:
+            logger.error(f"Error updating extraction status: {str(db_error)}")
+        raise
 
-        # 結果を保存（マッピング情報も含める）
-        update_extracted_info(image_id, extracted_info, mapping, "completed")
-        update_image_status(image_id, "completed")
+
+def extract_information_from_multi_images_with_ocr(image_id: str):
+    """
+    複数画像+OCR結果での情報抽出
+    """
+    try:
+        logger.info(f"複数画像情報抽出を開始: {image_id}")
+
+        plan = build_multi_images_with_ocr_plan(image_id)
+        extracted_info, mapping = run_extraction_plan(plan)
+        save_extraction_result(
+            image_id, extracted_info, mapping, plan["line_to_words"])
 
         logger.info(f"複数画像情報抽出完了: {image_id}")
 
@@ -444,12 +719,11 @@ def extract_information_from_multi_images_without_ocr(image_id: str):
             update_image_status(image_id, "failed")
             return
 
-        # このアプリ用の抽出フィールド定義を取得
-        app_extraction_fields = get_extraction_fields_for_app(app_name)
-        field_names = get_field_names_for_app(app_name)
-
-        # カスタムプロンプトを取得
-        custom_prompt = get_custom_prompt_for_app(app_name)
+        # このアプリ用の抽出フィールド定義・カスタムプロンプトを取得（スキーマ取得は1回のみ）
+        compiled_prompt = get_compiled_prompt(app_name)
+        app_extraction_fields = compiled_prompt["extraction_fields"]
+        field_names = compiled_prompt["field_names"]
+        custom_prompt = compiled_prompt["custom_prompt"]
 
         logger.info(f"OCRなし複数画像モードで情報抽出を開始: {image_id}")
         logger.info(
@@ -459,7 +733,7 @@ def extract_information_from_multi_images_without_ocr(image_id: str):
         images_data = []
         for i, s3_key in enumerate(converted_s3_keys):
             try:
-                s3_response = s3_client.get_object(
+                s3_response = get_s3_client().get_object(
                     Bucket=settings.BUCKET_NAME,
                     Key=s3_key
                 )
@@ -529,13 +803,14 @@ def extract_information_from_multi_images_without_ocr(image_id: str):
             logger.info(f"複数画像（{len(images_data)}枚）でLLM呼び出しを開始")
 
             # Bedrock APIを呼び出し
-            response = call_bedrock(messages, system_prompts)
+            response = call_bedrock_with_retry(messages, system_prompts)
             response_text = parse_converse_response(response)
 
             logger.info(f"LLMレスポンス取得完了: {len(response_text)} 文字")
 
             # JSONを抽出
-            extracted_info = extract_json_from_response(response_text)
+            extracted_info = extract_json_from_response(
+                response_text, app_extraction_fields.get('fields', []))
             if not extracted_info:
                 logger.warning("JSONの抽出に失敗しました")
                 extracted_info = {
@@ -579,19 +854,18 @@ def extract_information_from_single_image_without_ocr(image_id: str):
         # アプリ名を取得（なければデフォルト）
         app_name = image_data.get("app_name", DEFAULT_APP)
 
-        # このアプリ用の抽出フィールド定義を取得
-        app_extraction_fields = get_extraction_fields_for_app(app_name)
-        field_names = get_field_names_for_app(app_name)
-
-        # カスタムプロンプトを取得
-        custom_prompt = get_custom_prompt_for_app(app_name)
+        # このアプリ用の抽出フィールド定義・カスタムプロンプトを取得（スキーマ取得は1回のみ）
+        compiled_prompt = get_compiled_prompt(app_name)
+        app_extraction_fields = compiled_prompt["extraction_fields"]
+        field_names = compiled_prompt["field_names"]
+        custom_prompt = compiled_prompt["custom_prompt"]
 
         logger.info(f"OCRなしモードで情報抽出を開始: {image_id}")
         logger.info(
             f"処理アプリ: {app_name}, フィールド数: {len(app_extraction_fields.get('fields', []))}")
 
         # S3から画像を取得
-        s3_response = s3_client.get_object(
+        s3_response = get_s3_client().get_object(
             Bucket=settings.BUCKET_NAME,
             Key=s3_key
         )
@@ -644,13 +918,14 @@ def extract_information_from_single_image_without_ocr(image_id: str):
             logger.info("OCRなしモードでLLM呼び出しを開始")
 
             # Bedrock APIを呼び出し
-            response = call_bedrock(messages, system_prompts)
+            response = call_bedrock_with_retry(messages, system_prompts)
             response_text = parse_converse_response(response)
 
             logger.info(f"LLMレスポンス取得完了: {len(response_text)} 文字")
 
             # JSONを抽出
-            extracted_info = extract_json_from_response(response_text)
+            extracted_info = extract_json_from_response(
+                response_text, app_extraction_fields.get('fields', []))
             if not extracted_info:
                 logger.warning("JSONの抽出に失敗しました")
                 extracted_info = {
@@ -724,7 +999,7 @@ def get_s3_object_bytes(s3_key: str) -> bytes:
     """S3から画像バイトデータを取得"""
     try:
         bucket_name = settings.BUCKET_NAME
-        s3_response = s3_client.get_object(Bucket=bucket_name, Key=s3_key)
+        s3_response = get_s3_client().get_object(Bucket=bucket_name, Key=s3_key)
         return s3_response['Body'].read()
     except Exception as e:
         logger.error(f"S3オブジェクト取得エラー: {s3_key}, {str(e)}")
@@ -5,7 +5,7 @@ import logging
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
-from routers import health, ocr, upload, extraction, schema, s3_sync
+from routers import health, ocr, upload, extraction, schema, s3_sync, tasks
 
 # アプリケーション全体のログレベル設定
 logging.basicConfig(level=logging.INFO)
@@ -34,6 +34,7 @@ app.include_router(upload.router)
 app.include_router(extraction.router)
 app.include_router(schema.router)
 app.include_router(s3_sync.router)
+app.include_router(tasks.router)
 
 # バックグラウンドタスクをサービスに注入
 set_background_task(background_task)
@@ -1,11 +1,12 @@
 from config import settings
-from clients import s3_client, sagemaker_runtime_client
+from clients import get_s3_client, get_sagemaker_runtime_client
 import json
 import logging
 import base64
 
 from app_schema import get_extraction_fields_for_app, get_field_names_for_app, DEFAULT_APP
 from database import get_image, update_extracted_info, update_image_status, update_ocr_result
+from utils.helpers import float_to_decimal
 
 logger = logging.getLogger(__name__)
 
@@ -33,7 +34,7 @@ def perform_ocr(image_data):
         # SageMakerエンドポイントを呼び出し
         try:
             # 推論コンポーネントを直接指定してエンドポイントを呼び出し
-            response = sagemaker_runtime_client.invoke_endpoint(
+            response = get_sagemaker_runtime_client().invoke_endpoint(
                 EndpointName=settings.SAGEMAKER_ENDPOINT_NAME,
                 ContentType='application/json',
                 Body=json.dumps(request_body),
@@ -62,14 +63,18 @@ def perform_ocr(image_data):
                     # 方向情報が必要な場合のみ保持
                     if "direction" in word:
                         simplified_word["direction"] = word["direction"]
+                    # 認識スコアは画像添付の要否判定にのみ使用するため、有効な場合だけ保持
+                    if settings.ENABLE_IMAGE_SKIP_ON_HIGH_CONFIDENCE and "rec_score" in word:
+                        simplified_word["rec_score"] = word["rec_score"]
 
                     simplified_words.append(simplified_word)
 
                 response_body['words'] = simplified_words
 
-            # 拡張されたOCR結果を作成
+            # 拡張されたOCR結果を作成（テキストは座標から復元した読み順で結合）
+            from utils.layout import build_layout_text
             words = response_body.get('words', [])
-            full_text = " ".join([word.get("content", "") for word in words])
+            full_text = build_layout_text(words)
 
             enhanced_result = {
                 "text": full_text,
@@ -107,7 +112,7 @@ def perform_ocr_single_page(s3_key: str):
     try:
         # S3から画像を取得
         bucket_name = settings.BUCKET_NAME
-        s3_response = s3_client.get_object(Bucket=bucket_name, Key=s3_key)
+        s3_response = get_s3_client().get_object(Bucket=bucket_name, Key=s3_key)
         image_data = s3_response['Body'].read()
 
         # perform_ocr関数を使用
@@ -200,9 +205,9 @@ def perform_ocr_individual_page(image_id: str):
         if isinstance(s3_key, list):
             s3_key = s3_key[0]  # リストの場合は最初の要素
 
-        from clients import s3_client
+        from clients import get_s3_client
         from config import settings
-        s3_response = s3_client.get_object(
+        s3_response = get_s3_client().get_object(
             Bucket=settings.BUCKET_NAME, Key=s3_key)
         image_bytes = s3_response['Body'].read()
 
@@ -225,9 +230,9 @@ def perform_ocr_individual_page(image_id: str):
             ocr_text = "\n".join([word.get("content", "")
                                  for word in ocr_result.get("words", [])])
 
-        # DynamoDBにOCR結果を保存
+        # DynamoDBにOCR結果を保存（認識スコアなどのfloatはDecimalに変換）
         logger.info(f"Saving OCR results for image {image_id}")
-        update_ocr_result(image_id, ocr_result, "processing")
+        update_ocr_result(image_id, float_to_decimal(ocr_result), "processing")
 
     except Exception as e:
         logger.error(f"個別ページOCR処理エラー: {str(e)}")
@@ -250,9 +255,9 @@ def perform_ocr_single_image(image_id: str):
         if isinstance(s3_key, list):
             s3_key = s3_key[0]
 
-        from clients import s3_client
+        from clients import get_s3_client
         from config import settings
-        s3_response = s3_client.get_object(
+        s3_response = get_s3_client().get_object(
             Bucket=settings.BUCKET_NAME, Key=s3_key)
         image_bytes = s3_response['Body'].read()
 
@@ -275,9 +280,9 @@ def perform_ocr_single_image(image_id: str):
             ocr_text = "\n".join([word.get("content", "")
                                  for word in ocr_result.get("words", [])])
 
-        # DynamoDBにOCR結果を保存
+        # DynamoDBにOCR結果を保存（認識スコアなどのfloatはDecimalに変換）
         logger.info(f"Saving OCR results for image {image_id}")
-        update_ocr_result(image_id, ocr_result, "processing")
+        update_ocr_result(image_id, float_to_decimal(ocr_result), "processing")
 
     except Exception as e:
         logger.error(f"単一画像OCR処理エラー: {str(e)}")
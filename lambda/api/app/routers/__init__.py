@@ -9,6 +9,7 @@ from . import upload
 from . import extraction
 from . import schema
 from . import s3_sync
+from . import tasks
 
 __all__ = [
     'health',
@@ -16,5 +17,6 @@ __all__ = [
     'upload',
     'extraction',
     'schema',
-    's3_sync'
+    's3_sync',
+    'tasks'
 ]
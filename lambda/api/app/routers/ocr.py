@@ -41,6 +41,18 @@ async def get_ocr_status(job_id: str):
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
 
+@router.post("/batch/{job_id}/collect")
+async def collect_batch_extraction(job_id: str):
+    """バッチ推論による抽出結果を取り込む"""
+    try:
+        return await ocr_service.collect_batch_extraction(job_id)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error collecting batch extraction: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
+
+
 @router.get("/result/{image_id}", response_model=OcrResultResponse)
 async def get_ocr_result(image_id: str):
     """OCR結果を取得する"""
@@ -12,10 +12,10 @@ s3_sync_service = S3SyncService()
 
 
 @router.post("/{app_name}")
-async def sync_s3_files(app_name: str, prefix: Optional[str] = None):
-    """S3バケットからファイルを同期する"""
+async def sync_s3_files(app_name: str, prefix: Optional[str] = None, include_imported: bool = False):
+    """S3バケットからファイルを同期する（取り込み済みのファイルはinclude_importedを指定した場合のみ返す）"""
     try:
-        result = await s3_sync_service.sync_s3_files(app_name, prefix)
+        result = await s3_sync_service.sync_s3_files(app_name, prefix, include_imported)
         return result
     except Exception as e:
         logger.error(f"Error syncing S3 files: {str(e)}")
@@ -31,3 +31,36 @@ async def import_s3_file(app_name: str, file_data: dict):
     except Exception as e:
         logger.error(f"Error importing S3 file: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
+
+
+@router.post("/{app_name}/bulk-import")
+async def start_bulk_import(app_name: str, prefix: Optional[str] = None):
+    """S3フォルダ内のファイルをまとめてインポートするジョブを開始する"""
+    try:
+        result = await s3_sync_service.start_bulk_import(app_name, prefix)
+        return result
+    except Exception as e:
+        logger.error(f"Error starting bulk S3 import: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
+
+
+@router.get("/bulk-import/{import_id}")
+async def get_bulk_import_status(import_id: str):
+    """一括インポートの進捗を取得する"""
+    try:
+        result = await s3_sync_service.get_bulk_import_status(import_id)
+        return result
+    except Exception as e:
+        logger.error(f"Error getting bulk S3 import status: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
+
+
+@router.post("/bulk-import/{import_id}/resume")
+async def resume_bulk_import(import_id: str):
+    """停止した一括インポートをチェックポイントから再開する"""
+    try:
+        result = await s3_sync_service.resume_bulk_import(import_id)
+        return result
+    except Exception as e:
+        logger.error(f"Error resuming bulk S3 import: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
@@ -0,0 +1,38 @@
+from fastapi import APIRouter, HTTPException, Request
+import logging
+
+from task_queue import handle_sqs_event
+from services.ingestion_service import IngestionService
+
+logger = logging.getLogger(__name__)
+router = APIRouter(tags=["Tasks"])
+
+
+@router.post("/events")
+async def handle_events(request: Request):
+    """
+    Lambda Web Adapterから転送されたSQS・S3イベントを処理する
+
+    HTTP以外のイベントはAWS_LWA_PASS_THROUGH_PATH（既定: /events）に転送される。
+    API Gateway経由のリクエスト（リクエストコンテキスト付き）は受け付けない
+    """
+    if request.headers.get("x-amzn-request-context"):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+    event = await request.json()
+    # タスクはPDF変換・OCRなど同期処理のため、イベントループを塞がないようスレッドで実行
+    from starlette.concurrency import run_in_threadpool
+    records = event.get("Records", [])
+    if records and records[0].get("eventSource") == "aws:s3":
+        # アップロードされたファイルの取り込み（S3のObjectCreatedイベント）
+        # 失敗時は502を返し、Lambda Web Adapterが呼び出しエラーとして扱うことでイベントを再試行させる
+        try:
+            return await run_in_threadpool(IngestionService().handle_s3_event, event)
+        except Exception as e:
+            logger.error(f"S3イベントの処理に失敗しました: {str(e)}")
+            raise HTTPException(status_code=502, detail=str(e))
+
+    result = await run_in_threadpool(handle_sqs_event, event)
+    logger.info(
+        f"SQSイベントを処理しました: {len(event.get('Records', []))}件, 失敗 {len(result['batchItemFailures'])}件")
+    return result
@@ -1,5 +1,6 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
 import logging
+from typing import Optional
 
 from schemas import (
     PresignedUrlRequest, PresignedUrlResponse, UploadCompleteRequest,
@@ -36,10 +37,15 @@ async def upload_complete(request: UploadCompleteRequest):
 
 
 @router.get("/image/{image_id}")
-async def get_image(image_id: str):
-    """画像を取得して返す"""
+async def get_image(image_id: str, request: Request, tier: Optional[str] = None):
+    """画像を取得して返す（Range・If-None-Matchに対応、tierで縮小画像を指定可能）"""
     try:
-        return await upload_service.get_image_stream(image_id)
+        return await upload_service.get_image_stream(
+            image_id,
+            range_header=request.headers.get("range"),
+            if_none_match=request.headers.get("if-none-match"),
+            tier=tier
+        )
     except Exception as e:
         logger.error(f"Error getting image: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
@@ -45,6 +45,8 @@ class PresignedUrlRequest(BaseModel):
     content_type: str
     app_name: str = "default"
     page_processing_mode: str = "combined"
+    # 同じ内容の処理済みドキュメントがあっても再処理する
+    force_reprocess: bool = False
 
 
 class PresignedUrlResponse(BaseModel):
@@ -61,6 +63,7 @@ class UploadCompleteRequest(BaseModel):
     s3_key: str
     app_name: str = "default"
     page_processing_mode: str = "combined"
+    force_reprocess: bool = False
 
 
 # 情報抽出関連の型定義
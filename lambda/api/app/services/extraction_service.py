@@ -12,6 +12,7 @@ from app_schema import (
     get_app_display_name, get_extraction_fields_for_app
 )
 from background import BackgroundTaskExtension
+from clients import run_io, run_extraction
 from utils import decimal_to_float
 from extraction import (
     extract_information_from_multi_images_with_ocr,
@@ -69,7 +70,7 @@ class ExtractionService:
         """情報抽出結果を取得する"""
         try:
             # 画像情報を取得
-            image_data = get_image(image_id)
+            image_data = await run_io(get_image, image_id)
 
             if not image_data:
                 logger.warning(f"画像が見つかりません (image_id: {image_id})")
@@ -79,10 +80,10 @@ class ExtractionService:
             app_name = image_data.get("app_name", DEFAULT_APP)
 
             # アプリの表示名を取得
-            app_display_name = get_app_display_name(app_name)
+            app_display_name = await run_io(get_app_display_name, app_name)
 
             # このアプリ用の抽出フィールド定義を取得
-            app_extraction_fields = get_extraction_fields_for_app(app_name)[
+            app_extraction_fields = (await run_io(get_extraction_fields_for_app, app_name))[
                 "fields"]
 
             # 抽出処理が完了していない場合
@@ -132,7 +133,7 @@ class ExtractionService:
             logger.info(f"情報抽出を開始: {image_id}")
 
             # 画像データを取得
-            image_data = get_image(image_id)
+            image_data = await run_io(get_image, image_id)
             if not image_data:
                 raise ValueError("Image not found")
 
@@ -159,20 +160,20 @@ class ExtractionService:
 
         except Exception as e:
             logger.error(f"情報抽出エラー: {str(e)}")
-            update_image_status(image_id, "failed")
+            await run_io(update_image_status, image_id, "failed")
             raise
 
     async def _extract_information_multiimage(self, image_id: str, extraction_data: dict) -> Dict[str, Any]:
         """複数画像での情報抽出処理"""
         try:
             # 状態を更新
-            update_image_status(image_id, "processing")
+            await run_io(update_image_status, image_id, "processing")
 
             # extraction.pyの関数を直接呼び出し
-            extract_information_from_multi_images_with_ocr(image_id)
+            await run_extraction(extract_information_from_multi_images_with_ocr, image_id)
 
             # 結果を取得
-            image_data = get_image(image_id)
+            image_data = await run_io(get_image, image_id)
             extracted_info = image_data.get("extracted_info", {})
 
             logger.info(f"複数画像情報抽出完了: {image_id}")
@@ -180,25 +181,25 @@ class ExtractionService:
 
         except Exception as e:
             logger.error(f"複数画像情報抽出エラー: {str(e)}")
-            update_image_status(image_id, "failed")
+            await run_io(update_image_status, image_id, "failed")
             raise
 
     async def _extract_information_single(self, image_id: str, extraction_data: dict) -> Dict[str, Any]:
         """単一画像での情報抽出処理"""
         try:
             # 状態を更新
-            update_image_status(image_id, "processing")
+            await run_io(update_image_status, image_id, "processing")
 
             # OCR結果を取得
-            image_data = get_image(image_id)
+            image_data = await run_io(get_image, image_id)
             ocr_result = image_data.get("ocr_result", {})
             ocr_text = ocr_result.get("text", "")
 
             # extraction.pyの関数を直接呼び出し（統一版）
-            extract_information_from_single_image_with_ocr(image_id)
+            await run_extraction(extract_information_from_single_image_with_ocr, image_id)
 
             # 結果を取得
-            updated_image_data = get_image(image_id)
+            updated_image_data = await run_io(get_image, image_id)
             extracted_info = updated_image_data.get("extracted_info", {})
 
             logger.info(f"単一画像情報抽出完了: {image_id}")
@@ -206,19 +207,27 @@ class ExtractionService:
 
         except Exception as e:
             logger.error(f"単一画像情報抽出エラー: {str(e)}")
-            update_image_status(image_id, "failed")
+            await run_io(update_image_status, image_id, "failed")
             raise
 
     async def get_extraction_status(self, image_id: str) -> Dict[str, Any]:
         """情報抽出のステータスを取得する"""
         try:
             # 画像情報を取得
-            image_data = get_image(image_id)
+            image_data = await run_io(get_image, image_id)
 
             if not image_data:
                 raise ValueError("Image not found")
 
-            return {"status": image_data.get("extraction_status") or "not_started"}
+            result = {"status": image_data.get(
+                "extraction_status") or "not_started"}
+
+            # ストリーミング抽出中は進捗も返す
+            extraction_progress = image_data.get("extraction_progress")
+            if extraction_progress and result["status"] == "processing":
+                result["progress"] = decimal_to_float(extraction_progress)
+
+            return result
         except Exception as e:
             logger.error(f"Error getting extraction status: {str(e)}")
             raise
@@ -234,7 +243,7 @@ class ExtractionService:
             extracted_info = edited_data.get("extracted_info", {})
             mapping = edited_data.get("mapping", {})
 
-            update_extracted_info(image_id, extracted_info, mapping)
+            await run_io(update_extracted_info, image_id, extracted_info, mapping)
 
             logger.info(f"Updated extraction result for image {image_id}")
 
@@ -4,6 +4,10 @@ OCR→情報抽出の完全フローを管理
 アップロードされた画像に対してOCR処理と情報抽出を順次実行
 """
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from config import settings
 from services.ocr_service import OcrService
 from services.extraction_service import ExtractionService
 
@@ -35,3 +39,68 @@ class ImageProcessingPipeline:
             logger.error(f"Pipeline failed for {image_id}: {e}")
             # 既存ロジックに合わせて、エラーハンドリングは各サービス内で実行済み
             raise
+
+    def process_images(self, image_ids: list, extract: bool = True) -> dict:
+        """
+        複数画像のOCR→情報抽出をステージごとの同時実行数で並行に処理する
+
+        OCR（SageMaker）と情報抽出（Bedrock）は別々のスレッドプールで実行し、
+        OCRが完了した画像から順に抽出へ渡す。文書N+1のOCRと文書Nの抽出が重なるため、
+        ジョブ全体の処理時間は遅い方のステージの処理時間×画像数/同時実行数に近づく
+
+        Args:
+            image_ids (list): 処理対象の画像IDのリスト
+            extract (bool): Falseの場合はOCRのみを実行する
+
+        Returns:
+            dict: {"ocr_completed": OCRが完了した画像IDのリスト,
+                   "completed": 抽出まで完了した画像IDのリスト,
+                   "failed": 失敗した画像IDのリスト}
+        """
+        result = {"ocr_completed": [], "completed": [], "failed": []}
+        if not image_ids:
+            return result
+
+        ocr_workers = max(min(settings.PIPELINE_OCR_CONCURRENCY, len(image_ids)), 1)
+        extraction_workers = max(min(settings.PIPELINE_EXTRACTION_CONCURRENCY, len(image_ids)), 1)
+        logger.info(
+            f"パイプライン処理を開始します: {len(image_ids)}件, "
+            f"OCR同時実行数 {ocr_workers}, 抽出同時実行数 {extraction_workers if extract else 0}")
+        start_time = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=ocr_workers, thread_name_prefix="ocr") as ocr_executor, \
+                ThreadPoolExecutor(max_workers=extraction_workers, thread_name_prefix="extraction") as extraction_executor:
+            ocr_futures = {
+                ocr_executor.submit(self.ocr_service.process_image_ocr, image_id): image_id
+                for image_id in image_ids
+            }
+
+            # OCRが完了した画像から順に抽出ステージへ渡す
+            extraction_futures = {}
+            for future in as_completed(ocr_futures):
+                image_id = ocr_futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    logger.error(f"Pipeline failed for {image_id} (OCR): {e}")
+                    result["failed"].append(image_id)
+                    continue
+                result["ocr_completed"].append(image_id)
+                if extract:
+                    extraction_futures[extraction_executor.submit(
+                        self.extraction_service.extract_information, image_id)] = image_id
+
+            for future in as_completed(extraction_futures):
+                image_id = extraction_futures[future]
+                try:
+                    future.result()
+                    result["completed"].append(image_id)
+                except Exception as e:
+                    logger.error(f"Pipeline failed for {image_id} (extraction): {e}")
+                    result["failed"].append(image_id)
+
+        logger.info(
+            f"パイプライン処理が完了しました: OCR完了 {len(result['ocr_completed'])}件, "
+            f"抽出完了 {len(result['completed'])}件, 失敗 {len(result['failed'])}件, "
+            f"{time.perf_counter() - start_time:.1f}秒")
+        return result
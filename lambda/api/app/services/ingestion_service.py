@@ -0,0 +1,407 @@
+"""
+アップロードされたファイルの取り込み処理
+S3イベント（またはクライアントからの完了通知）を契機に、種別判定・リサイズ/PDF変換・OCR開始を行う
+"""
+import hashlib
+import logging
+import re
+import uuid
+from datetime import datetime
+from io import BytesIO
+from typing import Dict, Any, Optional, List
+from urllib.parse import unquote_plus
+
+from clients import get_s3_client
+from config import settings
+from database import (
+    get_image, update_image_status, update_converted_image, update_image_tiers,
+    claim_ingestion, release_ingestion, create_job, update_content_hash, find_images_by_content_hash,
+    link_duplicate_image, get_children_by_parent_id, create_individual_page_record
+)
+from task_queue import submit_task
+from utils import resize_image
+from utils.helpers import sniff_content_type, create_image_tiers, SNIFF_HEADER_BYTES
+
+logger = logging.getLogger(__name__)
+
+# アップロード先のプレフィックス（S3キーは uploads/{画像ID}_{日時}_{ファイル名}）
+UPLOAD_PREFIX = "uploads/"
+_UPLOAD_KEY_PATTERN = re.compile(r"^uploads/([0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})_")
+
+# コンテンツハッシュ計算時に1回で読み込むサイズ（バイト）
+_HASH_CHUNK_SIZE = 1024 * 1024
+# 処理結果を引き継げる元のドキュメントのステータス（変換中・OCR中のものは対象外）
+_REUSABLE_STATUSES = ("completed", "pending")
+
+
+def parse_image_id_from_key(s3_key: str) -> Optional[str]:
+    """アップロード先のS3キーから画像IDを取得する"""
+    match = _UPLOAD_KEY_PATTERN.match(s3_key)
+    return match.group(1) if match else None
+
+
+def compute_content_hash(bucket_name: str, s3_key: str) -> str:
+    """S3オブジェクトの内容のSHA-256を計算する（全体をメモリに載せずに読み込む）"""
+    s3_obj = get_s3_client().get_object(Bucket=bucket_name, Key=s3_key)
+    digest = hashlib.sha256()
+    for chunk in s3_obj["Body"].iter_chunks(_HASH_CHUNK_SIZE):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def select_reusable_source(candidates: List[dict], image_id: str, page_processing_mode: str) -> Optional[dict]:
+    """
+    同じ内容のドキュメントから処理結果を引き継ぐ元を選ぶ
+
+    ページ処理モードが同じで変換が完了しているものを対象とし、処理完了済み・アップロードが古いものを優先する
+    """
+    reusable = [
+        item for item in candidates
+        if item.get("id") != image_id
+        and item.get("status") in _REUSABLE_STATUSES
+        and item.get("page_processing_mode", "combined") == page_processing_mode
+    ]
+    if not reusable:
+        return None
+    return min(reusable, key=lambda item: (item.get("status") != "completed", item.get("upload_time", "")))
+
+
+def build_s3_object_created_event(key: str, etag: str = "", size: int = 0, bucket: str = None) -> dict:
+    """
+    S3のObjectCreatedイベントを作成する（ローカルでの動作確認用）
+
+    作成したイベントを POST /events に送信すると、S3からの通知と同じ経路で取り込みが行われる
+    """
+    return {
+        "Records": [{
+            "eventVersion": "2.1",
+            "eventSource": "aws:s3",
+            "awsRegion": settings.AWS_REGION,
+            "eventTime": datetime.now().isoformat(),
+            "eventName": "ObjectCreated:Put",
+            "s3": {
+                "bucket": {"name": bucket or settings.BUCKET_NAME},
+                "object": {"key": key, "size": size, "eTag": etag}
+            }
+        }]
+    }
+
+
+class IngestionService:
+    """アップロードされたファイルの取り込みを管理するサービスクラス"""
+
+    def __init__(self):
+        self.bucket_name = settings.BUCKET_NAME
+
+    def handle_s3_event(self, event: dict) -> Dict[str, Any]:
+        """
+        S3のObjectCreatedイベントを処理する
+
+        同じオブジェクトの通知が重複して届いても、取り込みは1回だけ行われる。
+        取り込みに失敗したオブジェクトがある場合は、全件の処理後に例外を送出して
+        イベントを再試行させる（取り込み済みのオブジェクトは再試行時に省略される）
+
+        Returns:
+            dict: 処理結果の件数
+
+        Raises:
+            RuntimeError: 取り込みに失敗したオブジェクトがある場合
+        """
+        results = {"ingested": 0, "skipped": 0, "failed": 0}
+        for record in event.get("Records", []):
+            if record.get("eventSource") != "aws:s3" or not record.get("eventName", "").startswith("ObjectCreated"):
+                continue
+            bucket_name = record["s3"]["bucket"]["name"]
+            # イベント内のキーはURLエンコードされている
+            s3_key = unquote_plus(record["s3"]["object"]["key"])
+            etag = record["s3"]["object"].get("eTag", "")
+
+            if bucket_name != self.bucket_name or not s3_key.startswith(UPLOAD_PREFIX):
+                results["skipped"] += 1
+                continue
+
+            image_id = parse_image_id_from_key(s3_key)
+            if not image_id:
+                logger.warning(f"画像IDを取得できないオブジェクトのため取り込みません: {s3_key}")
+                results["skipped"] += 1
+                continue
+
+            try:
+                result = self.ingest_object(image_id, s3_key, etag)
+                results["ingested" if result.get("ingested") else "skipped"] += 1
+            except Exception as e:
+                logger.error(f"オブジェクトの取り込みに失敗しました: {s3_key}, {str(e)}")
+                results["failed"] += 1
+
+        logger.info(f"S3イベントを処理しました: {results}")
+        if results["failed"]:
+            raise RuntimeError(f"Failed to ingest {results['failed']} object(s)")
+        return results
+
+    def ingest_object(self, image_id: str, s3_key: str, etag: str = "", filename: str = None,
+                      force_reprocess: bool = False) -> Dict[str, Any]:
+        """
+        アップロードされたオブジェクトを取り込む
+
+        冪等性キー（S3キーとETag）を記録してから処理するため、S3イベントと
+        クライアントからの完了通知のどちらから呼ばれても処理は1回だけ行われる。
+        冪等性キーの記録後に失敗した場合はキーを削除して例外を送出する（再試行で取り込み直せる）。
+        同じ内容の処理済みドキュメントの確認（ファイル全体の読み込みとハッシュ計算）は
+        リクエスト外の変換・リサイズタスクで行う
+
+        Args:
+            image_id (str): 画像ID
+            s3_key (str): アップロードされたオブジェクトのS3キー
+            etag (str): オブジェクトのETag
+            filename (str, optional): 元のファイル名（未指定時はレコードから取得）
+            force_reprocess (bool): 同じ内容のドキュメントがあっても再処理する
+                                    （署名付きURL発行時にレコードへ指定することもできる）
+
+        Returns:
+            dict: 取り込み結果（handle_upload_completeのレスポンスと同じ形式）
+        """
+        image_data = get_image(image_id)
+        if not image_data:
+            logger.warning(f"画像レコードが見つからないため取り込みません: {image_id}")
+            return {"status": "skipped", "image_id": image_id, "ingested": False, "is_converting": False}
+
+        filename = filename or image_data.get("filename", "")
+        ingest_key = s3_key + ":" + etag.strip('"')
+
+        # 先頭バイトだけを取得して実際のファイル種別を判定
+        s3_response = get_s3_client().get_object(
+            Bucket=self.bucket_name,
+            Key=s3_key,
+            Range=f"bytes=0-{SNIFF_HEADER_BYTES - 1}"
+        )
+        header = s3_response["Body"].read()
+        content_type = sniff_content_type(header) or s3_response.get(
+            "ContentType", "application/octet-stream")
+        logger.info(f"ファイル種別を判定しました: {image_id}, {content_type}")
+
+        # 判定したContent-Typeは冪等性キーと一緒に保存する（ダウンロードURLの生成に使用）
+        if not claim_ingestion(image_id, ingest_key, content_type):
+            logger.info(f"取り込み済みのため省略します: {image_id} ({ingest_key})")
+            return {
+                "status": "success",
+                "message": "Upload already processed",
+                "image_id": image_id,
+                "ingested": False,
+                "is_converting": image_data.get("status") == "converting"
+            }
+
+        try:
+            return self._process_claimed_object(
+                image_id, image_data, s3_key, filename, content_type, force_reprocess)
+        except Exception as e:
+            logger.error(f"取り込みに失敗したため冪等性キーを削除します: {image_id}, {str(e)}")
+            release_ingestion(image_id, ingest_key)
+            raise
+
+    def _process_claimed_object(self, image_id: str, image_data: dict, s3_key: str, filename: str,
+                                content_type: str, force_reprocess: bool) -> Dict[str, Any]:
+        """冪等性キーを記録したオブジェクトの種別に応じて変換・OCRを開始する"""
+        is_pdf = content_type == "application/pdf" or (
+            content_type == "application/octet-stream" and filename.lower().endswith(".pdf"))
+
+        if is_pdf:
+            # PDFは変換タスクを投入（変換完了後にOCRを開始する場合は変換タスク内で行う）
+            update_image_status(image_id, "converting")
+            task_id = submit_task(
+                "convert_pdf",
+                {"image_id": image_id, "s3_key": s3_key, "force_reprocess": force_reprocess},
+                dedup_key=f"convert_pdf:{image_id}")
+            logger.info(f"Started PDF conversion task {task_id} for image {image_id}")
+            return {
+                "status": "success",
+                "message": "Upload completed, PDF conversion started",
+                "image_id": image_id,
+                "ingested": True,
+                "is_converting": True
+            }
+
+        if content_type.startswith("image/"):
+            # リサイズ（ダウンロード・デコード・再アップロード）はリクエスト外のタスクで実行する
+            update_image_status(image_id, "converting")
+            task_id = submit_task(
+                "resize_image",
+                {"image_id": image_id, "s3_key": s3_key, "filename": filename,
+                    "content_type": content_type, "force_reprocess": force_reprocess},
+                dedup_key=f"resize_image:{image_id}")
+            logger.info(f"Started image resize task {task_id} for image {image_id}")
+            return {
+                "status": "success",
+                "message": "Upload completed, image resize started",
+                "image_id": image_id,
+                "ingested": True,
+                "is_converting": True
+            }
+
+        update_image_status(image_id, "pending")
+        start_ocr_if_enabled(image_id)
+        return {
+            "status": "success",
+            "message": "Upload completed successfully",
+            "image_id": image_id,
+            "ingested": True,
+            "is_converting": False
+        }
+
+    def reuse_duplicate(self, image_id: str, image_data: dict, s3_key: str,
+                        force_reprocess: bool = False) -> bool:
+        """
+        重複チェックが有効な場合、同じ内容の処理済みドキュメントの結果を引き継ぐ
+
+        変換・リサイズタスクの開始時に呼び出す（失敗した場合は通常どおり変換する）
+
+        Args:
+            image_id (str): 画像ID
+            image_data (dict): 画像レコード
+            s3_key (str): アップロードされたオブジェクトのS3キー
+            force_reprocess (bool): 同じ内容のドキュメントがあっても再処理する
+
+        Returns:
+            bool: 処理結果を引き継いだ場合True（変換は不要）
+        """
+        if not settings.ENABLE_CONTENT_DEDUP:
+            return False
+        try:
+            source_id = self.link_duplicate(
+                image_id, image_data, s3_key,
+                force_reprocess=force_reprocess or bool(image_data.get("force_reprocess")))
+            return source_id is not None
+        except Exception as e:
+            logger.error(f"重複チェックに失敗しました: {image_id}, {str(e)}")
+            return False
+
+    def link_duplicate(self, image_id: str, image_data: dict, s3_key: str,
+                       force_reprocess: bool = False) -> Optional[str]:
+        """
+        内容のハッシュを記録し、同じ内容の処理済みドキュメントがあれば処理結果を引き継ぐ
+
+        個別ページ処理のドキュメントは各ページのレコードも作成して引き継ぐ
+
+        Returns:
+            str: 引き継いだ元のドキュメントの画像ID（引き継がなかった場合はNone）
+        """
+        content_hash = compute_content_hash(self.bucket_name, s3_key)
+        update_content_hash(image_id, content_hash)
+        if force_reprocess:
+            logger.info(f"再処理が指定されたため重複チェックを省略します: {image_id}")
+            return None
+
+        page_processing_mode = image_data.get("page_processing_mode", "combined")
+        source = select_reusable_source(
+            find_images_by_content_hash(image_data.get("app_name", "default"), content_hash),
+            image_id, page_processing_mode)
+        if not source:
+            return None
+
+        children = get_children_by_parent_id(source["id"]) if page_processing_mode == "individual" else []
+        if any(child.get("status") not in _REUSABLE_STATUSES for child in children):
+            # 処理中・失敗したページはジョブなしで引き継ぐと進まなくなるため、通常どおり処理する
+            logger.info(f"処理が完了していないページがあるため引き継ぎません: {image_id} -> {source['id']}")
+            return None
+
+        logger.info(f"同じ内容の処理済みドキュメントが見つかりました: {image_id} -> {source['id']}")
+        pages = []
+        if page_processing_mode == "individual":
+            for child in children:
+                page_id = str(uuid.uuid4())
+                create_individual_page_record(
+                    page_id=page_id,
+                    parent_image_id=image_id,
+                    filename=image_data.get("filename"),
+                    converted_s3_key=child.get("converted_s3_key"),
+                    page_number=child.get("page_number"),
+                    total_pages=child.get("total_pages"),
+                    app_name=image_data.get("app_name"),
+                    original_size=child.get("original_size"),
+                    new_size=child.get("new_size")
+                )
+                link_duplicate_image(page_id, child)
+                pages.append({"id": page_id, "status": child.get("status")})
+        link_duplicate_image(image_id, source)
+
+        # 元のドキュメントがOCR前の場合は、設定に応じてOCRを開始する
+        if not pages and source.get("status") == "pending":
+            start_ocr_if_enabled(image_id)
+        for page in pages:
+            if page["status"] == "pending":
+                start_ocr_if_enabled(page["id"])
+
+        return source["id"]
+
+    def resize_uploaded_image(self, image_id: str, s3_key: str, filename: str, content_type: str) -> None:
+        """画像のリサイズと縮小画像の作成（失敗しても取り込みは続行する）"""
+        from PIL import Image
+
+        try:
+            # S3から画像を取得
+            s3_obj = get_s3_client().get_object(
+                Bucket=self.bucket_name,
+                Key=s3_key
+            )
+            image_data = s3_obj['Body'].read()
+
+            # デコードは1回だけ行い、リサイズと縮小画像の作成で共有する
+            img = Image.open(BytesIO(image_data))
+            resized_image_data, was_resized, orig_size, new_size = resize_image(
+                image_data, img=img)
+
+            display_s3_key = s3_key
+            if was_resized:
+                # リサイズされた画像をS3にアップロード
+                converted_s3_key = f"converted/{datetime.now().isoformat()}_{filename}"
+                get_s3_client().put_object(
+                    Bucket=self.bucket_name,
+                    Key=converted_s3_key,
+                    Body=resized_image_data,
+                    ContentType=content_type
+                )
+                logger.info(f"リサイズ画像をアップロードしました: {converted_s3_key}")
+                display_s3_key = converted_s3_key
+            else:
+                logger.info("リサイズは不要です。元の画像を使用します。")
+
+            # 一覧・プレビュー用の縮小画像を作成
+            image_tiers = None
+            if settings.ENABLE_IMAGE_TIERS:
+                image_tiers = create_image_tiers(img, self.bucket_name, display_s3_key)
+
+            # DynamoDBを更新
+            if was_resized:
+                update_converted_image(
+                    image_id,
+                    converted_s3_key,
+                    "pending",
+                    orig_size,
+                    new_size,
+                    content_type=content_type,
+                    image_tiers=image_tiers
+                )
+            elif image_tiers is not None:
+                update_image_tiers(image_id, image_tiers)
+        except Exception as e:
+            logger.error(f"画像リサイズエラー: {str(e)}")
+            # リサイズに失敗しても処理を続行
+
+
+def start_ocr_if_enabled(image_id: str) -> Optional[str]:
+    """
+    アップロード時のOCR自動開始が有効な場合、画像1件のOCR→情報抽出を開始する
+
+    Returns:
+        str: 作成したジョブID（開始しなかった場合はNone）
+    """
+    if not settings.AUTO_START_OCR_ON_UPLOAD:
+        return None
+
+    job_id = str(uuid.uuid4())
+    create_job(job_id, "processing")
+    update_image_status(image_id, "processing", job_id)
+    submit_task(
+        "process_image", {"image_id": image_id, "job_id": job_id},
+        dedup_key=f"process_image:{job_id}:{image_id}")
+    logger.info(f"アップロードされた画像のOCRを開始しました: {image_id}, job_id={job_id}")
+    return job_id
@@ -11,6 +11,8 @@ from database import (
 from schemas import OcrResult, OcrResultResponse
 from config import settings
 from background import BackgroundTaskExtension
+from clients import run_io, run_extraction
+from task_queue import submit_task
 from ocr import perform_ocr_multipage, perform_ocr_individual_page, perform_ocr_single_image
 
 logger = logging.getLogger(__name__)
@@ -68,17 +70,17 @@ class OcrService:
 
         try:
             # ジョブを作成
-            create_job(job_id, 'processing')
+            await run_io(create_job, job_id, 'processing')
 
             # 保留中の画像を取得（app_name指定時はGSIでquery、未指定時はscanで全件取得）
             if app_name:
                 # 特定アプリの画像のみをGSI経由で効率的に取得（DynamoDB scanの1MB制限を回避）
-                images_list = get_images(app_name)
+                images_list = await run_io(get_images, app_name)
                 logger.info(
                     f"アプリ '{app_name}' の画像を取得しました: {len(images_list)}件")
             else:
                 # 全アプリの画像を取得（小規模データ用、大量データがある場合は要注意）
-                images_list = get_images()
+                images_list = await run_io(get_images)
                 logger.warning(
                     "全アプリの画像をscanで取得中（大量データがある場合は処理が不完全になる可能性があります）")
 
@@ -87,17 +89,20 @@ class OcrService:
             # pendingステータスの画像のみを処理対象とする
             for image in images_list:
                 if image.get("status") == "pending":
-                    update_image_status(image.get("id"), "processing", job_id)
+                    await run_io(update_image_status, image.get("id"), "processing", job_id)
                     processing_images.append(image)
 
             # バックグラウンドタスクとしてOCR処理を実行
             if processing_images:
                 logger.info(
                     f"バックグラウンドタスクを開始します: job_id={job_id}, images={len(processing_images)}")
-                if self.background_task:
-                    # バックグラウンドタスクとして実行
-                    task_id = self.background_task.add_task(
-                        self._process_job_pipeline, job_id)
+                if self.background_task or settings.TASK_QUEUE_BACKEND != "inprocess":
+                    # タスクキュー（またはバックグラウンドタスク）に投入して実行
+                    task_id = await run_io(
+                        submit_task,
+                        "process_job", {"job_id": job_id},
+                        dedup_key=f"process_job:{job_id}",
+                        background_task=self.background_task)
                     logger.info(
                         f"Started OCR job {job_id} with task ID {task_id}")
                 else:
@@ -116,14 +121,14 @@ class OcrService:
     async def get_job_status(self, job_id: str) -> Dict[str, Any]:
         """ジョブステータスを取得する"""
         try:
-            return get_job(job_id)
+            return await run_io(get_job, job_id)
         except Exception as e:
             logger.error(f"Error getting job status: {str(e)}")
             raise
 
     async def get_ocr_result(self, image_id: str) -> OcrResultResponse:
         """OCR結果を取得する"""
-        image_data = get_image(image_id)
+        image_data = await run_io(get_image, image_id)
 
         if not image_data:
             raise ValueError("Image not found")
@@ -154,7 +159,7 @@ class OcrService:
 
     async def update_ocr_result(self, image_id: str, edited_ocr_data: dict) -> None:
         """OCR結果を更新する"""
-        db_update_ocr_result(image_id, edited_ocr_data)
+        await run_io(db_update_ocr_result, image_id, edited_ocr_data)
 
     def _process_job_pipeline(self, job_id: str) -> None:
         """バックグラウンドタスク用のジョブパイプライン処理"""
@@ -164,24 +169,54 @@ class OcrService:
             images = get_images_by_job_id(job_id)
             logger.info(f"Processing job {job_id} with {len(images)} images")
 
-            # 同時処理数を制限（例: 最大2枚ずつ処理）
-            batch_size = 2
-            for i in range(0, len(images), batch_size):
-                batch = images[i:i+batch_size]
-                logger.info(
-                    f"Processing batch {i//batch_size + 1} with {len(batch)} images")
+            # バッチ推論モードではOCRのみを先に行い、抽出はまとめてバッチ推論に投入する
+            if settings.ENABLE_BATCH_EXTRACTION:
+                self._process_job_batch(job_id, images)
+                return
 
-                for image in batch:
-                    image_id = image.get("id")
-                    # 新実装（ImageProcessingPipelineを直接使用）
-                    from services.image_processing_pipeline import ImageProcessingPipeline
-                    pipeline = ImageProcessingPipeline()
-                    pipeline.process_complete_pipeline(image_id)
+            # OCRと情報抽出をステージごとの同時実行数で並行に処理
+            from services.image_processing_pipeline import ImageProcessingPipeline
+            pipeline = ImageProcessingPipeline()
+            pipeline.process_images([image.get("id") for image in images])
 
         except Exception as e:
             logger.error(f"Error in background OCR processing: {str(e)}")
             raise
 
+    def _process_job_batch(self, job_id: str, images: list) -> None:
+        """
+        OCR後の情報抽出をバッチ推論でまとめて実行する
+
+        バッチ推論は完了まで数時間かかることがあるため、投入後は完了を待たずに戻る。
+        結果は収集API（POST /ocr/batch/{job_id}/collect）で取り込む
+        """
+        from batch_extraction import submit_batch_extraction
+        from services.extraction_service import ExtractionService
+        from services.image_processing_pipeline import ImageProcessingPipeline
+
+        # OCRのみをステージの同時実行数で並行に処理（失敗した画像は抽出対象から除外）
+        ocr_completed_ids = ImageProcessingPipeline().process_images(
+            [image.get("id") for image in images], extract=False)["ocr_completed"]
+
+        # バッチ推論に投入しなかった画像（件数不足など）は同期呼び出しで抽出する
+        sync_image_ids = submit_batch_extraction(ocr_completed_ids, job_id)
+        extraction_service = ExtractionService()
+        for image_id in sync_image_ids:
+            try:
+                extraction_service.extract_information(image_id)
+            except Exception as e:
+                logger.error(f"情報抽出に失敗しました: {image_id}, {str(e)}")
+
+        if len(sync_image_ids) < len(ocr_completed_ids):
+            logger.info(f"バッチ推論の結果は収集APIで取り込みます: job_id={job_id}")
+
+    async def collect_batch_extraction(self, job_id: str) -> Dict[str, Any]:
+        """バッチ推論の結果を取り込む（完了していない場合は状態のみ返す）"""
+        from batch_extraction import collect_batch_extraction
+
+        status = await run_extraction(collect_batch_extraction, job_id)
+        return {"job_id": job_id, "status": status}
+
     def process_image_ocr(self, image_id: str) -> None:
         """画像のOCR処理のみを実行"""
         try:
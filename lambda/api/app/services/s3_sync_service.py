@@ -1,13 +1,20 @@
-from clients import s3_client
+from clients import get_s3_client, run_io
 import logging
+import mimetypes
+import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Tuple
 from botocore.exceptions import ClientError
 
 from config import settings
 from app_schema import get_app_input_methods
-from database import create_image_record
+from database import (
+    create_image_record, build_image_record_item, batch_create_image_records,
+    get_existing_image_ids, create_job, get_job, update_job_progress, put_sync_manifest_entries, get_sync_manifest_entries
+)
+from task_queue import submit_task
 
 logger = logging.getLogger(__name__)
 
@@ -18,51 +25,49 @@ class S3SyncService:
     def __init__(self):
         self.bucket_name = settings.BUCKET_NAME
 
-    async def sync_s3_files(self, app_name: str, prefix: Optional[str] = None) -> Dict[str, Any]:
-        """S3バケットからファイルを同期する"""
-        try:
-            # アプリケーションの入力方法設定を取得
-            input_methods = get_app_input_methods(app_name)
-
-            # S3同期が有効かチェック
-            if not input_methods.get("s3_sync", False):
-                raise ValueError(f"S3同期はこのアプリケーションでは有効になっていません: {app_name}")
-
-            # S3 URIを取得
-            s3_uri = input_methods.get("s3_uri", "")
-
-            if not s3_uri:
-                raise ValueError(f"S3 URIが設定されていません: {app_name}")
-
-            # S3 URIを解析（s3://bucket-name/path/to/folder/）
-            if not s3_uri.startswith("s3://"):
-                raise ValueError(f"無効なS3 URI形式です: {s3_uri}")
+    async def sync_s3_files(self, app_name: str, prefix: Optional[str] = None,
+                            include_imported: bool = False) -> Dict[str, Any]:
+        """
+        S3バケットからファイルを同期する
 
-            # s3://を削除
-            s3_uri_without_prefix = s3_uri[5:]
-
-            # バケット名とパスに分割
-            parts = s3_uri_without_prefix.split('/', 1)
-            bucket_name = parts[0]
-            # パスが指定されていない場合は空文字列をデフォルトとする
-            s3_path = parts[1] if len(parts) > 1 else ""
+        同期マニフェストに記録済みのオブジェクト（キーとETagが同じもの）は除外し、
+        新規・変更されたファイルのみを返す。include_importedを指定した場合は全件を返す
+        """
+        try:
+            bucket_name, s3_path = await self._resolve_source(app_name, prefix)
 
-            # 指定されたプレフィックスがある場合は使用
-            if prefix:
-                s3_path = prefix
+            # 取り込み済みのキーと前回の最終更新日時（ウォーターマーク）を取得
+            manifest = await run_io(self.load_manifest, app_name, bucket_name)
+            imported = manifest["imported"]
 
-            # S3からファイル一覧を取得
-            files = await self._list_s3_files(bucket_name, s3_path)
+            # S3からファイル一覧を取得し、差分のみに絞り込む
+            files = []
+            skipped = 0
+            for file in await self._list_s3_files(bucket_name, s3_path):
+                imported_etag = imported.get(file["key"])
+                if imported_etag is None:
+                    file["sync_status"] = "new"
+                elif imported_etag != file["etag"]:
+                    file["sync_status"] = "changed"
+                elif include_imported:
+                    file["sync_status"] = "imported"
+                else:
+                    skipped += 1
+                    continue
+                files.append(file)
 
             logger.info(
-                f"Found {len(files)} files in S3 bucket {bucket_name}/{s3_path}")
+                f"Found {len(files)} new or changed files in S3 bucket {bucket_name}/{s3_path} "
+                f"({skipped} already imported)")
 
             return {
                 "status": "success",
                 "bucket_name": bucket_name,
                 "s3_path": s3_path,
                 "files": files,
-                "total_files": len(files)
+                "total_files": len(files),
+                "skipped_files": skipped,
+                "watermark": manifest.get("watermark")
             }
 
         except Exception as e:
@@ -73,7 +78,7 @@ class S3SyncService:
         """S3バケットからファイルをインポートしてOCR処理を開始する"""
         try:
             # アプリケーションの入力方法設定を取得
-            input_methods = get_app_input_methods(app_name)
+            input_methods = await run_io(get_app_input_methods, app_name)
 
             # S3同期が有効かチェック
             if not input_methods.get("s3_sync", False):
@@ -103,14 +108,19 @@ class S3SyncService:
             await self._copy_s3_file(source_bucket, source_key, destination_key)
 
             # DynamoDBにレコードを作成
-            create_image_record(
+            await run_io(
+                create_image_record,
                 image_id=image_id,
                 filename=filename,
                 s3_key=destination_key,
                 app_name=app_name,
-                status="uploaded"
+                status="uploaded",
+                content_type=mimetypes.guess_type(filename)[0]
             )
 
+            # 同期マニフェストに記録し、次回以降の同期結果から除外する
+            await run_io(self.record_imported_objects, app_name, source_bucket, [file_data])
+
             logger.info(f"Imported S3 file {source_key} as image {image_id}")
 
             return {
@@ -123,11 +133,249 @@ class S3SyncService:
             logger.error(f"Error importing S3 file: {str(e)}")
             raise
 
+    async def _resolve_source(self, app_name: str, prefix: Optional[str] = None) -> Tuple[str, str]:
+        """アプリのS3同期設定から同期元のバケット名とパスを取得する"""
+        # アプリケーションの入力方法設定を取得
+        input_methods = await run_io(get_app_input_methods, app_name)
+
+        # S3同期が有効かチェック
+        if not input_methods.get("s3_sync", False):
+            raise ValueError(f"S3同期はこのアプリケーションでは有効になっていません: {app_name}")
+
+        # S3 URIを取得
+        s3_uri = input_methods.get("s3_uri", "")
+
+        if not s3_uri:
+            raise ValueError(f"S3 URIが設定されていません: {app_name}")
+
+        # S3 URIを解析（s3://bucket-name/path/to/folder/）
+        if not s3_uri.startswith("s3://"):
+            raise ValueError(f"無効なS3 URI形式です: {s3_uri}")
+
+        # s3://を削除
+        s3_uri_without_prefix = s3_uri[5:]
+
+        # バケット名とパスに分割
+        parts = s3_uri_without_prefix.split('/', 1)
+        bucket_name = parts[0]
+        # パスが指定されていない場合は空文字列をデフォルトとする
+        s3_path = parts[1] if len(parts) > 1 else ""
+
+        # 指定されたプレフィックスがある場合は使用
+        if prefix:
+            s3_path = prefix
+
+        return bucket_name, s3_path
+
+    async def start_bulk_import(self, app_name: str, prefix: Optional[str] = None,
+                                background_task=None) -> Dict[str, Any]:
+        """
+        S3フォルダ内のファイルをまとめてインポートするジョブを開始する
+
+        コピーとレコード作成はタスクキューで実行し、一覧のページごとに
+        チェックポイントを保存するため、中断しても続きから再開できる
+        """
+        try:
+            bucket_name, s3_path = await self._resolve_source(app_name, prefix)
+
+            import_id = str(uuid.uuid4())
+            progress = {
+                "app_name": app_name,
+                "bucket_name": bucket_name,
+                "s3_path": s3_path,
+                "continuation_token": None,
+                "pages": 0,
+                "imported": 0,
+                "failed": 0
+            }
+            await run_io(create_job, import_id, "importing")
+            await run_io(update_job_progress, import_id, "importing", progress)
+
+            await run_io(
+                submit_task,
+                "bulk_import_s3", {"import_id": import_id},
+                dedup_key=f"bulk_import_s3:{import_id}:0",
+                background_task=background_task)
+
+            logger.info(
+                f"Started bulk S3 import {import_id} from {bucket_name}/{s3_path}")
+
+            return {
+                "status": "importing",
+                "import_id": import_id,
+                "bucket_name": bucket_name,
+                "s3_path": s3_path
+            }
+
+        except Exception as e:
+            logger.error(f"Error starting bulk S3 import: {str(e)}")
+            raise
+
+    async def resume_bulk_import(self, import_id: str, background_task=None) -> Dict[str, Any]:
+        """
+        停止した一括インポートをチェックポイントから再開する
+
+        実行中のタスクが失われた場合（inprocessの実行環境の終了など）に使用する。
+        進捗が一定時間更新されていない場合のみ続きのタスクを投入する
+
+        Returns:
+            dict: 一括インポートの進捗と再開したかどうか（resumed）
+        """
+        job = await run_io(get_job, import_id)
+        result = self._bulk_import_status(import_id, job)
+        if job.get("status") != "importing":
+            logger.info(f"一括インポートは終了済みのため再開しません: {import_id} (status: {job.get('status')})")
+            return {**result, "resumed": False}
+
+        updated_at = job.get("updated_at") or job.get("created_at")
+        if updated_at:
+            idle_seconds = (datetime.now() - datetime.fromisoformat(updated_at)).total_seconds()
+            if idle_seconds < settings.S3_IMPORT_RESUME_AFTER_SECONDS:
+                logger.info(f"一括インポートは実行中のため再開しません: {import_id} ({idle_seconds:.0f}秒前に更新)")
+                return {**result, "resumed": False}
+
+        # 続きのタスクと同じキーで投入する（チェックポイントのタスクが残っていれば重複しない）
+        await run_io(
+            submit_task,
+            "bulk_import_s3", {"import_id": import_id},
+            dedup_key=f"bulk_import_s3:{import_id}:{result['pages']}",
+            background_task=background_task)
+        logger.info(f"一括インポートを再開しました: {import_id} (pages: {result['pages']})")
+        return {**result, "resumed": True}
+
+    async def get_bulk_import_status(self, import_id: str) -> Dict[str, Any]:
+        """一括インポートの進捗を取得する"""
+        job = await run_io(get_job, import_id)
+        return self._bulk_import_status(import_id, job)
+
+    @staticmethod
+    def _bulk_import_status(import_id: str, job: dict) -> Dict[str, Any]:
+        """ジョブ情報から一括インポートの進捗を作成する"""
+        progress = job.get("progress", {})
+        return {
+            "import_id": import_id,
+            "status": job.get("status"),
+            "pages": int(progress.get("pages", 0)),
+            "imported": int(progress.get("imported", 0)),
+            "failed": int(progress.get("failed", 0)),
+            "updated_at": job.get("updated_at")
+        }
+
+    def run_bulk_import(self, import_id: str) -> None:
+        """
+        一括インポートをチェックポイントから再開して実行する（タスクハンドラー用）
+
+        一覧1ページ分のオブジェクトを並列にコピーし、レコードをbatch_writerでまとめて書き込んでから
+        次ページの位置を保存する。画像IDとコピー先キーはインポートIDとキーから決まるため、
+        途中で中断したページをやり直しても重複しない（作成済みのレコードはOCRなどの処理が
+        進んでいる可能性があるため、コピーも上書きもしない）。
+        1回のタスクの時間上限に近づいたら続きのタスクを投入して終了する
+        """
+        job = get_job(import_id)
+        if job.get("status") != "importing":
+            logger.info(f"一括インポートは終了済みのため省略します: {import_id} (status: {job.get('status')})")
+            return
+
+        progress = dict(job.get("progress", {}))
+        deadline = time.monotonic() + settings.S3_IMPORT_MAX_SECONDS_PER_TASK
+
+        with ThreadPoolExecutor(max_workers=settings.S3_IMPORT_CONCURRENCY) as executor:
+            while True:
+                params = {
+                    "Bucket": progress["bucket_name"],
+                    "Prefix": progress["s3_path"],
+                    "MaxKeys": settings.S3_IMPORT_PAGE_SIZE
+                }
+                if progress.get("continuation_token"):
+                    params["ContinuationToken"] = progress["continuation_token"]
+                page = get_s3_client().list_objects_v2(**params)
+
+                # ファイルのみを対象とする（フォルダは除外）
+                objects = [obj for obj in page.get("Contents", []) if not obj["Key"].endswith('/')]
+                image_ids = [self._bulk_import_image_id(import_id, progress["bucket_name"], obj["Key"])
+                             for obj in objects]
+                existing_ids = get_existing_image_ids(image_ids)
+                pending = [(obj, image_id) for obj, image_id in zip(objects, image_ids)
+                           if image_id not in existing_ids]
+                results = list(executor.map(
+                    lambda args: self._import_object(progress, *args), pending))
+                items = [item for item in results if item]
+                batch_create_image_records(items)
+
+                imported_objects = [obj for obj, image_id in zip(objects, image_ids) if image_id in existing_ids]
+                imported_objects += [obj for (obj, _), item in zip(pending, results) if item]
+                self.record_imported_objects(
+                    progress["app_name"], progress["bucket_name"],
+                    [self._to_file(progress["bucket_name"], obj) for obj in imported_objects])
+
+                progress["pages"] = int(progress.get("pages", 0)) + 1
+                progress["imported"] = int(progress.get("imported", 0)) + len(imported_objects)
+                progress["failed"] = int(progress.get("failed", 0)) + len(objects) - len(imported_objects)
+                progress["continuation_token"] = page.get("NextContinuationToken")
+
+                if not page.get("IsTruncated"):
+                    update_job_progress(import_id, "completed", progress)
+                    logger.info(
+                        f"一括インポートが完了しました: {import_id} "
+                        f"(imported: {progress['imported']}, failed: {progress['failed']})")
+                    return
+
+                update_job_progress(import_id, "importing", progress)
+
+                if time.monotonic() >= deadline:
+                    submit_task(
+                        "bulk_import_s3", {"import_id": import_id},
+                        dedup_key=f"bulk_import_s3:{import_id}:{progress['pages']}")
+                    logger.info(
+                        f"一括インポートを続きのタスクに引き継ぎます: {import_id} (pages: {progress['pages']})")
+                    return
+
+    @staticmethod
+    def _bulk_import_image_id(import_id: str, source_bucket: str, source_key: str) -> str:
+        """一括インポートで作成する画像ID（インポートIDと同期元のキーから決まる）"""
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{import_id}:s3://{source_bucket}/{source_key}"))
+
+    def _import_object(self, progress: dict, obj: dict, image_id: str) -> Optional[Dict[str, Any]]:
+        """オブジェクト1件をコピーし、作成する画像レコードを返す（失敗時はNone）"""
+        source_bucket = progress["bucket_name"]
+        source_key = obj["Key"]
+        filename = source_key.split('/')[-1]
+        destination_key = f"s3-imports/{image_id}_{filename}"
+
+        try:
+            copy_source = {'Bucket': source_bucket, 'Key': source_key}
+            if obj.get("Size", 0) >= settings.S3_IMPORT_MULTIPART_THRESHOLD:
+                # 大きいファイルはパートごとに並行してコピーする
+                from boto3.s3.transfer import TransferConfig
+                get_s3_client().copy(
+                    copy_source, self.bucket_name, destination_key,
+                    Config=TransferConfig(multipart_threshold=settings.S3_IMPORT_MULTIPART_THRESHOLD))
+            else:
+                get_s3_client().copy_object(
+                    CopySource=copy_source, Bucket=self.bucket_name, Key=destination_key)
+        except Exception as e:
+            logger.error(f"Error copying S3 file {source_bucket}/{source_key}: {str(e)}")
+            return None
+
+        return build_image_record_item(
+            image_id=image_id,
+            filename=filename,
+            s3_key=destination_key,
+            app_name=progress["app_name"],
+            status="uploaded",
+            content_type=mimetypes.guess_type(filename)[0]
+        )
+
     async def _list_s3_files(self, bucket_name: str, prefix: str) -> List[Dict[str, Any]]:
         """S3バケットからファイル一覧を取得する"""
+        # ページ送りの各リクエストもブロッキングのため、一覧取得全体をスレッドプールで実行
+        return await run_io(self._list_s3_files_sync, bucket_name, prefix)
+
+    def _list_s3_files_sync(self, bucket_name: str, prefix: str) -> List[Dict[str, Any]]:
+        """S3バケットからファイル一覧を取得する（同期版）"""
         try:
             files = []
-            paginator = s3_client.get_paginator('list_objects_v2')
+            paginator = get_s3_client().get_paginator('list_objects_v2')
 
             page_iterator = paginator.paginate(
                 Bucket=bucket_name,
@@ -139,13 +387,7 @@ class S3SyncService:
                     for obj in page['Contents']:
                         # ファイルのみを対象とする（フォルダは除外）
                         if not obj['Key'].endswith('/'):
-                            files.append({
-                                "key": obj['Key'],
-                                "filename": obj['Key'].split('/')[-1],
-                                "size": obj['Size'],
-                                "last_modified": obj['LastModified'].isoformat(),
-                                "bucket": bucket_name
-                            })
+                            files.append(self._to_file(bucket_name, obj))
 
             return files
 
@@ -153,6 +395,61 @@ class S3SyncService:
             logger.error(f"Error listing S3 files: {str(e)}")
             raise ValueError(f"S3バケットへのアクセスに失敗しました: {str(e)}")
 
+    @staticmethod
+    def _to_file(bucket_name: str, obj: dict) -> Dict[str, Any]:
+        """list_objects_v2のオブジェクトを同期結果のファイル情報に変換する"""
+        return {
+            "key": obj['Key'],
+            "filename": obj['Key'].split('/')[-1],
+            "size": obj['Size'],
+            "last_modified": obj['LastModified'].isoformat(),
+            "etag": obj.get('ETag', '').strip('"'),
+            "bucket": bucket_name
+        }
+
+    def load_manifest(self, app_name: str, bucket_name: str) -> Dict[str, Any]:
+        """
+        アプリの同期マニフェストを取得する
+
+        マニフェストには取り込み済みオブジェクトのキーとETag、最後に取り込んだオブジェクトの
+        ウォーターマーク（キー・ETag・最終更新日時）を含める。
+        取り込み済みのオブジェクトは同期元のバケットごとに記録しているため、
+        同期元のバケットが変わった場合は空のマニフェストになる
+
+        Args:
+            app_name (str): アプリケーション名
+            bucket_name (str): 同期元のバケット名
+
+        Returns:
+            dict: 同期マニフェスト
+        """
+        imported = {}
+        watermark = None
+        for entry in get_sync_manifest_entries(app_name, bucket_name):
+            imported[entry["key"]] = entry.get("etag", "")
+            last_modified = entry.get("last_modified", "")
+            if not watermark or last_modified >= watermark["last_modified"]:
+                watermark = {
+                    "key": entry["key"],
+                    "etag": entry.get("etag", ""),
+                    "last_modified": last_modified
+                }
+        return {"bucket_name": bucket_name, "imported": imported, "watermark": watermark}
+
+    def record_imported_objects(self, app_name: str, bucket_name: str, files: List[Dict[str, Any]]) -> None:
+        """
+        取り込んだオブジェクトを同期マニフェストに記録する
+
+        オブジェクトごとのアイテムを書き込むだけなので、単発インポートと一括インポートが
+        別のプロセスで同時に記録しても互いの記録は失われない
+
+        Args:
+            app_name (str): アプリケーション名
+            bucket_name (str): 同期元のバケット名
+            files (list): 取り込んだファイル情報（key・etag・last_modified）
+        """
+        put_sync_manifest_entries(app_name, bucket_name, files)
+
     async def _copy_s3_file(self, source_bucket: str, source_key: str, destination_key: str) -> None:
         """S3ファイルを自分のバケットにコピーする"""
         try:
@@ -161,7 +458,8 @@ class S3SyncService:
                 'Key': source_key
             }
 
-            s3_client.copy_object(
+            await run_io(
+                get_s3_client().copy_object,
                 CopySource=copy_source,
                 Bucket=self.bucket_name,
                 Key=destination_key
@@ -1,4 +1,4 @@
-from clients import s3_client
+from clients import get_s3_client, run_io
 import logging
 import uuid
 from datetime import datetime
@@ -26,7 +26,7 @@ class SchemaService:
     async def get_apps_list(self) -> Dict[str, Any]:
         """アプリ一覧を取得する"""
         try:
-            return get_app_schemas()
+            return await run_io(get_app_schemas)
         except Exception as e:
             logger.error(f"Error getting apps list: {str(e)}")
             raise
@@ -34,7 +34,7 @@ class SchemaService:
     async def get_app_details(self, app_name: str) -> Dict[str, Any]:
         """アプリ詳細を取得する"""
         try:
-            app_schemas = get_app_schemas()
+            app_schemas = await run_io(get_app_schemas)
             for app in app_schemas.get("apps", []):
                 if app["name"] == app_name:
                     return app
@@ -46,8 +46,8 @@ class SchemaService:
     async def get_app_fields(self, app_name: str) -> Dict[str, Any]:
         """アプリのフィールド一覧を取得する"""
         try:
-            extraction_fields = get_extraction_fields_for_app(app_name)
-            field_names = get_field_names_for_app(app_name)
+            extraction_fields = await run_io(get_extraction_fields_for_app, app_name)
+            field_names = await run_io(get_field_names_for_app, app_name)
 
             return {
                 "app_name": app_name,
@@ -61,7 +61,7 @@ class SchemaService:
     async def get_custom_prompt(self, app_name: str) -> Dict[str, str]:
         """カスタムプロンプトを取得する"""
         try:
-            custom_prompt = get_custom_prompt_for_app(app_name)
+            custom_prompt = await run_io(get_custom_prompt_for_app, app_name)
             return {"custom_prompt": custom_prompt}
         except Exception as e:
             logger.error(f"Error getting custom prompt: {str(e)}")
@@ -71,7 +71,7 @@ class SchemaService:
         """カスタムプロンプトを更新する"""
         try:
             # 既存のアプリスキーマを取得
-            app_schema = get_app_schema(app_name)
+            app_schema = await run_io(get_app_schema, app_name)
             if not app_schema:
                 raise ValueError(f"App '{app_name}' not found")
 
@@ -79,7 +79,7 @@ class SchemaService:
             app_schema["custom_prompt"] = request.custom_prompt
 
             # スキーマを保存
-            update_app_schema(app_name, app_schema)
+            await run_io(update_app_schema, app_name, app_schema)
 
             logger.info(f"Updated custom prompt for app {app_name}")
         except Exception as e:
@@ -100,7 +100,7 @@ class SchemaService:
                     raise ValueError(f"必須フィールドがありません: {field}")
 
             # アプリスキーマを更新
-            update_app_schema(app_name, app_data)
+            await run_io(update_app_schema, app_name, app_data)
 
             logger.info(f"Created/updated app: {app_name}")
             return {"status": "success", "message": f"アプリ '{app_name}' を作成/更新しました"}
@@ -111,7 +111,7 @@ class SchemaService:
     async def delete_app(self, app_name: str) -> None:
         """アプリを削除する"""
         try:
-            delete_app_schema(app_name)
+            await run_io(delete_app_schema, app_name)
             logger.info(f"Deleted app: {app_name}")
         except Exception as e:
             logger.error(f"Error deleting app: {str(e)}")
@@ -147,7 +147,7 @@ class SchemaService:
             }
 
             # スキーマを保存
-            update_app_schema(request.name, app_data)
+            await run_io(update_app_schema, request.name, app_data)
 
             logger.info(f"Saved schema for app: {request.name}")
             return {"status": "success", "message": "スキーマが正常に保存されました"}
@@ -163,7 +163,7 @@ class SchemaService:
             s3_key = f"schema-uploads/{datetime.now().isoformat()}_{request.filename}"
 
             # 署名付きURLの生成（有効期限は15分）
-            presigned_url = s3_client.generate_presigned_url(
+            presigned_url = get_s3_client().generate_presigned_url(
                 'put_object',
                 Params={
                     'Bucket': self.bucket_name,
@@ -190,11 +190,12 @@ class SchemaService:
         try:
             # S3からファイルを取得
             try:
-                s3_response = s3_client.get_object(
+                s3_response = await run_io(
+                    get_s3_client().get_object,
                     Bucket=settings.BUCKET_NAME,
                     Key=request.s3_key
                 )
-                file_data = s3_response['Body'].read()
+                file_data = await run_io(s3_response['Body'].read)
             except Exception as e:
                 logger.error(f"S3からのファイル取得エラー: {str(e)}")
                 raise ValueError("ファイルが見つかりません")
@@ -227,7 +228,8 @@ class SchemaService:
                     "サポートされていないファイル形式です。JPG、PNG、GIF、PDFのみ対応しています。")
 
             # スキーマフィールドを生成
-            schema = generate_schema_fields_from_image(
+            schema = await run_io(
+                generate_schema_fields_from_image,
                 file_data,
                 request.instructions
             )
@@ -272,7 +274,7 @@ class SchemaService:
             }
 
             # スキーマを更新
-            update_app_schema(app_name, app_data)
+            await run_io(update_app_schema, app_name, app_data)
 
             logger.info(f"Updated schema for app: {app_name}")
             return {"status": "success", "message": f"アプリ '{app_name}' を更新しました"}
@@ -1,20 +1,24 @@
-from clients import s3_client
+from clients import get_s3_client, run_io
 import uuid
 import logging
+import mimetypes
 from datetime import datetime
-from typing import Dict, Any
-from fastapi.responses import StreamingResponse
-import io
+import re
+from typing import Dict, Any, Optional
+from botocore.exceptions import ClientError
+from fastapi.responses import Response, StreamingResponse
 
 from database import (
-    create_image_record, get_image, get_images, update_image_status, update_converted_image
+    create_image_record, get_image, get_images
 )
 from schemas import (
     PresignedUrlRequest, PresignedUrlResponse, UploadCompleteRequest
 )
 from config import settings
-from utils import resize_image, convert_pdf_to_image
+from utils.cache import TTLCache
+from utils.helpers import image_tier_s3_key
 from app_schema import get_app_schemas, get_app_input_methods
+from services.ingestion_service import IngestionService
 
 logger = logging.getLogger(__name__)
 
@@ -22,6 +26,15 @@ logger = logging.getLogger(__name__)
 
 DEFAULT_APP = "default"
 
+# 単一の範囲指定（bytes=開始-終了 / bytes=開始- / bytes=-末尾からのバイト数）
+_SINGLE_BYTE_RANGE_PATTERN = re.compile(r"^bytes=(\d+-\d*|-\d+)$")
+
+# ダウンロード用署名付きURLのキャッシュ（URLの有効期限より十分短いTTLで保持する）
+download_url_cache = TTLCache(
+    max_entries=settings.DOWNLOAD_URL_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.DOWNLOAD_URL_CACHE_SECONDS
+)
+
 
 class UploadService:
     """アップロード処理を管理するサービスクラス"""
@@ -34,7 +47,7 @@ class UploadService:
         try:
             # app_nameのバリデーション
             valid_app = False
-            app_schemas = get_app_schemas()
+            app_schemas = await run_io(get_app_schemas)
             for app in app_schemas.get("apps", []):
                 if app["name"] == request.app_name:
                     valid_app = True
@@ -46,7 +59,7 @@ class UploadService:
                 request.app_name = DEFAULT_APP
 
             # アプリケーションの入力方法設定を取得
-            input_methods = get_app_input_methods(request.app_name)
+            input_methods = await run_io(get_app_input_methods, request.app_name)
 
             # ファイルアップロードが有効かチェック
             if not input_methods.get("file_upload", True):
@@ -58,7 +71,7 @@ class UploadService:
             s3_key = f"uploads/{image_id}_{datetime.now().isoformat()}_{request.filename}"
 
             # 署名付きURLの生成（有効期限は15分）
-            presigned_url = s3_client.generate_presigned_url(
+            presigned_url = get_s3_client().generate_presigned_url(
                 'put_object',
                 Params={
                     'Bucket': self.bucket_name,
@@ -69,13 +82,16 @@ class UploadService:
             )
 
             # DynamoDBにレコードを作成
-            create_image_record(
+            await run_io(
+                create_image_record,
                 image_id=image_id,
                 filename=request.filename,
                 s3_key=s3_key,
                 app_name=request.app_name,
                 status="uploading",  # アップロード中ステータスを設定
-                page_processing_mode=request.page_processing_mode  # 追加
+                page_processing_mode=request.page_processing_mode,  # 追加
+                content_type=request.content_type,
+                force_reprocess=request.force_reprocess
             )
 
             logger.info(
@@ -92,141 +108,126 @@ class UploadService:
             raise
 
     async def handle_upload_complete(self, request: UploadCompleteRequest) -> Dict[str, Any]:
-        """アップロード完了を処理する"""
+        """
+        アップロード完了を処理する
+
+        S3イベントによる取り込みと同じ処理を行う（同じオブジェクトの取り込みは1回だけ行われる）
+        """
         try:
             # S3オブジェクトの存在確認
             try:
-                s3_response = s3_client.head_object(
+                s3_response = await run_io(
+                    get_s3_client().head_object,
                     Bucket=settings.BUCKET_NAME,
                     Key=request.s3_key
                 )
-                content_type = s3_response.get(
-                    'ContentType', 'application/octet-stream')
             except Exception as e:
                 logger.error(f"S3 object not found: {str(e)}")
                 raise ValueError("File not found in S3")
 
-            # ファイル種別を判定
-            is_image = content_type.startswith('image/')
-            is_pdf = content_type == 'application/pdf' or request.filename.lower().endswith('.pdf')
-
-            if is_image:
-                # 画像ファイルの場合はリサイズ処理
-                await self._handle_image_resize(request, content_type)
-
-            # PDFファイルの場合は変換処理を開始
-            if is_pdf:
-                return await self._handle_pdf_conversion(request)
-            else:
-                # 画像ファイルの場合はそのまま処理待ちに
-                update_image_status(request.image_id, "pending")
-                return {
-                    "status": "success",
-                    "message": "Upload completed successfully",
-                    "image_id": request.image_id,
-                    "is_converting": False
-                }
+            # 取り込み処理（S3イベントで取り込み済みの場合は何もしない）
+            return await run_io(
+                IngestionService().ingest_object,
+                request.image_id,
+                request.s3_key,
+                etag=s3_response.get('ETag', ''),
+                filename=request.filename,
+                force_reprocess=request.force_reprocess
+            )
 
         except Exception as e:
             logger.error(f"Error handling upload complete: {str(e)}")
             raise
 
-    async def _handle_image_resize(self, request: UploadCompleteRequest, content_type: str) -> None:
-        """画像のリサイズ処理"""
-        try:
-            # S3から画像を取得
-            s3_obj = s3_client.get_object(
-                Bucket=settings.BUCKET_NAME,
-                Key=request.s3_key
-            )
-            image_data = s3_obj['Body'].read()
-
-            # 画像をリサイズ（resize_image関数が存在する場合）
-            try:
-                resized_image_data, was_resized, orig_size, new_size = resize_image(
-                    image_data)
-
-                if was_resized:
-                    # リサイズされた画像をS3にアップロード
-                    converted_s3_key = f"converted/{datetime.now().isoformat()}_{request.filename}"
-                    s3_client.put_object(
-                        Bucket=settings.BUCKET_NAME,
-                        Key=converted_s3_key,
-                        Body=resized_image_data,
-                        ContentType=content_type
-                    )
-                    logger.info(f"リサイズ画像をアップロードしました: {converted_s3_key}")
-
-                    # DynamoDBを更新
-                    update_converted_image(
-                        request.image_id,
-                        converted_s3_key,
-                        "pending",
-                        orig_size,
-                        new_size
-                    )
-                else:
-                    logger.info("リサイズは不要です。元の画像を使用します。")
-            except ImportError:
-                logger.info(
-                    "resize_image function not available, skipping resize")
-        except Exception as e:
-            logger.error(f"画像リサイズエラー: {str(e)}")
-            # リサイズに失敗しても処理を続行
+    async def get_image_stream(self, image_id: str, range_header: Optional[str] = None,
+                               if_none_match: Optional[str] = None, tier: Optional[str] = None) -> Response:
+        """
+        画像をストリーミングで返す
 
-    async def _handle_pdf_conversion(self, request: UploadCompleteRequest) -> Dict[str, Any]:
-        """PDF変換処理"""
-        try:
-            # ステータスを変換中に更新
-            update_image_status(request.image_id, "converting")
-
-            # バックグラウンドタスクとして変換処理を実行
-            from main import background_task
-            task_id = background_task.add_task(
-                convert_pdf_to_image,
-                request.image_id,
-                request.s3_key
-            )
-            logger.info(
-                f"Started PDF conversion task {task_id} for image {request.image_id}")
+        RangeヘッダーとIf-None-MatchヘッダーはS3の範囲指定GET・条件付きGETにそのまま渡し、
+        S3のETagをレスポンスに付与する。本文は一定サイズのチャンクごとに転送する
 
-            return {
-                "status": "success",
-                "message": "Upload completed, PDF conversion started",
-                "image_id": request.image_id,
-                "is_converting": True
-            }
-        except Exception as e:
-            logger.error(f"PDF conversion setup error: {str(e)}")
-            raise
+        Args:
+            image_id (str): 画像ID
+            range_header (str, optional): リクエストのRangeヘッダー（単一範囲のみ対応）
+            if_none_match (str, optional): リクエストのIf-None-Matchヘッダー
+            tier (str, optional): 縮小画像の階層（thumbnail / preview、未作成・取得できない場合は元画像を返す）
 
-    async def get_image_stream(self, image_id: str) -> StreamingResponse:
-        """画像をストリーミングで返す"""
+        Returns:
+            Response: 画像のレスポンス（未変更の場合は304、範囲指定の場合は206）
+        """
         try:
             # 画像情報を取得
-            image_data = get_image(image_id)
+            image_data = await run_io(get_image, image_id)
             if not image_data:
                 raise ValueError("Image not found")
 
-            s3_key = image_data.get("s3_key")
-            if isinstance(s3_key, list):
-                s3_key = s3_key[0]  # リストの場合は最初の要素
-
-            # S3から画像を取得
-            s3_response = s3_client.get_object(
-                Bucket=self.bucket_name, Key=s3_key)
-            image_data_bytes = s3_response['Body'].read()
+            image_s3_key = image_data.get("s3_key")
+            if isinstance(image_s3_key, list):
+                image_s3_key = image_s3_key[0]  # リストの場合は最初の要素
+            s3_key = image_s3_key
+            if tier and tier in image_data.get("image_tiers", []):
+                # 縮小画像は変換後の画像（PDFは1ページ目）のキーから作成している
+                tier_source_key = image_data.get("converted_s3_key") or image_s3_key
+                if isinstance(tier_source_key, list):
+                    tier_source_key = tier_source_key[0]
+                s3_key = image_tier_s3_key(tier_source_key, tier)
+
+            params = {"Bucket": self.bucket_name, "Key": s3_key}
+            # S3は単一範囲のみ対応のため、それ以外の指定は無視して全体を返す
+            if range_header and _SINGLE_BYTE_RANGE_PATTERN.match(range_header.strip()):
+                params["Range"] = range_header.strip()
+            if if_none_match:
+                params["IfNoneMatch"] = if_none_match
+
+            # S3から画像を取得（縮小画像が見つからない場合は元画像を取得し直す）
+            s3_response = None
+            while s3_response is None:
+                try:
+                    s3_response = await run_io(get_s3_client().get_object, **params)
+                except ClientError as e:
+                    metadata = e.response.get("ResponseMetadata", {})
+                    status_code = metadata.get("HTTPStatusCode")
+                    headers = metadata.get("HTTPHeaders", {})
+                    if status_code == 304:
+                        # 変更なし（クライアントのキャッシュをそのまま使用させる）
+                        return Response(status_code=304, headers={
+                            "ETag": headers.get("etag", if_none_match),
+                            "Cache-Control": "private, no-cache"
+                        })
+                    if status_code == 416:
+                        return Response(status_code=416, headers={
+                            "Content-Range": headers.get("content-range", "bytes */*")
+                        })
+                    if params["Key"] != image_s3_key and (
+                            status_code == 404 or e.response.get("Error", {}).get("Code") == "NoSuchKey"):
+                        logger.warning(f"縮小画像が見つからないため元画像を返します: {params['Key']}")
+                        params["Key"] = image_s3_key
+                        continue
+                    raise
 
             # Content-Typeを推定
             content_type = s3_response.get(
                 'ContentType', 'application/octet-stream')
 
-            # ストリーミングレスポンスを作成
+            headers = {
+                "Content-Disposition": f"inline; filename={image_data.get('filename', 'image')}",
+                "Accept-Ranges": "bytes",
+                # キャッシュは保持させ、再利用時はETagで再検証させる
+                "Cache-Control": "private, no-cache",
+                "Content-Length": str(s3_response.get("ContentLength", 0))
+            }
+            if s3_response.get("ETag"):
+                headers["ETag"] = s3_response["ETag"]
+            if s3_response.get("ContentRange"):
+                headers["Content-Range"] = s3_response["ContentRange"]
+
+            # ストリーミングレスポンスを作成（全体をメモリに読み込まずチャンク単位で転送）
             return StreamingResponse(
-                io.BytesIO(image_data_bytes),
+                s3_response['Body'].iter_chunks(chunk_size=settings.IMAGE_STREAM_CHUNK_SIZE),
+                status_code=206 if s3_response.get("ContentRange") else 200,
                 media_type=content_type,
-                headers={
-                    "Content-Disposition": f"inline; filename={image_data.get('filename', 'image')}"}
+                headers=headers
             )
 
         except Exception as e:
@@ -237,7 +238,7 @@ class UploadService:
         """ダウンロード用の署名付きURLを生成する（複数ページ対応）"""
         try:
             # 画像情報を取得
-            image_data = get_image(image_id)
+            image_data = await run_io(get_image, image_id)
             if not image_data:
                 raise ValueError("Image not found")
 
@@ -268,27 +269,25 @@ class UploadService:
             else:
                 raise ValueError("Image file not found")
 
-            # 複数ページの署名付きURLを生成
-            presigned_urls = []
-            main_presigned_url = None
-            main_content_type = 'application/octet-stream'
+            # Content-Typeは書き込み時に保存した値を使用（古いレコードは拡張子から推定）
+            stored_content_type = image_data.get("content_type")
+            target_s3_keys = [s3_key for s3_key in target_s3_keys if s3_key]
 
-            for i, s3_key in enumerate(target_s3_keys):
-                if not s3_key:
-                    continue
+            image_tiers = image_data.get("image_tiers") or []
 
-                # S3オブジェクトのContent-Typeを取得
-                try:
-                    s3_response = s3_client.head_object(
-                        Bucket=bucket_name,
-                        Key=s3_key
-                    )
-                    content_type = s3_response.get(
-                        'ContentType', 'application/octet-stream')
-                except Exception:
-                    content_type = 'application/octet-stream'
+            # 同じ画像・同じキーの署名付きURLは短時間キャッシュする
+            cache_key = (image_id, tuple(target_s3_keys), stored_content_type, tuple(image_tiers))
+            cached = download_url_cache.get(cache_key)
+            if cached is not None:
+                return cached
 
-                # 署名付きURLの生成（有効期限は1時間）
+            # 署名はローカルで計算できるため、S3へのリクエストなしで全ページ分を生成する
+            s3_client = get_s3_client()
+            presigned_urls = []
+            content_types = []
+            for i, s3_key in enumerate(target_s3_keys):
+                content_type = (stored_content_type or mimetypes.guess_type(s3_key)[0]
+                                or 'application/octet-stream')
                 presigned_url = s3_client.generate_presigned_url(
                     'get_object',
                     Params={
@@ -297,35 +296,49 @@ class UploadService:
                         'ResponseContentType': content_type,
                         'ResponseCacheControl': 'no-cache'
                     },
-                    ExpiresIn=3600,  # 1時間
+                    ExpiresIn=settings.DOWNLOAD_URL_EXPIRES_SECONDS,
                     HttpMethod='GET'
                 )
-
+                # 一覧・プレビュー用の縮小画像のURL
+                tier_urls = {
+                    tier: s3_client.generate_presigned_url(
+                        'get_object',
+                        Params={
+                            'Bucket': bucket_name,
+                            'Key': image_tier_s3_key(s3_key, tier),
+                            'ResponseContentType': 'image/jpeg'
+                        },
+                        ExpiresIn=settings.DOWNLOAD_URL_EXPIRES_SECONDS,
+                        HttpMethod='GET'
+                    )
+                    for tier in image_tiers
+                }
                 presigned_urls.append({
                     "page": i + 1,
                     "presigned_url": presigned_url,
-                    "s3_key": s3_key
+                    "s3_key": s3_key,
+                    "tier_urls": tier_urls
                 })
-
-                # 最初のページをメインとして設定
-                if i == 0:
-                    main_presigned_url = presigned_url
-                    main_content_type = content_type
+                content_types.append(content_type)
 
             if not presigned_urls:
                 raise ValueError("No valid S3 keys found")
 
             logger.info(f"Generated download URL for image {image_id}")
 
-            return {
-                "presigned_url": main_presigned_url,  # 単一画像用のメインURL
+            # 最初のページをメインとして設定
+            result = {
+                "presigned_url": presigned_urls[0]["presigned_url"],  # 単一画像用のメインURL
+                "tier_urls": presigned_urls[0]["tier_urls"],
                 "presigned_urls": presigned_urls,
                 "total_pages": len(presigned_urls),
                 "is_multipage": len(presigned_urls) > 1,
-                "content_type": main_content_type,
+                "content_type": content_types[0],
                 "filename": image_data.get("filename"),
                 "is_converted": bool(converted_s3_keys)
             }
+            download_url_cache.set(cache_key, result)
+            return result
 
         except Exception as e:
             logger.error(f"Error generating download URL: {str(e)}")
@@ -335,7 +348,7 @@ class UploadService:
         """画像一覧を取得する"""
         try:
             # app_nameでフィルタリングして画像を取得
-            images = get_images(app_name)
+            images = await run_io(get_images, app_name)
 
             # レスポンス形式に変換
             result = {
@@ -0,0 +1,393 @@
+"""
+永続的なタスクキュー
+PDF変換・OCRジョブなどの非同期処理を名前付きタスクとしてキューに投入し、複数のワーカー（Lambda実行環境）で処理する
+
+- タスクは名前とJSONのペイロードで表し、処理内容はtask_handlerで登録した関数で決まる
+- 受信したタスクは可視性タイムアウトの間だけ他のワーカーから見えなくなり、
+  完了しなかった場合は再配信される（ハンドラーは冪等に実装すること）
+- 最大受信回数を超えて失敗したタスクはデッドレターとして隔離する
+"""
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# タスク名 -> ハンドラー関数
+TASK_HANDLERS = {}
+
+
+def task_handler(name: str):
+    """タスクハンドラーを登録するデコレーター"""
+    def decorator(func):
+        TASK_HANDLERS[name] = func
+        return func
+    return decorator
+
+
+def run_task_handler(name: str, payload: dict):
+    """登録済みのハンドラーでタスクを実行する"""
+    # ハンドラーはサービス層に依存するため、初回実行時に登録する
+    import tasks  # noqa: F401
+
+    handler = TASK_HANDLERS.get(name)
+    if handler is None:
+        raise ValueError(f"未登録のタスクです: {name}")
+    return handler(**payload)
+
+
+class TaskMessage:
+    """キューから受信したタスク"""
+
+    def __init__(self, message_id: str, name: str, payload: dict, receipt_handle: str, receive_count: int):
+        self.message_id = message_id
+        self.name = name
+        self.payload = payload
+        self.receipt_handle = receipt_handle
+        self.receive_count = receive_count
+
+
+class TaskQueue(ABC):
+    """タスクキューの基底クラス"""
+
+    @abstractmethod
+    def enqueue(self, name: str, payload: dict, dedup_key: str = None) -> str:
+        """
+        タスクを投入する
+
+        Args:
+            name (str): タスク名
+            payload (dict): ハンドラーに渡す引数（JSONに変換できること）
+            dedup_key (str, optional): 重複投入を防ぐキー（同じキーのタスクが処理待ち・処理中の間は投入しない。
+                                       SQSでは同じキーのタスクを順番に処理する）
+
+        Returns:
+            str: メッセージID
+        """
+        pass
+
+    @abstractmethod
+    def receive(self, max_messages: int = 1, visibility_timeout: int = None) -> list:
+        """可視性タイムアウトを設定してタスクを受信する（TaskMessageのリスト）"""
+        pass
+
+    @abstractmethod
+    def ack(self, message: TaskMessage) -> None:
+        """完了したタスクを削除する"""
+        pass
+
+    @abstractmethod
+    def release(self, message: TaskMessage, delay_seconds: int = 0) -> None:
+        """失敗したタスクを指定秒数後に再配信されるように戻す"""
+        pass
+
+    @abstractmethod
+    def dead_letter(self, message: TaskMessage, error: str) -> None:
+        """再試行しても失敗したタスクをデッドレターに移す"""
+        pass
+
+
+class SqsTaskQueue(TaskQueue):
+    """
+    Amazon SQSを使用するタスクキュー
+
+    FIFOキューの場合はdedup_keyをメッセージグループIDとし、同じキーのタスクを順番に処理する。
+    重複排除IDは投入ごとに作成する（SQSは削除後も5分間IDを保持するため、dedup_keyを使うと
+    失敗後の再投入が破棄される）。そのため同じキーのタスクも投入され、重複実行は
+    各ハンドラーの状態確認で防ぐ。
+    デッドレターキューが未設定の場合はキューのリドライブポリシーに任せる
+    """
+
+    def __init__(self, queue_url: str = None, dead_letter_queue_url: str = None):
+        self.queue_url = queue_url or settings.TASK_QUEUE_URL
+        self.dead_letter_queue_url = dead_letter_queue_url or settings.TASK_DEAD_LETTER_QUEUE_URL
+        self.is_fifo = self.queue_url.endswith(".fifo")
+
+    def _client(self):
+        from clients import get_sqs_client
+        return get_sqs_client()
+
+    def enqueue(self, name: str, payload: dict, dedup_key: str = None) -> str:
+        params = {
+            "QueueUrl": self.queue_url,
+            "MessageBody": json.dumps({"name": name, "payload": payload}, ensure_ascii=False)
+        }
+        if self.is_fifo:
+            # グループ内は順番に処理されるため、キーのないタスクは別々のグループにして並行に処理する
+            params["MessageGroupId"] = (dedup_key or str(uuid.uuid4()))[:128]
+            # 投入ごとに一意のID（SDKによる送信の再試行で同じメッセージが重複することだけを防ぐ）
+            params["MessageDeduplicationId"] = str(uuid.uuid4())
+        response = self._client().send_message(**params)
+        logger.info(f"タスクを投入しました: {name} ({response['MessageId']})")
+        return response["MessageId"]
+
+    def receive(self, max_messages: int = 1, visibility_timeout: int = None) -> list:
+        response = self._client().receive_message(
+            QueueUrl=self.queue_url,
+            MaxNumberOfMessages=min(max_messages, 10),
+            VisibilityTimeout=visibility_timeout or settings.TASK_VISIBILITY_TIMEOUT_SECONDS,
+            WaitTimeSeconds=settings.TASK_QUEUE_WAIT_SECONDS,
+            AttributeNames=["ApproximateReceiveCount"]
+        )
+        messages = []
+        for message in response.get("Messages", []):
+            body = json.loads(message["Body"])
+            messages.append(TaskMessage(
+                message["MessageId"], body["name"], body.get("payload", {}),
+                message["ReceiptHandle"],
+                int(message.get("Attributes", {}).get("ApproximateReceiveCount", 1))))
+        return messages
+
+    def ack(self, message: TaskMessage) -> None:
+        self._client().delete_message(
+            QueueUrl=self.queue_url, ReceiptHandle=message.receipt_handle)
+
+    def release(self, message: TaskMessage, delay_seconds: int = 0) -> None:
+        self._client().change_message_visibility(
+            QueueUrl=self.queue_url, ReceiptHandle=message.receipt_handle,
+            VisibilityTimeout=int(delay_seconds))
+
+    def dead_letter(self, message: TaskMessage, error: str) -> None:
+        if not self.dead_letter_queue_url:
+            # リドライブポリシーの最大受信回数に達した時点でSQSが移動する
+            logger.error(f"タスクが失敗しました（リドライブポリシーに任せます）: {message.name}, {error}")
+            return
+        params = {
+            "QueueUrl": self.dead_letter_queue_url,
+            "MessageBody": json.dumps(
+                {"name": message.name, "payload": message.payload, "error": error}, ensure_ascii=False)
+        }
+        if self.dead_letter_queue_url.endswith(".fifo"):
+            params["MessageGroupId"] = message.name
+            params["MessageDeduplicationId"] = message.message_id
+        self._client().send_message(**params)
+        self.ack(message)
+        logger.error(f"タスクをデッドレターキューに移動しました: {message.name}, {error}")
+
+
+class SqliteTaskQueue(TaskQueue):
+    """
+    SQLiteを使用するタスクキュー（ローカル開発・テスト用）
+
+    ファイルを共有すれば複数プロセスのワーカーで処理を分散できる。
+    path に ":memory:" を指定した場合はプロセス内のみで動作する。
+    dedup_keyは処理待ち・処理中のタスクにのみ保持し、完了・デッドレター時に解除する
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path or settings.TASK_QUEUE_SQLITE_PATH
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS tasks (
+                id TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                dedup_key TEXT UNIQUE,
+                state TEXT NOT NULL DEFAULT 'queued',
+                receive_count INTEGER NOT NULL DEFAULT 0,
+                visible_at REAL NOT NULL,
+                receipt TEXT,
+                last_error TEXT,
+                created_at REAL NOT NULL
+            )""")
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS tasks_visible ON tasks (state, visible_at)")
+        # 以前の形式で完了・デッドレターのタスクに残っているdedup_keyを解除する
+        self._conn.execute(
+            "UPDATE tasks SET dedup_key = NULL WHERE state IN ('done', 'dead') AND dedup_key IS NOT NULL")
+
+    def enqueue(self, name: str, payload: dict, dedup_key: str = None) -> str:
+        message_id = str(uuid.uuid4())
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO tasks (id, name, payload, dedup_key, visible_at, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (message_id, name, json.dumps(payload, ensure_ascii=False), dedup_key, now, now))
+            if cursor.rowcount == 0:
+                # 同じdedup_keyのタスクが投入済み
+                row = self._conn.execute(
+                    "SELECT id FROM tasks WHERE dedup_key = ?", (dedup_key,)).fetchone()
+                logger.info(f"重複したタスクのため投入を省略しました: {name} ({dedup_key})")
+                return row[0]
+        logger.info(f"タスクを投入しました: {name} ({message_id})")
+        return message_id
+
+    def receive(self, max_messages: int = 1, visibility_timeout: int = None) -> list:
+        visibility_timeout = visibility_timeout or settings.TASK_VISIBILITY_TIMEOUT_SECONDS
+        now = time.time()
+        messages = []
+        with self._lock:
+            # 他のワーカーと同じタスクを受信しないよう書き込みロックを取ってから選択する
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    "SELECT id, name, payload, receive_count FROM tasks "
+                    "WHERE state = 'queued' AND visible_at <= ? ORDER BY visible_at LIMIT ?",
+                    (now, max_messages)).fetchall()
+                for message_id, name, payload, receive_count in rows:
+                    receipt = str(uuid.uuid4())
+                    self._conn.execute(
+                        "UPDATE tasks SET receive_count = receive_count + 1, visible_at = ?, receipt = ? "
+                        "WHERE id = ?",
+                        (now + visibility_timeout, receipt, message_id))
+                    messages.append(TaskMessage(
+                        message_id, name, json.loads(payload), receipt, receive_count + 1))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return messages
+
+    def ack(self, message: TaskMessage) -> None:
+        with self._lock:
+            # 可視性タイムアウト後に別のワーカーが受信し直した場合は削除しない
+            self._conn.execute(
+                "UPDATE tasks SET state = 'done', receipt = NULL, dedup_key = NULL WHERE id = ? AND receipt = ?",
+                (message.message_id, message.receipt_handle))
+
+    def release(self, message: TaskMessage, delay_seconds: int = 0) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE tasks SET visible_at = ? WHERE id = ? AND receipt = ?",
+                (time.time() + delay_seconds, message.message_id, message.receipt_handle))
+
+    def dead_letter(self, message: TaskMessage, error: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE tasks SET state = 'dead', last_error = ?, dedup_key = NULL WHERE id = ? AND receipt = ?",
+                (error, message.message_id, message.receipt_handle))
+        logger.error(f"タスクをデッドレターに移動しました: {message.name}, {error}")
+
+    def dead_letters(self) -> list:
+        """デッドレターのタスクを取得する（確認用）"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, name, payload, receive_count, last_error FROM tasks WHERE state = 'dead'"
+            ).fetchall()
+        return [
+            {"id": row[0], "name": row[1], "payload": json.loads(row[2]),
+             "receive_count": row[3], "error": row[4]}
+            for row in rows
+        ]
+
+
+_task_queue = None
+_task_queue_lock = threading.Lock()
+
+
+def get_task_queue() -> TaskQueue:
+    """設定に応じたタスクキューを取得"""
+    global _task_queue
+    with _task_queue_lock:
+        if _task_queue is None:
+            if settings.TASK_QUEUE_BACKEND == "sqlite":
+                _task_queue = SqliteTaskQueue()
+            else:
+                _task_queue = SqsTaskQueue()
+    return _task_queue
+
+
+def submit_task(name: str, payload: dict, dedup_key: str = None, background_task=None) -> str:
+    """
+    タスクを実行キューに投入する
+
+    TASK_QUEUE_BACKENDがinprocessの場合は従来どおり実行環境内のバックグラウンドタスクで実行する
+
+    Args:
+        name (str): タスク名
+        payload (dict): ハンドラーに渡す引数
+        dedup_key (str, optional): 重複投入を防ぐキー
+        background_task (BackgroundTaskExtension, optional): inprocess時に使用するバックグラウンドタスク
+
+    Returns:
+        str: タスクID（メッセージID）
+    """
+    if settings.TASK_QUEUE_BACKEND == "inprocess":
+        if background_task is None:
+            from main import background_task
+        return background_task.add_task(run_task_handler, name, payload)
+    return get_task_queue().enqueue(name, payload, dedup_key)
+
+
+def retry_delay(receive_count: int) -> int:
+    """再配信までの待ち時間（受信回数に応じた指数バックオフ）"""
+    return int(min(settings.TASK_RETRY_BASE_DELAY_SECONDS * (2 ** max(receive_count - 1, 0)),
+                   settings.TASK_RETRY_MAX_DELAY_SECONDS))
+
+
+def execute_task(queue: TaskQueue, message: TaskMessage) -> bool:
+    """
+    受信したタスクを実行し、結果に応じて完了・再配信・デッドレターのいずれかにする
+
+    Returns:
+        bool: タスクが成功したか
+    """
+    try:
+        logger.info(f"タスクを実行します: {message.name} (受信 {message.receive_count}回目)")
+        run_task_handler(message.name, message.payload)
+        queue.ack(message)
+        return True
+    except Exception as e:
+        logger.error(f"タスクの実行に失敗しました: {message.name}, {str(e)}")
+        if message.receive_count >= settings.TASK_MAX_RECEIVE_COUNT:
+            queue.dead_letter(message, str(e))
+        else:
+            queue.release(message, retry_delay(message.receive_count))
+        return False
+
+
+class TaskWorker:
+    """
+    キューからタスクを受信して処理するワーカー
+
+    SQSをLambdaのイベントソースとして使わない場合（ローカル実行・常駐ワーカー）に使用する
+    """
+
+    def __init__(self, queue: TaskQueue = None, batch_size: int = 1):
+        self.queue = queue or get_task_queue()
+        self.batch_size = batch_size
+
+    def run_once(self) -> int:
+        """受信できたタスクを1回分処理する（処理したタスク数を返す）"""
+        messages = self.queue.receive(self.batch_size)
+        for message in messages:
+            execute_task(self.queue, message)
+        return len(messages)
+
+    def run_forever(self, idle_sleep: float = 1.0, stop_event: threading.Event = None):
+        """停止されるまでタスクを処理し続ける"""
+        while stop_event is None or not stop_event.is_set():
+            if self.run_once() == 0:
+                time.sleep(idle_sleep)
+
+
+def handle_sqs_event(event: dict) -> dict:
+    """
+    LambdaのSQSイベントを処理する
+
+    失敗したレコードはbatchItemFailuresとして返し、可視性タイムアウト後にSQSから再配信させる
+    （最大受信回数を超えるとリドライブポリシーでデッドレターキューに移動する）
+
+    Returns:
+        dict: 部分的なバッチ失敗のレスポンス
+    """
+    failures = []
+    for record in event.get("Records", []):
+        message_id = record.get("messageId")
+        try:
+            body = json.loads(record["body"])
+            receive_count = int(record.get("attributes", {}).get("ApproximateReceiveCount", 1))
+            logger.info(f"タスクを実行します: {body['name']} (受信 {receive_count}回目)")
+            run_task_handler(body["name"], body.get("payload", {}))
+        except Exception as e:
+            logger.error(f"タスクの実行に失敗しました: {message_id}, {str(e)}")
+            failures.append({"itemIdentifier": message_id})
+    return {"batchItemFailures": failures}
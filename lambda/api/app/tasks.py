@@ -0,0 +1,111 @@
+"""
+タスクキューのハンドラー定義
+再配信されても同じ結果になるよう、各ハンドラーは処理前に現在の状態を確認する
+"""
+import logging
+
+from config import settings
+from database import get_image, get_images_by_job_id, get_children_by_parent_id, update_image_status
+from task_queue import task_handler, submit_task
+
+logger = logging.getLogger(__name__)
+
+
+@task_handler("convert_pdf")
+def convert_pdf(image_id: str, s3_key: str, force_reprocess: bool = False):
+    """アップロードされたPDFを画像に変換する（同じ内容の処理済みドキュメントがあれば結果を引き継ぐ）"""
+    from utils import convert_pdf_to_image
+    from services.ingestion_service import IngestionService, start_ocr_if_enabled
+
+    image_data = get_image(image_id)
+    if not image_data:
+        logger.warning(f"画像が見つからないため変換を省略します: {image_id}")
+        return
+    if image_data.get("status") != "converting":
+        logger.info(f"変換済みのため省略します: {image_id} (status: {image_data.get('status')})")
+        return
+    if IngestionService().reuse_duplicate(image_id, image_data, s3_key, force_reprocess):
+        return
+    convert_pdf_to_image(image_id, s3_key)
+
+    # 変換が完了した場合、設定に応じてOCRを開始する（個別ページ処理の場合は各ページ）
+    image_data = get_image(image_id)
+    if not image_data or image_data.get("status") != "pending":
+        return
+    pages = get_children_by_parent_id(image_id) if image_data.get("page_processing_mode") == "individual" else []
+    if not pages:
+        start_ocr_if_enabled(image_id)
+    for page in pages:
+        if page.get("status") == "pending":
+            start_ocr_if_enabled(page["id"])
+
+
+@task_handler("resize_image")
+def resize_uploaded_image(image_id: str, s3_key: str, filename: str, content_type: str,
+                          force_reprocess: bool = False):
+    """アップロードされた画像をリサイズし、処理待ちにする（同じ内容の処理済みドキュメントがあれば結果を引き継ぐ）"""
+    from services.ingestion_service import IngestionService, start_ocr_if_enabled
+
+    image_data = get_image(image_id)
+    if not image_data:
+        logger.warning(f"画像が見つからないためリサイズを省略します: {image_id}")
+        return
+    if image_data.get("status") != "converting":
+        logger.info(f"リサイズ済みのため省略します: {image_id} (status: {image_data.get('status')})")
+        return
+    if IngestionService().reuse_duplicate(image_id, image_data, s3_key, force_reprocess):
+        return
+
+    # リサイズに失敗した場合は元の画像のまま処理待ちにする
+    IngestionService().resize_uploaded_image(image_id, s3_key, filename, content_type)
+    update_image_status(image_id, "pending")
+    start_ocr_if_enabled(image_id)
+
+
+@task_handler("bulk_import_s3")
+def bulk_import_s3(import_id: str):
+    """S3フォルダの一括インポートをチェックポイントから再開する"""
+    from services.s3_sync_service import S3SyncService
+
+    S3SyncService().run_bulk_import(import_id)
+
+
+@task_handler("process_job")
+def process_job(job_id: str):
+    """
+    OCRジョブを処理する
+
+    永続キューの場合は画像ごとのタスクに分割して投入し、複数のワーカーで並行に処理する。
+    inprocessの場合とバッチ推論モードの場合はジョブパイプラインでまとめて処理する
+    """
+    from services.ocr_service import OcrService
+
+    if settings.TASK_QUEUE_BACKEND == "inprocess" or settings.ENABLE_BATCH_EXTRACTION:
+        OcrService()._process_job_pipeline(job_id)
+        return
+
+    images = get_images_by_job_id(job_id)
+    for image in images:
+        image_id = image.get("id")
+        submit_task(
+            "process_image", {"image_id": image_id, "job_id": job_id},
+            dedup_key=f"process_image:{job_id}:{image_id}")
+    logger.info(f"ジョブを画像ごとのタスクに分割しました: job_id={job_id}, {len(images)}件")
+
+
+@task_handler("process_image")
+def process_image(image_id: str, job_id: str = None):
+    """画像1件のOCR→情報抽出を実行する"""
+    from services.image_processing_pipeline import ImageProcessingPipeline
+
+    image_data = get_image(image_id)
+    if not image_data:
+        logger.warning(f"画像が見つからないため処理を省略します: {image_id}")
+        return
+    if image_data.get("status") == "completed":
+        logger.info(f"処理済みのため省略します: {image_id}")
+        return
+    if job_id and image_data.get("job_id") not in (None, job_id):
+        logger.info(f"別のジョブで処理されるため省略します: {image_id} (job_id: {image_data.get('job_id')})")
+        return
+    ImageProcessingPipeline().process_complete_pipeline(image_id)
@@ -5,7 +5,7 @@ Utilities package
 from .helpers import decimal_to_float, resize_image, float_to_decimal
 from .template import (
     generate_unified_template, generate_json_template, 
-    generate_indices_template
+    generate_indices_template, generate_extraction_targets
 )
 from .pdf import (
     convert_pdf_to_image, process_combined_pages, process_single_page_combined,
@@ -19,6 +19,7 @@ __all__ = [
     'generate_unified_template',
     'generate_json_template',
     'generate_indices_template',
+    'generate_extraction_targets',
     'convert_pdf_to_image',
     'process_combined_pages',
     'process_single_page_combined', 
@@ -0,0 +1,329 @@
+"""
+バッチ推論ユーティリティ
+Converse形式のリクエストをバッチ推論用のJSONLレコードに変換し、ジョブの投入・状態確認・結果取得を行う
+"""
+import base64
+import json
+import logging
+import os
+from abc import ABC, abstractmethod
+
+from botocore.exceptions import ClientError
+
+from clients import get_s3_client, get_bedrock_control_client
+from config import settings
+from utils.bedrock import INFERENCE_CONFIG
+
+logger = logging.getLogger(__name__)
+
+# Anthropicモデルのバッチ推論（InvokeModel形式）で指定するAPIバージョン
+ANTHROPIC_VERSION = "bedrock-2023-05-31"
+# バッチ推論の入出力の保存先プレフィックス
+BATCH_PREFIX = "batch-inference"
+
+# ジョブの状態（Bedrockの状態をこの3つにまとめる）
+STATUS_IN_PROGRESS = "in_progress"
+STATUS_COMPLETED = "completed"
+STATUS_FAILED = "failed"
+
+_BEDROCK_STATUS_MAP = {
+    "Completed": STATUS_COMPLETED,
+    "PartiallyCompleted": STATUS_COMPLETED,
+    "Failed": STATUS_FAILED,
+    "Stopped": STATUS_FAILED,
+    "Expired": STATUS_FAILED,
+}
+
+
+def to_batch_model_input(messages: list, system_prompts: list = None) -> dict:
+    """
+    Converse形式のリクエストをバッチ推論のmodelInput（Anthropic Messages形式）に変換する
+
+    キャッシュポイントはバッチ推論では使用しないため除外する
+
+    Args:
+        messages (list): Converse APIのメッセージのリスト
+        system_prompts (list, optional): Converse APIのシステムプロンプト
+
+    Returns:
+        dict: modelInput
+    """
+    converted_messages = []
+    for message in messages:
+        content = []
+        for block in message.get("content", []):
+            if "text" in block:
+                content.append({"type": "text", "text": block["text"]})
+            elif "image" in block:
+                image = block["image"]
+                image_format = image.get("format", "jpeg")
+                content.append({
+                    "type": "image",
+                    "source": {
+                        "type": "base64",
+                        "media_type": f"image/{image_format}",
+                        "data": base64.b64encode(image["source"]["bytes"]).decode("utf-8")
+                    }
+                })
+        converted_messages.append({"role": message["role"], "content": content})
+
+    model_input = {
+        "anthropic_version": ANTHROPIC_VERSION,
+        "max_tokens": INFERENCE_CONFIG["maxTokens"],
+        "temperature": INFERENCE_CONFIG["temperature"],
+        "messages": converted_messages
+    }
+    system_text = "\n".join(prompt["text"] for prompt in system_prompts or [] if "text" in prompt)
+    if system_text:
+        model_input["system"] = system_text
+    return model_input
+
+
+def from_batch_model_output(model_output: dict) -> dict:
+    """
+    バッチ推論のmodelOutput（Anthropic Messages形式）をConverse形式のレスポンスに変換する
+
+    parse_converse_responseなど同期呼び出し用の処理をそのまま使えるようにする
+
+    Returns:
+        dict: converse形式に整形したレスポンス
+    """
+    text = "".join(
+        block.get("text", "") for block in model_output.get("content", [])
+        if block.get("type") == "text")
+    usage = model_output.get("usage") or {}
+    return {
+        "output": {"message": {"role": "assistant", "content": [{"text": text}]}},
+        "stopReason": model_output.get("stop_reason", "end_turn"),
+        "usage": {
+            "inputTokens": usage.get("input_tokens", 0),
+            "outputTokens": usage.get("output_tokens", 0)
+        }
+    }
+
+
+def _parse_output_lines(lines) -> dict:
+    """出力JSONLの各行をレコードID -> Converse形式のレスポンス（失敗時はNone）に変換"""
+    results = {}
+    for line in lines:
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        record_id = record.get("recordId")
+        if record.get("error") or "modelOutput" not in record:
+            logger.warning(f"バッチ推論のレコードが失敗しました: {record_id}, {record.get('error')}")
+            results[record_id] = None
+            continue
+        results[record_id] = from_batch_model_output(record["modelOutput"])
+    return results
+
+
+class BatchInferenceClient(ABC):
+    """バッチ推論クライアントの基底クラス"""
+
+    # ジョブに含める最小レコード数
+    min_records = 1
+
+    @abstractmethod
+    def submit(self, job_name: str, records: list) -> str:
+        """
+        レコードを書き出してバッチ推論ジョブを投入する
+
+        Args:
+            job_name (str): ジョブ名（入出力の保存先にも使用）
+            records (list): {"recordId": str, "modelInput": dict} のリスト
+
+        Returns:
+            str: バッチ推論ジョブID
+        """
+        pass
+
+    @abstractmethod
+    def get_status(self, batch_job_id: str) -> str:
+        """ジョブの状態（in_progress / completed / failed）を取得する"""
+        pass
+
+    @abstractmethod
+    def get_results(self, batch_job_id: str) -> dict:
+        """
+        完了したジョブの結果を取得する
+
+        Returns:
+            dict: レコードID -> Converse形式のレスポンス（失敗したレコードはNone）
+        """
+        pass
+
+    @abstractmethod
+    def save_manifest(self, job_name: str, manifest: dict) -> None:
+        """結果の取り込みに必要な情報（レコードと画像の対応など）を保存する"""
+        pass
+
+    @abstractmethod
+    def load_manifest(self, job_name: str) -> dict:
+        """save_manifestで保存した情報を取得する（存在しない場合はNone）"""
+        pass
+
+
+class BedrockBatchInferenceClient(BatchInferenceClient):
+    """Bedrockバッチ推論（CreateModelInvocationJob）を使用するクライアント"""
+
+    def __init__(self):
+        self.min_records = settings.BATCH_INFERENCE_MIN_RECORDS
+        self._output_uris = {}
+
+    def submit(self, job_name: str, records: list) -> str:
+        bucket_name = settings.BUCKET_NAME
+        input_key = f"{BATCH_PREFIX}/{job_name}/input.jsonl"
+        body = "\n".join(json.dumps(record, ensure_ascii=False) for record in records)
+        get_s3_client().put_object(
+            Bucket=bucket_name,
+            Key=input_key,
+            Body=body.encode("utf-8"),
+            ContentType="application/jsonl"
+        )
+
+        response = get_bedrock_control_client().create_model_invocation_job(
+            jobName=job_name,
+            roleArn=settings.BATCH_INFERENCE_ROLE_ARN,
+            modelId=settings.MODEL_ID,
+            inputDataConfig={"s3InputDataConfig": {
+                "s3Uri": f"s3://{bucket_name}/{input_key}",
+                "s3InputFormat": "JSONL"
+            }},
+            outputDataConfig={"s3OutputDataConfig": {
+                "s3Uri": f"s3://{bucket_name}/{BATCH_PREFIX}/{job_name}/output/"
+            }}
+        )
+        job_arn = response["jobArn"]
+        logger.info(f"バッチ推論ジョブを投入しました: {job_arn}, {len(records)}件")
+        return job_arn
+
+    def get_status(self, batch_job_id: str) -> str:
+        response = get_bedrock_control_client().get_model_invocation_job(
+            jobIdentifier=batch_job_id)
+        bedrock_status = response.get("status")
+        if bedrock_status in ("Completed", "PartiallyCompleted"):
+            self._output_uris[batch_job_id] = (
+                response["outputDataConfig"]["s3OutputDataConfig"]["s3Uri"],
+                response["inputDataConfig"]["s3InputDataConfig"]["s3Uri"])
+        if bedrock_status in ("Failed", "Stopped", "Expired"):
+            logger.error(f"バッチ推論ジョブが失敗しました: {batch_job_id}, {response.get('message')}")
+        return _BEDROCK_STATUS_MAP.get(bedrock_status, STATUS_IN_PROGRESS)
+
+    def get_results(self, batch_job_id: str) -> dict:
+        if batch_job_id not in self._output_uris:
+            self.get_status(batch_job_id)
+        output_uri, input_uri = self._output_uris[batch_job_id]
+
+        # 出力は {出力先}/{ジョブID}/{入力ファイル名}.out に書き出される
+        bucket_name, output_prefix = output_uri[len("s3://"):].split("/", 1)
+        job_id = batch_job_id.rsplit("/", 1)[-1]
+        input_name = input_uri.rsplit("/", 1)[-1]
+        output_key = f"{output_prefix.rstrip('/')}/{job_id}/{input_name}.out"
+
+        response = get_s3_client().get_object(Bucket=bucket_name, Key=output_key)
+        return _parse_output_lines(response["Body"].read().decode("utf-8").splitlines())
+
+    def save_manifest(self, job_name: str, manifest: dict) -> None:
+        get_s3_client().put_object(
+            Bucket=settings.BUCKET_NAME,
+            Key=f"{BATCH_PREFIX}/{job_name}/manifest.json",
+            Body=json.dumps(manifest, ensure_ascii=False).encode("utf-8"),
+            ContentType="application/json"
+        )
+
+    def load_manifest(self, job_name: str) -> dict:
+        try:
+            response = get_s3_client().get_object(
+                Bucket=settings.BUCKET_NAME, Key=f"{BATCH_PREFIX}/{job_name}/manifest.json")
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+                return None
+            raise
+        return json.loads(response["Body"].read())
+
+
+def empty_extraction_responder(model_input: dict) -> dict:
+    """ローカル実行用の既定の応答（空の抽出結果を返す）"""
+    return {
+        "content": [{"type": "text", "text": '{"extracted_data": {}, "indices": {}}'}],
+        "stop_reason": "end_turn",
+        "usage": {"input_tokens": 0, "output_tokens": 0}
+    }
+
+
+class LocalBatchInferenceClient(BatchInferenceClient):
+    """
+    ローカルファイルを使用するバッチ推論の代替実装
+
+    入出力のJSONLをローカルディレクトリに書き出し、状態確認時に各レコードを
+    responderで処理する。AWSに接続せずにバッチ抽出の全体の流れを確認するために使用する
+
+    Args:
+        base_dir (str, optional): 入出力の保存先ディレクトリ
+        responder (callable, optional): modelInputを受け取りmodelOutputを返す関数
+    """
+
+    def __init__(self, base_dir: str = None, responder=None):
+        self.base_dir = base_dir or settings.BATCH_INFERENCE_LOCAL_DIR
+        self.responder = responder or empty_extraction_responder
+
+    def _job_dir(self, batch_job_id: str) -> str:
+        return os.path.join(self.base_dir, batch_job_id)
+
+    def submit(self, job_name: str, records: list) -> str:
+        job_dir = self._job_dir(job_name)
+        os.makedirs(job_dir, exist_ok=True)
+        # 同じジョブ名で再投入した場合は前回の出力を破棄する
+        if os.path.exists(os.path.join(job_dir, "input.jsonl.out")):
+            os.remove(os.path.join(job_dir, "input.jsonl.out"))
+        with open(os.path.join(job_dir, "input.jsonl"), "w", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        logger.info(f"ローカルバッチ推論ジョブを作成しました: {job_name}, {len(records)}件")
+        return job_name
+
+    def get_status(self, batch_job_id: str) -> str:
+        job_dir = self._job_dir(batch_job_id)
+        output_path = os.path.join(job_dir, "input.jsonl.out")
+        if os.path.exists(output_path):
+            return STATUS_COMPLETED
+        if not os.path.exists(os.path.join(job_dir, "input.jsonl")):
+            return STATUS_FAILED
+
+        # 未処理の場合はここで全レコードを処理する
+        with open(os.path.join(job_dir, "input.jsonl"), encoding="utf-8") as f:
+            records = [json.loads(line) for line in f if line.strip()]
+        with open(output_path + ".tmp", "w", encoding="utf-8") as f:
+            for record in records:
+                output = {"recordId": record["recordId"], "modelInput": record["modelInput"]}
+                try:
+                    output["modelOutput"] = self.responder(record["modelInput"])
+                except Exception as e:
+                    output["error"] = {"errorMessage": str(e)}
+                f.write(json.dumps(output, ensure_ascii=False) + "\n")
+        os.replace(output_path + ".tmp", output_path)
+        return STATUS_COMPLETED
+
+    def get_results(self, batch_job_id: str) -> dict:
+        with open(os.path.join(self._job_dir(batch_job_id), "input.jsonl.out"), encoding="utf-8") as f:
+            return _parse_output_lines(f)
+
+    def save_manifest(self, job_name: str, manifest: dict) -> None:
+        os.makedirs(self._job_dir(job_name), exist_ok=True)
+        with open(os.path.join(self._job_dir(job_name), "manifest.json"), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False)
+
+    def load_manifest(self, job_name: str) -> dict:
+        manifest_path = os.path.join(self._job_dir(job_name), "manifest.json")
+        if not os.path.exists(manifest_path):
+            return None
+        with open(manifest_path, encoding="utf-8") as f:
+            return json.load(f)
+
+
+def get_batch_inference_client() -> BatchInferenceClient:
+    """設定に応じたバッチ推論クライアントを取得"""
+    if settings.BATCH_INFERENCE_BACKEND == "local":
+        return LocalBatchInferenceClient()
+    return BedrockBatchInferenceClient()
@@ -3,14 +3,57 @@ Bedrock関連のユーティリティ関数
 """
 import logging
 import json
-import time
-import re
 from typing import Dict, Any, List, Optional
-from clients import create_bedrock_client
+from clients import get_bedrock_client
 from config import settings
+from utils.cache import TTLCache, build_request_fingerprint
+from utils.retry import RetryPolicy, TokenBucket
+from utils.json_stream import extract_json_object
+from utils.schema_validation import validate_extraction_result
 
 logger = logging.getLogger(__name__)
 
+# 推論パラメータの設定
+INFERENCE_CONFIG = {
+    "temperature": 0.2,
+    "maxTokens": 40000
+}
+
+# 全バックグラウンドワーカーで共有するBedrock呼び出しのリトライポリシー
+bedrock_retry_policy = RetryPolicy(
+    name="bedrock",
+    max_attempts=settings.BEDROCK_RETRY_MAX_ATTEMPTS,
+    base_delay=settings.BEDROCK_RETRY_BASE_DELAY,
+    max_delay=settings.BEDROCK_RETRY_MAX_DELAY,
+    token_bucket=TokenBucket(
+        rate=settings.BEDROCK_REQUESTS_PER_SECOND,
+        capacity=settings.BEDROCK_BURST_CAPACITY
+    )
+)
+
+# 抽出結果のキャッシュ（同一リクエストの再実行時にBedrock呼び出しを省略）
+extraction_cache = TTLCache(
+    max_entries=settings.EXTRACTION_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.EXTRACTION_CACHE_TTL_SECONDS
+)
+
+
+def log_token_usage(response):
+    """
+    レスポンスのトークン使用量をログ出力する（プロンプトキャッシュの効果確認用）
+
+    Args:
+        response (dict): Converse APIからのレスポンス
+    """
+    usage = (response or {}).get("usage") or {}
+    if not usage:
+        return
+    logger.info(
+        f"トークン使用量: input={usage.get('inputTokens', 0)}, "
+        f"output={usage.get('outputTokens', 0)}, "
+        f"cache_read={usage.get('cacheReadInputTokens', 0)}, "
+        f"cache_write={usage.get('cacheWriteInputTokens', 0)}")
+
 
 def call_bedrock(messages, system_prompts=None, model_id=None, model_region=None):
     """
@@ -30,14 +73,8 @@ def call_bedrock(messages, system_prompts=None, model_id=None, model_region=None
 
     logger.info(f"モデル {model_id} を使用して対話を実行します (リージョン: {model_region})")
 
-    # 動的リージョン対応のため、専用クライアントを作成
-    bedrock = create_bedrock_client(model_region)
-
-    # 推論パラメータの設定
-    inference_config = {
-        "temperature": 0.2,
-        "maxTokens": 40000
-    }
+    # リージョン別にキャッシュされたクライアントを使用
+    bedrock = get_bedrock_client(model_region)
 
     try:
         logger.info("Bedrock APIを呼び出し中")
@@ -45,9 +82,10 @@ def call_bedrock(messages, system_prompts=None, model_id=None, model_region=None
             modelId=model_id,
             messages=messages,
             system=system_prompts,
-            inferenceConfig=inference_config
+            inferenceConfig=INFERENCE_CONFIG
         )
         logger.info("Bedrock APIの呼び出しが成功しました")
+        log_token_usage(response)
         return response
 
     except Exception as e:
@@ -55,34 +93,148 @@ def call_bedrock(messages, system_prompts=None, model_id=None, model_region=None
         raise
 
 
-def call_bedrock_with_retry(messages, system_prompts=None, max_retries=5):
+def call_bedrock_stream(messages, system_prompts=None, model_id=None, model_region=None,
+                        on_text=None, max_output_chars=None):
+    """
+    ConverseStream APIによるストリーミング呼び出し
+
+    生成されたテキストをチャンク単位でon_textに渡し、最終的には
+    converse と同じ形式のレスポンスを返す。max_output_charsを超えた場合は
+    生成を打ち切り、stopReasonを "max_tokens" として返す
+
+    Args:
+        messages (list): モデルに送信するメッセージのリスト
+        system_prompts (list, optional): システムプロンプトのリスト
+        model_id (str, optional): 使用するモデルID
+        model_region (str, optional): モデルのリージョン
+        on_text (callable, optional): テキストチャンク受信時に呼ばれる関数
+        max_output_chars (int, optional): 出力文字数の上限
+
+    Returns:
+        dict: converse形式に整形したレスポンス
+    """
+    model_id = model_id or settings.MODEL_ID
+    model_region = model_region or settings.MODEL_REGION
+
+    logger.info(
+        f"モデル {model_id} を使用してストリーミング対話を実行します (リージョン: {model_region})")
+
+    bedrock = get_bedrock_client(model_region)
+
+    try:
+        response = bedrock.converse_stream(
+            modelId=model_id,
+            messages=messages,
+            system=system_prompts,
+            inferenceConfig=INFERENCE_CONFIG
+        )
+
+        text_parts = []
+        output_chars = 0
+        stop_reason = None
+        usage = {}
+        stream = response.get("stream")
+
+        for event in stream:
+            if "contentBlockDelta" in event:
+                text = event["contentBlockDelta"].get(
+                    "delta", {}).get("text", "")
+                if not text:
+                    continue
+                text_parts.append(text)
+                output_chars += len(text)
+                if on_text:
+                    on_text(text)
+
+                # 暴走した生成を早期に打ち切る
+                if max_output_chars and output_chars > max_output_chars:
+                    logger.warning(
+                        f"出力文字数が上限 {max_output_chars} を超えたため生成を打ち切ります")
+                    stop_reason = "max_tokens"
+                    stream.close()
+                    break
+            elif "messageStop" in event:
+                stop_reason = event["messageStop"].get("stopReason")
+            elif "metadata" in event:
+                usage = event["metadata"].get("usage", {})
+
+        logger.info(
+            f"Bedrockストリーミング呼び出しが完了しました: {output_chars} 文字, stopReason={stop_reason}")
+
+        result = {
+            "output": {
+                "message": {
+                    "role": "assistant",
+                    "content": [{"text": "".join(text_parts)}]
+                }
+            },
+            "stopReason": stop_reason,
+            "usage": usage
+        }
+        log_token_usage(result)
+        return result
+
+    except Exception as e:
+        logger.error(f"Bedrockストリーミング呼び出しエラー: {str(e)}")
+        raise
+
+
+def call_bedrock_with_retry(messages, system_prompts=None, max_retries=None, invoke=None):
     """
     リトライ付きBedrock呼び出し
 
+    スロットリング・一時的障害のみをフルジッター付きで再試行し、
+    検証エラーなどは即座に送出する（utils.retry.RetryPolicy）
+
     Args:
         messages (list): モデルに送信するメッセージのリスト
         system_prompts (list, optional): システムプロンプトのリスト
-        max_retries (int): 最大リトライ回数
+        max_retries (int, optional): 最大試行回数（未指定時は設定値）
+        invoke (callable, optional): 呼び出す関数（未指定時はcall_bedrock）
 
     Returns:
         dict: Bedrockからの生レスポンス
     """
-    for attempt in range(max_retries):
-        try:
-            logger.info(f"Bedrock API呼び出し（試行回数: {attempt+1}/{max_retries}）")
-            return call_bedrock(messages, system_prompts)
-
-        except Exception as e:
-            logger.error(f"Bedrock API呼び出しエラー: {str(e)}")
-            if attempt < max_retries - 1:
-                wait_time = 2 ** attempt  # 指数バックオフ
-                logger.info(f"{wait_time}秒待機してリトライします...")
-                time.sleep(wait_time)
-            else:
-                logger.error(f"最大試行回数 {max_retries} 回で失敗しました")
-                raise
+    return bedrock_retry_policy.call(
+        invoke or call_bedrock, messages, system_prompts, max_attempts=max_retries)
+
+
+def call_bedrock_with_cache(messages, system_prompts=None, invoke=None):
+    """
+    キャッシュ付きBedrock呼び出し
+
+    リクエスト全体（OCR結果・スキーマ・カスタムプロンプト・画像を含む）の
+    フィンガープリントをキーとして、同一リクエストの結果を再利用する
+
+    Args:
+        messages (list): モデルに送信するメッセージのリスト
+        system_prompts (list, optional): システムプロンプトのリスト
+        invoke (callable, optional): キャッシュミス時の呼び出し関数
+                                     未指定時はcall_bedrock_with_retryを使用
 
-    return None
+    Returns:
+        dict: Bedrockからの生レスポンス
+    """
+    invoke = invoke or call_bedrock_with_retry
+
+    if not settings.ENABLE_EXTRACTION_CACHE:
+        return invoke(messages, system_prompts)
+
+    cache_key = build_request_fingerprint(
+        messages, system_prompts, settings.MODEL_ID, INFERENCE_CONFIG)
+
+    cached_response = extraction_cache.get(cache_key)
+    if cached_response is not None:
+        logger.info(f"抽出結果キャッシュにヒットしました: {cache_key[:16]}")
+        return cached_response
+
+    response = invoke(messages, system_prompts)
+
+    # 途中で打ち切られた応答はキャッシュしない
+    if response and response.get("stopReason") != "max_tokens":
+        extraction_cache.set(cache_key, response)
+
+    return response
 
 
 def parse_converse_response(response):
@@ -107,41 +259,42 @@ def parse_converse_response(response):
         return ""
 
 
-def extract_json_from_response(response_text):
+def extract_json_from_response(response_text, fields=None):
     """
     レスポンステキストからJSONを抽出する
 
     Args:
         response_text (str): レスポンステキスト
+        fields (list, optional): 抽出フィールド定義（指定時はスキーマに合わせて補正）
 
     Returns:
         dict: 抽出されたJSON、失敗時は空辞書
     """
     try:
-        # JSONを含む部分を抽出
-        json_match = re.search(r'\{[\s\S]*\}', response_text)
-        if json_match:
-            json_str = json_match.group()
-            return json.loads(json_str)
-        else:
+        # 最外側のJSONオブジェクトを1回の走査で取り出す（途中切れなどは修復）
+        response_data, status = extract_json_object(response_text)
+        if response_data is None:
             logger.warning("レスポンステキストにJSONが見つかりません")
             return {}
 
-    except json.JSONDecodeError as e:
-        logger.error(f"JSON解析エラー: {str(e)}")
-        return {}
+        if fields:
+            response_data, _, _ = validate_extraction_result(
+                response_data, None, fields)
+        return response_data
+
     except Exception as e:
         logger.error(f"JSON抽出エラー: {str(e)}")
         return {}
 
 
-def parse_extraction_response(ai_response, field_names):
+def parse_extraction_response(ai_response, field_names, fields=None):
     """
     AI応答から抽出結果を解析してextracted_infoとmappingを分離
 
     Args:
         ai_response (str): AIからの応答テキスト
         field_names (list): 抽出対象のフィールド名リスト
+        fields (list, optional): 抽出フィールド定義（指定時はスキーマに合わせて補正）
 
     Returns:
         tuple: (extracted_info, mapping)
@@ -150,27 +303,20 @@ def parse_extraction_response(ai_response, field_names):
     mapping = {}
 
     try:
-        # Markdownのコードブロックを除去
-        cleaned_text = ai_response.strip()
-        if cleaned_text.startswith("```json"):
-            cleaned_text = cleaned_text[7:]  # ```json を除去
-        if cleaned_text.startswith("```"):
-            cleaned_text = cleaned_text[3:]   # ``` を除去
-        if cleaned_text.endswith("```"):
-            cleaned_text = cleaned_text[:-3]  # 末尾の ``` を除去
-        cleaned_text = cleaned_text.strip()
-
-        # JSONを含む部分を抽出
-        json_match = re.search(r'\{[\s\S]*\}', cleaned_text)
-        if json_match:
-            json_str = json_match.group(0)
-            response_data = json.loads(json_str)
-
+        # 最外側のJSONオブジェクトを1回の走査で取り出す
+        # （コードフェンス・前後の説明文は無視し、途中切れ・余分なカンマは修復）
+        response_data, status = extract_json_object(ai_response)
+        if response_data is not None:
             # 統合形式のデータを解析
             if "extracted_data" in response_data and "indices" in response_data:
                 extracted_info = response_data["extracted_data"]
                 mapping = response_data["indices"]
                 logger.info("統合形式でデータを解析しました")
+            elif "extracted_data" in response_data and status == "repaired":
+                # 途中で切れてindicesまで届かなかった場合
+                extracted_info = response_data["extracted_data"]
+                mapping = {}
+                logger.warning("応答が途中で切れていたため、indicesなしで解析しました")
             else:
                 # 期待される形式でない場合はエラー
                 logger.error(
@@ -180,6 +326,11 @@ def parse_extraction_response(ai_response, field_names):
                     "raw_response": ai_response
                 }
                 mapping = {field_name: [] for field_name in field_names}
+                return extracted_info, mapping
+
+            if fields:
+                extracted_info, mapping, _ = validate_extraction_result(
+                    extracted_info, mapping, fields)
 
             logger.info(
                 f"LLMからマッピング情報を取得: {json.dumps(mapping, ensure_ascii=False, indent=0)}")
@@ -0,0 +1,111 @@
+"""
+プロセス内キャッシュユーティリティ
+Bedrock呼び出し結果などをTTL付きで保持する
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class TTLCache:
+    """
+    TTLとLRU方式の容量制限を持つスレッドセーフなキャッシュ
+
+    バックグラウンドタスクとリクエスト処理の両方から参照されるため、
+    すべての操作はロックで保護する
+    """
+
+    def __init__(self, max_entries=256, ttl_seconds=3600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """キーに対応する値を取得する（期限切れ・未登録の場合はNone）"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.misses += 1
+                return None
+
+            # 最近使用したエントリを末尾に移動
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        """値を登録する（容量超過時は最も古いエントリを削除）"""
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                evicted_key, _ = self._entries.popitem(last=False)
+                logger.debug(f"キャッシュエントリを削除しました: {evicted_key}")
+
+    def invalidate(self, key):
+        """指定したキーを削除する"""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """全エントリを削除する"""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+def _normalize_for_fingerprint(obj):
+    """バイナリを含むメッセージをハッシュ計算用のJSON互換データに変換する"""
+    if isinstance(obj, dict):
+        return {k: _normalize_for_fingerprint(v) for k, v in obj.items()}
+    elif isinstance(obj, (list, tuple)):
+        return [_normalize_for_fingerprint(item) for item in obj]
+    elif isinstance(obj, (bytes, bytearray)):
+        # 画像バイトはダイジェストのみを使用
+        return {"sha256": hashlib.sha256(obj).hexdigest()}
+    else:
+        return obj
+
+
+def build_request_fingerprint(messages, system_prompts=None, model_id=None, inference_config=None):
+    """
+    Bedrockリクエストの決定的なフィンガープリントを生成する
+
+    OCR結果・スキーマ・カスタムプロンプトはすべてメッセージ本文に含まれるため、
+    リクエスト全体をハッシュすることでそれらの変更を検知できる
+
+    Args:
+        messages (list): モデルに送信するメッセージのリスト
+        system_prompts (list, optional): システムプロンプトのリスト
+        model_id (str, optional): 使用するモデルID
+        inference_config (dict, optional): 推論パラメータ
+
+    Returns:
+        str: SHA-256のフィンガープリント
+    """
+    payload = {
+        "model_id": model_id,
+        "system": _normalize_for_fingerprint(system_prompts or []),
+        "messages": _normalize_for_fingerprint(messages),
+        "inference_config": inference_config or {}
+    }
+    serialized = json.dumps(payload, ensure_ascii=False,
+                            sort_keys=True, default=str)
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
@@ -2,9 +2,9 @@
 共通ヘルパー関数
 """
 import logging
+import os
 from decimal import Decimal
 from io import BytesIO
-from PIL import Image
 
 logger = logging.getLogger(__name__)
 
@@ -55,15 +55,20 @@ def safe_get_from_dynamo_data(data, key, default=None):
         return default
 
 
-def resize_image(image_data, max_dimension=1568, min_dimension=200):
+def resize_image(image_data, max_dimension=1568, min_dimension=200, img=None):
     """
     画像をリサイズする関数
     - 長辺が max_dimension を超える場合はリサイズ
     - 短辺が min_dimension より小さい場合は警告
     - アスペクト比は維持
+    - デコード済みの画像（img）を渡した場合は再デコードしない
     """
+    # Pillowは画像処理時のみ必要なため遅延インポート
+    from PIL import Image
+
     try:
-        img = Image.open(BytesIO(image_data))
+        if img is None:
+            img = Image.open(BytesIO(image_data))
         width, height = img.size
         
         # 画像サイズのログ記録
@@ -102,3 +107,96 @@ def resize_image(image_data, max_dimension=1568, min_dimension=200):
         logger.error(f"画像リサイズエラー: {str(e)}")
         # エラーの場合は元の画像を返す
         return image_data, False, None, None
+
+
+# 一覧・プレビュー表示用の縮小画像（階層名: 長辺の最大ピクセル数）
+IMAGE_TIERS = {
+    "preview": 1024,
+    "thumbnail": 256
+}
+
+
+def image_tier_s3_key(s3_key, tier):
+    """
+    画像のS3キーから縮小画像のS3キーを作成する
+
+    キーは元画像のキーから決定的に決まるため、レコードには作成済みの階層名だけを保存する
+    """
+    return f"tiers/{tier}/{os.path.splitext(s3_key)[0]}.jpeg"
+
+
+def create_image_tiers(img, bucket_name, s3_key):
+    """
+    デコード済みの画像から縮小画像を作成してS3に保存する
+
+    大きい階層から順に縮小し、前の階層の結果を次の縮小元にする。
+    縮小画像は表示用のため、作成に失敗しても変換処理は続行する
+
+    Args:
+        img (PIL.Image.Image): デコード済みの画像
+        bucket_name (str): 保存先のバケット名
+        s3_key (str): 元画像のS3キー
+
+    Returns:
+        list: 保存できた階層名のリスト
+    """
+    from PIL import Image
+    from clients import get_s3_client
+
+    saved_tiers = []
+    try:
+        source = img if img.mode in ("RGB", "L") else img.convert("RGB")
+        for tier, max_dimension in sorted(IMAGE_TIERS.items(), key=lambda item: -item[1]):
+            tier_img = source.copy()
+            tier_img.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+
+            output = BytesIO()
+            tier_img.save(output, format="JPEG", quality=80)
+            get_s3_client().put_object(
+                Bucket=bucket_name,
+                Key=image_tier_s3_key(s3_key, tier),
+                Body=output.getvalue(),
+                ContentType="image/jpeg"
+            )
+            saved_tiers.append(tier)
+            source = tier_img
+    except Exception as e:
+        logger.error(f"縮小画像の作成エラー: {s3_key}, {str(e)}")
+
+    return saved_tiers
+
+
+# ファイル先頭のマジックバイトとコンテンツタイプの対応
+_FILE_SIGNATURES = [
+    (b"%PDF-", "application/pdf"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"II*\x00", "image/tiff"),
+    (b"MM\x00*", "image/tiff"),
+    (b"BM", "image/bmp"),
+]
+
+# 種別の判定に必要な先頭バイト数
+SNIFF_HEADER_BYTES = 16
+
+
+def sniff_content_type(header: bytes):
+    """
+    ファイル先頭のバイト列からコンテンツタイプを判定する
+
+    アップロード時に指定されたContent-Typeは信頼できないため、実際の内容で判定する
+
+    Args:
+        header (bytes): ファイルの先頭バイト（SNIFF_HEADER_BYTES バイト以上）
+
+    Returns:
+        str: コンテンツタイプ（判定できない場合はNone）
+    """
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "image/webp"
+    for signature, content_type in _FILE_SIGNATURES:
+        if header.startswith(signature):
+            return content_type
+    return None
@@ -0,0 +1,201 @@
+"""
+Bedrockに送信する画像の準備
+モデルの画像トークンコストとページ数から解像度・JPEG品質を決め、準備済み画像をS3にキャッシュする
+"""
+import logging
+import math
+from io import BytesIO
+
+from botocore.exceptions import ClientError
+
+from clients import get_s3_client
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Claudeの画像トークンコスト（約 幅×高さ/750 トークン）
+PIXELS_PER_TOKEN = 750
+# これ以上の長辺はモデル側で縮小されるため送信しても精度は上がらない
+MODEL_MAX_LONG_EDGE = 1568
+# モデル側で縮小されずに済む1画像あたりの上限トークン数（約1.15メガピクセル）
+MODEL_MAX_IMAGE_TOKENS = 1600
+# 画像が小さすぎると文字が読めなくなるため、これ以上は縮小しない
+MIN_IMAGE_TOKENS = 400
+# Converse APIが受け付ける画像フォーマット
+SUPPORTED_FORMATS = {"jpeg", "png", "gif", "webp"}
+# 準備済み画像の保存先プレフィックス
+PREPARED_PREFIX = "prepared"
+
+
+def image_token_cost(width: int, height: int) -> int:
+    """画像サイズからモデルの入力トークン数を見積もる"""
+    return math.ceil(width * height / PIXELS_PER_TOKEN)
+
+
+def choose_image_target(page_count: int) -> dict:
+    """
+    ページ数と画像トークン予算から1ページあたりの目標サイズとJPEG品質を決める
+
+    ページ数が多いほど1ページあたりのトークンを減らし、品質も下げて転送量を抑える
+
+    Returns:
+        dict: {"max_tokens": int, "max_pixels": int, "quality": int}
+    """
+    per_page_tokens = settings.IMAGE_TOKEN_BUDGET // max(page_count, 1)
+    max_tokens = max(MIN_IMAGE_TOKENS, min(MODEL_MAX_IMAGE_TOKENS, per_page_tokens))
+
+    if max_tokens >= 1200:
+        quality = 85
+    elif max_tokens >= 800:
+        quality = 75
+    else:
+        quality = 65
+
+    return {
+        "max_tokens": max_tokens,
+        "max_pixels": max_tokens * PIXELS_PER_TOKEN,
+        "quality": quality
+    }
+
+
+def page_ocr_confidence(words: list) -> float:
+    """
+    ページのOCR認識スコアの平均を計算する
+
+    Returns:
+        float: 平均スコア（スコアを持つ単語がない場合はNone）
+    """
+    scores = []
+    for word in words or []:
+        if isinstance(word, dict) and word.get("rec_score") is not None:
+            try:
+                scores.append(float(word["rec_score"]))
+            except (TypeError, ValueError):
+                continue
+    if not scores:
+        return None
+    return sum(scores) / len(scores)
+
+
+def should_skip_image(words: list) -> bool:
+    """OCRの認識スコアが十分に高く、画像を添付しなくてよいかを判定"""
+    if not settings.ENABLE_IMAGE_SKIP_ON_HIGH_CONFIDENCE:
+        return False
+    confidence = page_ocr_confidence(words)
+    return confidence is not None and confidence >= settings.IMAGE_SKIP_CONFIDENCE_THRESHOLD
+
+
+def _prepared_key(s3_key: str, target: dict) -> str:
+    """準備済み画像のS3キーを作成"""
+    base_key = s3_key.rsplit(".", 1)[0]
+    return f"{PREPARED_PREFIX}/{base_key}_{target['max_tokens']}t_q{target['quality']}.jpeg"
+
+
+def _encode_variant(image_bytes: bytes, target: dict) -> tuple:
+    """
+    目標サイズに収まるように縮小してJPEGで再エンコードする
+
+    Returns:
+        tuple: (画像バイト, 幅, 高さ)
+    """
+    # Pillowは画像処理時のみ必要なため遅延インポート
+    from PIL import Image
+
+    img = Image.open(BytesIO(image_bytes))
+    width, height = img.size
+    scale = min(1.0,
+                math.sqrt(target["max_pixels"] / max(width * height, 1)),
+                MODEL_MAX_LONG_EDGE / max(width, height))
+    new_size = (max(int(width * scale), 1), max(int(height * scale), 1))
+
+    if new_size != (width, height):
+        img = img.resize(new_size, Image.LANCZOS)
+    if img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+
+    output = BytesIO()
+    img.save(output, format="JPEG", quality=target["quality"], optimize=True)
+    return output.getvalue(), new_size[0], new_size[1]
+
+
+def prepare_image_block(s3_key: str, image_bytes: bytes, content_type: str, page_count: int) -> tuple:
+    """
+    Bedrockに送信する画像ブロックを準備する
+
+    - 元画像が目標サイズ以内かつ対応フォーマットであればそのまま使用する
+    - それ以外は縮小・JPEG変換した画像を使用し、S3にキャッシュして再利用する
+
+    Args:
+        s3_key (str): 元画像のS3キー
+        image_bytes (bytes): 元画像のバイトデータ
+        content_type (str): 元画像のコンテンツタイプ
+        page_count (int): 同じリクエストに添付する画像の枚数
+
+    Returns:
+        tuple: (画像ブロック, 見積もりトークン数)
+    """
+    # Pillowは画像処理時のみ必要なため遅延インポート
+    from PIL import Image
+
+    target = choose_image_target(page_count)
+    image_format = content_type.split(
+        "/")[1] if content_type and "/" in content_type else "jpeg"
+    image_format = "jpeg" if image_format == "jpg" else image_format
+
+    try:
+        width, height = Image.open(BytesIO(image_bytes)).size
+    except Exception as e:
+        logger.warning(f"画像サイズを取得できないため元画像を使用します: {s3_key}, {str(e)}")
+        return _image_block(image_bytes, image_format), target["max_tokens"]
+
+    if (image_format in SUPPORTED_FORMATS
+            and width * height <= target["max_pixels"]
+            and max(width, height) <= MODEL_MAX_LONG_EDGE):
+        return _image_block(image_bytes, image_format), image_token_cost(width, height)
+
+    prepared_key = _prepared_key(s3_key, target)
+    bucket_name = settings.BUCKET_NAME
+
+    # キャッシュ済みの準備済み画像があれば使用
+    try:
+        response = get_s3_client().get_object(Bucket=bucket_name, Key=prepared_key)
+        prepared_bytes = response["Body"].read()
+        metadata = response.get("Metadata", {})
+        prepared_width = int(metadata.get("width", 0))
+        prepared_height = int(metadata.get("height", 0))
+        tokens = image_token_cost(prepared_width, prepared_height) if prepared_width and prepared_height else target["max_tokens"]
+        logger.info(f"準備済み画像を再利用します: {prepared_key}")
+        return _image_block(prepared_bytes, "jpeg"), tokens
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") not in ("NoSuchKey", "404"):
+            logger.warning(f"準備済み画像の取得に失敗しました: {prepared_key}, {str(e)}")
+
+    prepared_bytes, prepared_width, prepared_height = _encode_variant(
+        image_bytes, target)
+    logger.info(
+        f"画像を準備しました: {s3_key} {width}x{height}px ({len(image_bytes)} バイト) -> "
+        f"{prepared_width}x{prepared_height}px ({len(prepared_bytes)} バイト, 品質 {target['quality']})")
+
+    try:
+        get_s3_client().put_object(
+            Bucket=bucket_name,
+            Key=prepared_key,
+            Body=prepared_bytes,
+            ContentType="image/jpeg",
+            Metadata={"width": str(prepared_width), "height": str(prepared_height)}
+        )
+    except Exception as e:
+        # キャッシュの保存に失敗しても抽出は継続する
+        logger.warning(f"準備済み画像の保存に失敗しました: {prepared_key}, {str(e)}")
+
+    return _image_block(prepared_bytes, "jpeg"), image_token_cost(prepared_width, prepared_height)
+
+
+def _image_block(image_bytes: bytes, image_format: str) -> dict:
+    """Converse API用の画像ブロックを作成"""
+    return {
+        "image": {
+            "format": image_format,
+            "source": {"bytes": image_bytes}
+        }
+    }
@@ -0,0 +1,336 @@
+"""
+ストリーミングJSON解析ユーティリティ
+モデルの応答をチャンク単位で受け取り、完成した値を逐次通知する
+"""
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class IncrementalJsonScanner:
+    """
+    チャンク単位でJSONテキストを走査し、オブジェクト内の値が完成するたびに通知する
+
+    文字列・エスケープ・ネストの状態を保持するため、各文字は一度だけ走査される。
+    最初の '{' より前のテキスト（コードフェンスなど）は無視する
+    """
+
+    def __init__(self, on_value=None):
+        """
+        Args:
+            on_value (callable, optional): 値が完成したときに呼ばれる関数
+                                           on_value(path, raw_value) の形式で呼び出される
+                                           pathはルートからのキーのタプル
+        """
+        self.on_value = on_value
+        self.text = ""
+        self.pos = 0
+        self.started = False
+        self.finished = False
+        self.in_string = False
+        self.escape = False
+        self.string_start = None
+        # 各要素: {"type": "object"|"array", "key": str|None, "value_start": int|None}
+        self.stack = []
+
+    def feed(self, chunk: str) -> None:
+        """テキストチャンクを追加して走査する"""
+        if not chunk or self.finished:
+            return
+        self.text += chunk
+        self._scan()
+
+    def _path(self, key):
+        """現在のスタックからキーのパスを作成する"""
+        keys = tuple(frame["key"] for frame in self.stack[:-1]
+                     if frame["type"] == "object")
+        return keys + (key,)
+
+    def _emit(self, frame, end):
+        """オブジェクト内の値が完成したことを通知する"""
+        if frame["key"] is None or frame["value_start"] is None:
+            return
+        raw_value = self.text[frame["value_start"]:end].strip()
+        if raw_value and self.on_value:
+            try:
+                self.on_value(self._path(frame["key"]), raw_value)
+            except Exception as e:
+                logger.warning(f"ストリーミング値の通知処理でエラー: {str(e)}")
+        frame["key"] = None
+        frame["value_start"] = None
+
+    def _scan(self):
+        text = self.text
+        length = len(text)
+        i = self.pos
+
+        while i < length:
+            ch = text[i]
+
+            if not self.started:
+                if ch == "{":
+                    self.started = True
+                    self.stack.append(
+                        {"type": "object", "key": None, "value_start": None})
+                i += 1
+                continue
+
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+                    frame = self.stack[-1]
+                    # オブジェクトのキー位置で完成した文字列はキーとして扱う
+                    if frame["type"] == "object" and frame["value_start"] is None and frame["key"] is None:
+                        frame["key"] = json.loads(text[self.string_start:i + 1])
+                i += 1
+                continue
+
+            frame = self.stack[-1]
+
+            if ch == '"':
+                self.in_string = True
+                self.string_start = i
+            elif ch == ":" and frame["type"] == "object":
+                frame["value_start"] = i + 1
+            elif ch == ",":
+                if frame["type"] == "object":
+                    self._emit(frame, i)
+            elif ch in "{[":
+                self.stack.append({
+                    "type": "object" if ch == "{" else "array",
+                    "key": None,
+                    "value_start": None
+                })
+            elif ch in "}]":
+                if frame["type"] == "object":
+                    self._emit(frame, i)
+                self.stack.pop()
+                if not self.stack:
+                    self.finished = True
+                    i += 1
+                    break
+            i += 1
+
+        self.pos = i
+
+
+class _JsonRepairer:
+    """
+    最外側のJSONオブジェクトを1回の走査で切り出し、よくある崩れを修復する
+
+    - オブジェクト前後の説明文・コードフェンスは無視する
+    - 閉じ括弧直前の余分なカンマを除去する
+    - 出力が途中で切れた場合は、未完成の値・キーを取り除いてから括弧を閉じる
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+        self.out = []
+        # 各要素: {"type": "object"|"array", "expect": "key"|"colon"|"value"|"comma",
+        #          "member_start": 出力上で現在のメンバーが始まる位置}
+        self.stack = []
+        self.in_string = False
+        self.escape = False
+        self.scalar_start = None
+        self.complete = False
+
+    def _begin_value(self):
+        """値の開始時に、現在のメンバーの開始位置を記録する"""
+        if not self.stack:
+            return
+        frame = self.stack[-1]
+        if frame["type"] == "array" and frame["expect"] in ("value", "comma"):
+            frame["member_start"] = len(self.out)
+        frame["expect"] = "comma"
+
+    def _end_scalar(self):
+        self.scalar_start = None
+
+    def run(self):
+        text = self.text
+        start = text.find("{")
+        if start < 0:
+            return None
+
+        out = self.out
+        for ch in text[start:]:
+            if self.in_string:
+                out.append(ch)
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+                continue
+
+            if self.scalar_start is not None and ch in ",}] \t\r\n":
+                self._end_scalar()
+
+            if ch == '"':
+                frame = self.stack[-1] if self.stack else None
+                if frame and frame["type"] == "object" and frame["expect"] == "key":
+                    frame["member_start"] = len(out)
+                    frame["expect"] = "colon"
+                else:
+                    self._begin_value()
+                self.in_string = True
+                out.append(ch)
+            elif ch in "{[":
+                self._begin_value()
+                self.stack.append({
+                    "type": "object" if ch == "{" else "array",
+                    "expect": "key" if ch == "{" else "value",
+                    "member_start": None
+                })
+                out.append(ch)
+            elif ch in "}]":
+                if not self.stack:
+                    continue
+                # 閉じ括弧直前の余分なカンマを除去
+                self._strip_trailing_comma()
+                frame = self.stack.pop()
+                out.append("}" if frame["type"] == "object" else "]")
+                if not self.stack:
+                    self.complete = True
+                    break
+            elif ch == ":":
+                if self.stack and self.stack[-1]["type"] == "object":
+                    self.stack[-1]["expect"] = "value"
+                out.append(ch)
+            elif ch == ",":
+                if self.stack:
+                    frame = self.stack[-1]
+                    frame["expect"] = "key" if frame["type"] == "object" else "value"
+                    frame["member_start"] = None
+                out.append(ch)
+            elif ch in " \t\r\n":
+                out.append(ch)
+            else:
+                # 数値・true/false/nullなどのスカラー値
+                if self.scalar_start is None:
+                    self._begin_value()
+                    self.scalar_start = len(out)
+                out.append(ch)
+
+        if self.complete:
+            return "".join(out)
+        return self._close_truncated()
+
+    def _strip_trailing_comma(self):
+        out = self.out
+        position = len(out) - 1
+        while position >= 0 and out[position] in " \t\r\n":
+            position -= 1
+        if position >= 0 and out[position] == ",":
+            del out[position:]
+
+    def _close_truncated(self):
+        """途中で切れたJSONの未完成部分を取り除いて括弧を閉じる"""
+        out = self.out
+
+        if self.in_string:
+            if self.escape:
+                out.pop()
+            # 途中で切れたUnicodeエスケープ（\u30 など）は取り除く
+            tail = "".join(out[-5:])
+            backslash = tail.rfind("\\u")
+            if backslash >= 0 and len(tail) - backslash < 6:
+                del out[len(out) - (len(tail) - backslash):]
+            out.append('"')
+
+        # 未完成のスカラー値は、数値の途中（"12." や "1.5e-" など）なら有効な部分までを残し、
+        # それ以外（"tru" など）は取り除く
+        if self.scalar_start is not None:
+            token = "".join(out[self.scalar_start:]).strip()
+            try:
+                json.loads(token)
+            except ValueError:
+                del out[self.scalar_start:]
+                number = _complete_number_prefix(token)
+                if number is None:
+                    self._drop_incomplete_member()
+                else:
+                    out.append(number)
+
+        if self.stack:
+            frame = self.stack[-1]
+            # 値のないキー（"key" や "key":）は取り除く
+            if frame["type"] == "object" and frame["expect"] in ("colon", "value"):
+                self._drop_incomplete_member()
+
+        while self.stack:
+            self._strip_trailing_comma()
+            frame = self.stack.pop()
+            out.append("}" if frame["type"] == "object" else "]")
+
+        return "".join(out)
+
+    def _drop_incomplete_member(self):
+        if not self.stack:
+            return
+        frame = self.stack[-1]
+        if frame["member_start"] is not None:
+            del self.out[frame["member_start"]:]
+            frame["member_start"] = None
+        frame["expect"] = "comma"
+
+
+def _complete_number_prefix(token: str):
+    """途中で切れた数値から有効な部分を取り出す（数値でない場合はNone）"""
+    prefix = token.rstrip(".eE+-")
+    if not prefix or prefix[0] not in "-0123456789":
+        return None
+    try:
+        json.loads(prefix)
+    except ValueError:
+        return None
+    return prefix
+
+
+def extract_json_object(text: str):
+    """
+    モデルの応答テキストから最外側のJSONオブジェクトを取り出して解析する
+
+    まず最初の '{' から標準デコーダーで1つの値だけを読み取り（後続の説明文は無視）、
+    失敗した場合は1回の走査で余分なカンマの除去・途中切れの補完を行ってから再解析する
+
+    Args:
+        text (str): モデルの応答テキスト
+
+    Returns:
+        tuple: (解析結果の辞書またはNone, 状態 "ok" | "repaired" | "failed")
+    """
+    if not text:
+        return None, "failed"
+
+    start = text.find("{")
+    if start < 0:
+        return None, "failed"
+
+    decoder = json.JSONDecoder(strict=False)
+    try:
+        value, _ = decoder.raw_decode(text, start)
+        if isinstance(value, dict):
+            return value, "ok"
+    except ValueError:
+        pass
+
+    repaired = _JsonRepairer(text).run()
+    if repaired is None:
+        return None, "failed"
+    try:
+        value = json.loads(repaired, strict=False)
+    except ValueError as e:
+        logger.warning(f"JSONの修復に失敗しました: {str(e)}")
+        return None, "failed"
+
+    if not isinstance(value, dict):
+        return None, "failed"
+    logger.info("崩れたJSONを修復して解析しました")
+    return value, "repaired"
@@ -0,0 +1,162 @@
+"""
+OCR結果のレイアウト解析ユーティリティ
+単語のポリゴン座標から行・ブロック・表のセルを復元する
+"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 行の区切りとみなす縦方向の中心間隔（単語の高さの中央値に対する比率）
+LINE_GAP_RATIO = 0.5
+# 同じ行内でセルの区切りとみなす横方向の空白（単語の高さの中央値に対する比率）
+CELL_GAP_RATIO = 2.0
+# ブロック（段落）の区切りとみなす行間（単語の高さの中央値に対する比率）
+BLOCK_GAP_RATIO = 1.0
+
+
+def word_bbox(word: dict) -> tuple:
+    """
+    単語のポリゴン座標から外接矩形を取得する
+
+    Returns:
+        tuple: (x0, y0, x1, y1)。座標がない場合はNone
+    """
+    points = word.get("points") or []
+    if not points:
+        return None
+    try:
+        xs = [float(point[0]) for point in points]
+        ys = [float(point[1]) for point in points]
+    except (TypeError, ValueError, IndexError):
+        return None
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def analyze_layout(words: list) -> dict:
+    """
+    単語の外接矩形をまとめて計算し、行・ブロック・セルに分類する
+
+    1. 縦方向の中心でソートし、中心間隔が大きい位置で行を区切る
+    2. 行内は左端でソートし、横方向の空白が大きい位置でセルを区切る
+    3. 行間が大きい位置でブロック（段落・表などのまとまり）を区切る
+
+    Args:
+        words (list): "points"を持つ単語のリスト
+
+    Returns:
+        dict: {
+            "lines": [{"word_indices": [...], "cells": [[...], ...], "bbox": (x0, y0, x1, y1), "block": int}],
+            "blocks": [[行番号, ...], ...],
+            "word_to_line": [行番号, ...]  # wordsと同じ長さ（座標のない単語も単独の行になる）
+        }
+        インデックスはすべてwords内の位置
+    """
+    import numpy as np
+
+    word_count = len(words)
+    boxes = np.full((word_count, 4), np.nan)
+    for index, word in enumerate(words):
+        bbox = word_bbox(word) if isinstance(word, dict) else None
+        if bbox is not None:
+            boxes[index] = bbox
+
+    valid_indices = np.flatnonzero(~np.isnan(boxes[:, 0]))
+    lines = []
+
+    if len(valid_indices) > 0:
+        valid_boxes = boxes[valid_indices]
+        heights = valid_boxes[:, 3] - valid_boxes[:, 1]
+        median_height = max(float(np.median(heights)), 1.0)
+        centers_y = (valid_boxes[:, 1] + valid_boxes[:, 3]) / 2
+
+        # 縦方向の中心でソートし、間隔が大きい位置で行を区切る
+        order = np.argsort(centers_y, kind="stable")
+        line_breaks = np.flatnonzero(
+            np.diff(centers_y[order]) > median_height * LINE_GAP_RATIO) + 1
+
+        for group in np.split(order, line_breaks):
+            group_boxes = valid_boxes[group]
+            x_order = np.argsort(group_boxes[:, 0], kind="stable")
+            group = group[x_order]
+            group_boxes = group_boxes[x_order]
+
+            # 前の単語の右端から次の単語の左端までの空白でセルを区切る
+            gaps = group_boxes[1:, 0] - group_boxes[:-1, 2]
+            cell_breaks = np.flatnonzero(
+                gaps > median_height * CELL_GAP_RATIO) + 1
+            word_indices = valid_indices[group]
+
+            lines.append({
+                "word_indices": word_indices.tolist(),
+                "cells": [cell.tolist() for cell in np.split(word_indices, cell_breaks)],
+                "bbox": (float(group_boxes[:, 0].min()), float(group_boxes[:, 1].min()),
+                         float(group_boxes[:, 2].max()), float(group_boxes[:, 3].max()))
+            })
+
+        # 行間が大きい位置でブロックを区切る
+        line_boxes = np.array([line["bbox"] for line in lines])
+        block_breaks = np.flatnonzero(
+            line_boxes[1:, 1] - line_boxes[:-1, 3] > median_height * BLOCK_GAP_RATIO) + 1
+        block_ids = np.zeros(len(lines), dtype=int)
+        block_ids[block_breaks] = 1
+        block_ids = np.cumsum(block_ids)
+        for line, block_id in zip(lines, block_ids.tolist()):
+            line["block"] = block_id
+        next_block = int(block_ids[-1]) + 1
+    else:
+        next_block = 0
+
+    # 座標のない単語はそれぞれ単独の行・ブロックとして末尾に追加する
+    for index in np.flatnonzero(np.isnan(boxes[:, 0])).tolist():
+        lines.append({"word_indices": [index], "cells": [[index]],
+                      "bbox": None, "block": next_block})
+        next_block += 1
+
+    word_to_line = [0] * word_count
+    blocks = [[] for _ in range(next_block)]
+    for line_number, line in enumerate(lines):
+        blocks[line["block"]].append(line_number)
+        for index in line["word_indices"]:
+            word_to_line[index] = line_number
+
+    return {"lines": lines, "blocks": blocks, "word_to_line": word_to_line}
+
+
+def group_words_into_lines(words: list) -> list:
+    """
+    単語を座標に基づいて行にまとめる
+
+    Args:
+        words (list): "points"を持つ単語のリスト
+
+    Returns:
+        list: 行ごとの単語インデックス（wordsの位置）のリスト（上から順、行内は左から順）
+    """
+    if not words:
+        return []
+    return [line["word_indices"] for line in analyze_layout(words)["lines"]]
+
+
+def build_layout_text(words: list, layout: dict = None) -> str:
+    """
+    読み順に並べたテキストを作成する（行は改行、ブロックは空行で区切る）
+
+    Args:
+        words (list): "content"と"points"を持つ単語のリスト
+        layout (dict, optional): analyze_layoutの結果（未指定時は計算する）
+
+    Returns:
+        str: 読み順のテキスト
+    """
+    if not words:
+        return ""
+    layout = layout or analyze_layout(words)
+    block_texts = []
+    for block in layout["blocks"]:
+        line_texts = [
+            " ".join(words[index].get("content", "")
+                     for index in layout["lines"][line_number]["word_indices"])
+            for line_number in block
+        ]
+        block_texts.append("\n".join(line_texts))
+    return "\n\n".join(block_texts)
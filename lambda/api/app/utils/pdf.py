@@ -1,20 +1,17 @@
 """
 PDF処理関連のユーティリティ関数
 """
-from clients import s3_client
+from clients import get_s3_client
 import logging
 import uuid
 import os
 from datetime import datetime
-import boto3
-import fitz
-from PIL import Image
 import tempfile
 
 from config import settings
 from database import get_image, update_image_status, update_converted_image, update_ocr_result, update_parent_document_status, create_individual_page_record
 from app_schema import DEFAULT_APP, get_app_input_methods
-from utils.helpers import resize_image
+from utils.helpers import resize_image, create_image_tiers, IMAGE_TIERS
 
 logger = logging.getLogger(__name__)
 
@@ -50,7 +47,7 @@ def convert_pdf_to_image(image_id: str, s3_key: str):
         logger.info(f"S3バケット名: {bucket_name}")
 
         # S3からPDFファイルを取得
-        s3_response = s3_client.get_object(Bucket=bucket_name, Key=s3_key)
+        s3_response = get_s3_client().get_object(Bucket=bucket_name, Key=s3_key)
         file_content = s3_response['Body'].read()
 
         # 一時ファイルに保存
@@ -59,6 +56,9 @@ def convert_pdf_to_image(image_id: str, s3_key: str):
             temp_pdf_path = temp_pdf.name
 
         try:
+            # PyMuPDFはPDF変換時のみ必要なため遅延インポート
+            import fitz
+
             # PDFを開く
             pdf_document = fitz.open(temp_pdf_path)
 
@@ -114,6 +114,8 @@ def process_combined_pages(pdf_document, image_id: str, s3_key: str, upload_buck
     """
     複数ページPDFを複数画像として処理する（元の実装）
     """
+    from PIL import Image
+
     try:
         total_pages = pdf_document.page_count
         logger.info(f"複数画像処理を開始: {total_pages}ページ")
@@ -129,6 +131,7 @@ def process_combined_pages(pdf_document, image_id: str, s3_key: str, upload_buck
 
         # 複数ページを個別画像として保存
         page_s3_keys = []
+        page_tiers = []
         filename_base = os.path.splitext(os.path.basename(s3_key))[0]
 
         for page_num in range(total_pages):
@@ -157,7 +160,7 @@ def process_combined_pages(pdf_document, image_id: str, s3_key: str, upload_buck
             page_s3_key = f"converted/{datetime.now().isoformat()}_{filename_base}_page_{page_num + 1}.jpeg"
 
             # S3にアップロード
-            s3_client.put_object(
+            get_s3_client().put_object(
                 Bucket=upload_bucket,
                 Key=page_s3_key,
                 Body=resized_image_data if was_resized else img_data,
@@ -168,6 +171,15 @@ def process_combined_pages(pdf_document, image_id: str, s3_key: str, upload_buck
             logger.info(
                 f"ページ {page_num + 1}/{total_pages} 保存完了: {page_s3_key}")
 
+            # 一覧・プレビュー用の縮小画像を作成（デコード済みの画像から作成する）
+            if settings.ENABLE_IMAGE_TIERS:
+                page_tiers.append(create_image_tiers(img, upload_bucket, page_s3_key))
+
+        # 全ページで作成できた階層のみを利用可能とする
+        image_tiers = None
+        if settings.ENABLE_IMAGE_TIERS:
+            image_tiers = [tier for tier in IMAGE_TIERS if all(tier in tiers for tiers in page_tiers)]
+
         # DynamoDBを更新（複数S3キーを保存）
         update_converted_image(
             image_id,
@@ -176,7 +188,9 @@ def process_combined_pages(pdf_document, image_id: str, s3_key: str, upload_buck
             None,  # original_size（複数画像の場合は個別管理）
             None,  # new_size（複数画像の場合は個別管理）
             page_processing_mode="combined",
-            total_pages=total_pages
+            total_pages=total_pages,
+            content_type="image/jpeg",
+            image_tiers=image_tiers
         )
         logger.info(f"複数画像処理完了: {image_id}, {total_pages}ページ")
 
@@ -189,6 +203,8 @@ def process_single_page_combined(pdf_document, image_id: str, s3_key: str, uploa
     """
     単一ページPDFを処理する（統合処理モード）
     """
+    from PIL import Image
+
     try:
         logger.info("単一ページPDFを処理します（統合モード）")
 
@@ -222,13 +238,18 @@ def process_single_page_combined(pdf_document, image_id: str, s3_key: str, uploa
         converted_s3_key = f"converted/{datetime.now().isoformat()}_{filename_base}_single.jpeg"
 
         # S3にアップロード（常に環境変数のバケットを使用）
-        s3_client.put_object(
+        get_s3_client().put_object(
             Bucket=upload_bucket,
             Key=converted_s3_key,
             Body=resized_image_data if was_resized else img_data,
             ContentType='image/jpeg'
         )
 
+        # 一覧・プレビュー用の縮小画像を作成（デコード済みの画像から作成する）
+        image_tiers = None
+        if settings.ENABLE_IMAGE_TIERS:
+            image_tiers = create_image_tiers(img, upload_bucket, converted_s3_key)
+
         # DynamoDBを更新（単一ページでもリスト形式で保存）
         update_converted_image(
             image_id,
@@ -237,7 +258,9 @@ def process_single_page_combined(pdf_document, image_id: str, s3_key: str, uploa
             orig_size if was_resized else original_size,
             new_size if was_resized else original_size,
             page_processing_mode="combined",
-            total_pages=1
+            total_pages=1,
+            content_type="image/jpeg",
+            image_tiers=image_tiers
         )
         logger.info(f"単一ページ処理完了: {image_id}")
 
@@ -305,6 +328,8 @@ def create_individual_page(pdf_document, page_num: int, parent_image_id: str,
     Returns:
         str: 作成されたページのID
     """
+    from PIL import Image
+
     # ページを画像として処理
     page = pdf_document[page_num]
     pix = page.get_pixmap(dpi=300)
@@ -336,13 +361,18 @@ def create_individual_page(pdf_document, page_num: int, parent_image_id: str,
     page_s3_key = f"converted/{datetime.now().isoformat()}_{filename_base}_page_{page_num + 1}.jpeg"
 
     # S3にアップロード
-    s3_client.put_object(
+    get_s3_client().put_object(
         Bucket=upload_bucket,
         Key=page_s3_key,
         Body=resized_image_data if was_resized else img_data,
         ContentType='image/jpeg'
     )
 
+    # 一覧・プレビュー用の縮小画像を作成（デコード済みの画像から作成する）
+    image_tiers = None
+    if settings.ENABLE_IMAGE_TIERS:
+        image_tiers = create_image_tiers(img, upload_bucket, page_s3_key)
+
     # 個別ページレコードを作成
     page_id = str(uuid.uuid4())
     parent_data = get_image(parent_image_id)
@@ -356,7 +386,9 @@ def create_individual_page(pdf_document, page_num: int, parent_image_id: str,
         total_pages=total_pages,
         app_name=parent_data.get("app_name"),
         original_size=orig_size if was_resized else original_size,
-        new_size=new_size if was_resized else original_size
+        new_size=new_size if was_resized else original_size,
+        content_type="image/jpeg",
+        image_tiers=image_tiers
     )
 
     return page_id
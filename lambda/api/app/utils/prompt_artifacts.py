@@ -0,0 +1,129 @@
+"""
+コンパイル済みプロンプトの管理
+アプリスキーマのみに依存するプロンプト部品をアプリ＋スキーマバージョン単位で一度だけ生成して再利用する
+"""
+import hashlib
+import json
+import logging
+import threading
+
+from config import settings
+from utils.schema_shard import partition_fields
+from utils.template import generate_unified_template, generate_extraction_targets
+from utils.prompts import (
+    create_single_with_ocr_static_prompt, create_multi_with_ocr_static_prompt,
+    EXAMPLE_OCR, EXAMPLE_OUTPUT, MULTI_EXTRACTION_INSTRUCTIONS
+)
+
+logger = logging.getLogger(__name__)
+
+# アプリ名 -> コンパイル済みプロンプト
+_compiled_prompts = {}
+_compiled_prompts_lock = threading.Lock()
+
+
+def compute_schema_version(app_schema: dict) -> str:
+    """
+    プロンプトに影響するスキーマ内容からバージョン文字列を計算する
+
+    別インスタンスでの更新にも追従できるよう、フィールド定義とカスタムプロンプトの内容自体をハッシュする
+    """
+    payload = {
+        "fields": app_schema.get("fields", []),
+        "custom_prompt": app_schema.get("custom_prompt", "")
+    }
+    serialized = json.dumps(payload, ensure_ascii=False,
+                            sort_keys=True, default=str)
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+
+def _compile_fields(fields: list, custom_prompt: str) -> dict:
+    """フィールド定義から抽出フィールド・フィールド名・テンプレート・不変プロンプトを生成する"""
+    # 循環インポートを避けるため関数内でインポート
+    from app_schema import collect_field_names
+
+    extraction_fields = {"fields": fields}
+    extraction_targets = generate_extraction_targets(fields)
+    unified_template = generate_unified_template(extraction_fields)
+
+    return {
+        "extraction_fields": extraction_fields,
+        "field_names": collect_field_names(fields),
+        "extraction_targets": extraction_targets,
+        "unified_template": unified_template,
+        "single_static_prompt": create_single_with_ocr_static_prompt(
+            extraction_targets, unified_template, EXAMPLE_OCR, EXAMPLE_OUTPUT, custom_prompt),
+        "multi_static_prompt": create_multi_with_ocr_static_prompt(
+            unified_template, MULTI_EXTRACTION_INSTRUCTIONS, custom_prompt)
+    }
+
+
+def compile_prompt_artifact(app_schema: dict) -> dict:
+    """
+    アプリスキーマからプロンプト部品を生成する
+
+    スキーマ分割が有効な場合は、シャードごとのプロンプト部品も "shards" に含める
+
+    Args:
+        app_schema (dict): get_app_schemaで取得したアプリスキーマ
+
+    Returns:
+        dict: 抽出フィールド・フィールド名・テンプレート・不変プロンプトを含む辞書
+    """
+    fields = app_schema.get("fields", [])
+    custom_prompt = app_schema.get("custom_prompt", "")
+
+    artifact = {
+        "app_name": app_schema.get("name"),
+        "version": compute_schema_version(app_schema),
+        "custom_prompt": custom_prompt,
+        **_compile_fields(fields, custom_prompt),
+        "shards": []
+    }
+
+    if settings.ENABLE_SCHEMA_SHARDING:
+        shard_fields = partition_fields(
+            fields, settings.SCHEMA_SHARD_MAX_WEIGHT, settings.SCHEMA_SHARD_MAX_COUNT)
+        if len(shard_fields) > 1:
+            artifact["shards"] = [_compile_fields(shard, custom_prompt)
+                                  for shard in shard_fields]
+
+    return artifact
+
+
+def get_compiled_prompt(app_name: str) -> dict:
+    """
+    アプリのコンパイル済みプロンプトを取得する
+
+    スキーマは毎回1回だけ取得し、バージョンが一致すればキャッシュ済みの部品を返す
+
+    Args:
+        app_name (str): アプリ名
+
+    Returns:
+        dict: コンパイル済みプロンプト
+    """
+    from app_schema import get_app_schema
+
+    app_schema = get_app_schema(app_name)
+    version = compute_schema_version(app_schema)
+
+    with _compiled_prompts_lock:
+        artifact = _compiled_prompts.get(app_name)
+    if artifact and artifact["version"] == version:
+        logger.debug(f"コンパイル済みプロンプトを再利用します: {app_name}")
+        return artifact
+
+    artifact = compile_prompt_artifact(app_schema)
+    with _compiled_prompts_lock:
+        _compiled_prompts[app_name] = artifact
+    logger.info(
+        f"プロンプトをコンパイルしました: {app_name}, バージョン: {version[:12]}")
+    return artifact
+
+
+def invalidate_compiled_prompt(app_name: str) -> None:
+    """スキーマ更新・削除時にコンパイル済みプロンプトを破棄する"""
+    with _compiled_prompts_lock:
+        if _compiled_prompts.pop(app_name, None) is not None:
+            logger.info(f"コンパイル済みプロンプトを破棄しました: {app_name}")
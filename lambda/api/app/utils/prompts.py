@@ -2,12 +2,78 @@
 プロンプト生成関数
 """
 import json
-from utils.helpers import decimal_to_float, safe_get_from_dynamo_data
-from utils.template import generate_unified_template
+from utils.helpers import decimal_to_float
+from utils.token_budget import render_verbose_page, render_compact_page
 import logging
 
 logger = logging.getLogger(__name__)
 
+# 行単位に圧縮したOCRテキストの読み方
+COMPACT_OCR_NOTE = """
+OCRテキストは行単位にまとめています。各行の [ID:a-b] は、その行の単語を左から順に a〜b の単語IDで表します（カンマ区切りの場合は記載順）。
+indicesには行全体ではなく、抽出した値に対応する単語のIDのみを指定してください。
+"""
+
+# 行ID形式のOCRテキストの読み方
+LINE_OCR_NOTE = """
+OCRテキストは行単位にまとめ、各行に [L:n] の行IDを付与しています（" | " は表のセルの区切りです）。
+indicesには単語IDではなく、抽出した値が含まれる行の行IDを指定してください。
+"""
+
+# 複数画像抽出の指示文
+MULTI_EXTRACTION_INSTRUCTIONS = "以下のスキーマに従って、文書から情報を抽出してください。"
+
+# 例示用のOCR結果とその抽出例
+EXAMPLE_OCR = {
+    "words": [
+        {"id": 0, "content": "注文日：2023年5月1日", "points": [
+            [50, 120], [250, 120], [250, 150], [50, 150]]},
+        {"id": 1, "content": "委託業務内容：配送業務", "points": [
+            [50, 180], [300, 180], [300, 210], [50, 210]]},
+        {"id": 2, "content": "運行日：2023年5月15日", "points": [
+            [50, 240], [250, 240], [250, 270], [50, 270]]},
+        {"id": 3, "content": "A001", "points": [
+            [50, 400], [100, 400], [100, 430], [50, 430]]},
+        {"id": 4, "content": "東京", "points": [
+            [150, 400], [200, 400], [200, 430], [150, 430]]},
+        {"id": 5, "content": "大阪", "points": [
+            [250, 400], [300, 400], [300, 430], [250, 430]]}
+    ]
+}
+
+EXAMPLE_OUTPUT = {
+    "order_date": "2023年5月1日",
+    "operation_info": {
+        "contract_work": "配送業務",
+        "operation_date": "2023年5月15日"
+    },
+    "shipment_details": [
+        {
+            "reception_number": "A001",
+            "destination": "東京",
+            "origin": "大阪",
+            "vehicle_number": "",
+            "fare": ""
+        }
+    ],
+    "indices": {
+        "order_date": [0],
+        "operation_info": {
+            "contract_work": [1],
+            "operation_date": [2]
+        },
+        "shipment_details": [
+            {
+                "reception_number": [3],
+                "destination": [4],
+                "origin": [5],
+                "vehicle_number": [],
+                "fare": []
+            }
+        ]
+    }
+}
+
 
 def create_multi_without_ocr_prompt(extraction_fields, field_names, custom_prompt=""):
     """OCRなし複数画像モード用のプロンプトを作成"""
@@ -94,11 +160,16 @@ def create_single_without_ocr_prompt(extraction_fields, field_names, custom_prom
     return prompt
 
 
-def create_single_with_ocr_prompt(extraction_targets, unified_template, example_ocr, example_output,
-                                  ocr_result, custom_prompt):
-    """OCRあり単一画像用のプロンプトを作成"""
+def create_single_with_ocr_static_prompt(extraction_targets, unified_template, example_ocr, example_output,
+                                         custom_prompt):
+    """
+    OCRあり単一画像用プロンプトのうち、アプリごとに不変な部分を作成
 
-    prompt = f"""
+    指示・例示・抽出項目・カスタム指示・出力形式はスキーマのみに依存するため、
+    アプリ単位で事前に作成して再利用できる
+    """
+
+    return f"""
     次のOCR結果から指定された情報を抽出してください。
     
     抽出対象情報には以下の型があります：
@@ -124,10 +195,6 @@ def create_single_with_ocr_prompt(extraction_targets, unified_template, example_
     <extraction_fields>
     {extraction_targets}
     </extraction_fields>
-
-    <ocr_result>
-    {json.dumps(decimal_to_float(ocr_result), ensure_ascii=False, indent=0)}
-    </ocr_result>
     
     {f'''
     <custom_instructions>
@@ -140,62 +207,52 @@ def create_single_with_ocr_prompt(extraction_targets, unified_template, example_
     </output_format>
     """
 
-    return prompt
 
+def create_single_with_ocr_document_prompt(ocr_result, ocr_pages: list = None, chunk_note: str = "",
+                                           line_ids: bool = False):
+    """
+    OCRあり単一画像用プロンプトのうち、文書ごとに変わる部分（OCR結果）を作成
 
-def create_multi_with_ocr_prompt(ocr_results: list, schema: dict, instructions: str, custom_prompt: str = ""):
-    """OCRあり複数画像用のプロンプト生成（マッピング対応、カスタムプロンプト対応）"""
-
-    # OCR結果をページ別に整理し、全単語にIDを付与
-    ocr_text_by_page = []
-    all_words_with_ids = []  # 全単語にIDを付与
-    word_id = 0
-
-    for i, page_result in enumerate(ocr_results):
-        # page_resultが辞書でない場合はスキップ
-        if not isinstance(page_result, dict):
-            logger.warning(
-                f"ページ結果が辞書形式ではありません: {type(page_result)} - {page_result}")
-            continue
-
-        page_num = safe_get_from_dynamo_data(page_result, "page", 1)
-        page_words = safe_get_from_dynamo_data(page_result, "words", [])
-
-        # page_wordsがリストでない場合は空リストに
-        if not isinstance(page_words, list):
-            logger.warning(
-                f"ページ単語がリスト形式ではありません: {type(page_words)} - {page_words}")
-            page_words = []
-
-        # 各単語にIDを付与
-        page_text_parts = []
-        for word in page_words:
-            # wordが辞書でない場合はスキップ
-            if not isinstance(word, dict):
-                logger.warning(f"単語が辞書形式ではありません: {type(word)} - {word}")
-                continue
-
-            word_content = safe_get_from_dynamo_data(
-                word, "content", "").strip()
-            if word_content:
-                page_text_parts.append(f"[ID:{word_id}] {word_content}")
-                all_words_with_ids.append({
-                    "id": word_id,
-                    "content": word_content,
-                    "page": page_num,
-                    "points": safe_get_from_dynamo_data(word, "points", [])
-                })
-                word_id += 1
-
-        page_text = " ".join(page_text_parts)
-        ocr_text_by_page.append(f"=== ページ {page_num} OCRテキスト ===\n{page_text}")
+    Args:
+        ocr_result (dict): OCR結果
+        ocr_pages (list, optional): 行単位に圧縮したページリスト（指定時は圧縮形式で出力）
+        chunk_note (str, optional): 分割抽出時に付加する注意書き
+        line_ids (bool): ocr_pagesの"lines"が行ID形式の場合はTrue
+    """
 
-    combined_ocr_text = "\n\n".join(ocr_text_by_page)
+    if ocr_pages is not None:
+        compact_text = "\n".join("\n".join(page.get("lines", []))
+                                 for page in ocr_pages)
+        return f"""
+    <ocr_lines>
+    {compact_text}
+    </ocr_lines>
+    {LINE_OCR_NOTE if line_ids else COMPACT_OCR_NOTE}{chunk_note}
+    上記のOCR結果から、output_formatの形式で情報を抽出してください。
+    """
 
-    # スキーマから統合テンプレートを生成
-    unified_template = generate_unified_template(schema)
+    # 認識スコアは抽出に使用しないためプロンプトには含めない
+    ocr_result = dict(ocr_result)
+    if isinstance(ocr_result.get("words"), list):
+        ocr_result["words"] = [
+            {key: value for key, value in word.items() if key != "rec_score"}
+            if isinstance(word, dict) else word
+            for word in ocr_result["words"]
+        ]
 
-    prompt = f"""
+    return f"""
+    <ocr_result>
+    {json.dumps(decimal_to_float(ocr_result), ensure_ascii=False, indent=0)}
+    </ocr_result>
+
+    上記のOCR結果から、output_formatの形式で情報を抽出してください。
+    """
+
+
+def create_multi_with_ocr_static_prompt(unified_template: str, instructions: str, custom_prompt: str = ""):
+    """OCRあり複数画像用プロンプトのうち、アプリごとに不変な部分を作成"""
+
+    return f"""
 複数ページのOCR結果から以下の情報を抽出してください。
 
 <instructions>
@@ -208,16 +265,71 @@ def create_multi_with_ocr_prompt(ocr_results: list, schema: dict, instructions:
 </custom_instructions>
 ''' if custom_prompt else ''}
 
-<ocr_results>
-{combined_ocr_text}
-</ocr_results>
-
 <output_format>
 {unified_template}
 </output_format>
+"""
+
+
+def create_multi_with_ocr_document_prompt(ocr_pages: list, compact: bool = False, chunk_note: str = "",
+                                          line_ids: bool = False):
+    """
+    OCRあり複数画像用プロンプトのうち、文書ごとに変わる部分（ページ別OCR結果）を作成
 
+    Args:
+        ocr_pages (list): prepare_ocr_pagesで単語IDを付与したページリスト
+        compact (bool): Trueの場合は行単位に圧縮したテキスト（各ページの"lines"）を使用
+        chunk_note (str, optional): 分割抽出時に付加する注意書き
+        line_ids (bool): 各ページの"lines"が行ID形式の場合はTrue
+    """
+
+    if compact:
+        ocr_text_by_page = [render_compact_page(
+            page, page.get("lines")) for page in ocr_pages]
+    else:
+        ocr_text_by_page = [render_verbose_page(page) for page in ocr_pages]
+
+    combined_ocr_text = "\n\n".join(ocr_text_by_page)
+
+    document_prompt = f"""
+<ocr_results>
+{combined_ocr_text}
+</ocr_results>
+{(LINE_OCR_NOTE if line_ids else COMPACT_OCR_NOTE) if compact else ''}{chunk_note}
 重要：回答は必ずJSONオブジェクトのみを返してください。説明文、コメント、マークダウン記法は一切含めないでください。
 """
 
-    logger.info(f"複数ページプロンプト生成完了: {len(ocr_results)}ページ, {word_id}個の単語にID付与")
-    return prompt
+    word_count = sum(len(page["words"]) for page in ocr_pages)
+    logger.info(f"複数ページプロンプト生成完了: {len(ocr_pages)}ページ, {word_count}個の単語にID付与")
+    return document_prompt
+
+
+def create_chunk_note(index: int, total: int) -> str:
+    """分割抽出時に文書プロンプトへ付加する注意書きを作成"""
+    return f"""
+これは文書全体を{total}分割したうちの{index + 1}番目です。この部分に含まれない項目は空文字列とし、IDは空の配列にしてください。
+"""
+
+
+def build_user_content(static_prompt, document_prompt, image_blocks=None, enable_cache=False):
+    """
+    プロンプトキャッシュを考慮したユーザーメッセージのコンテンツを構築する
+
+    アプリごとに不変なプロンプトを先頭に置き、その直後にキャッシュポイントを挿入する。
+    画像とOCR結果は文書ごとに変わるため、キャッシュポイントより後ろに配置する
+
+    Args:
+        static_prompt (str): アプリごとに不変なプロンプト
+        document_prompt (str): 文書ごとのプロンプト（OCR結果など）
+        image_blocks (list, optional): Converse APIの画像コンテンツブロック
+        enable_cache (bool): キャッシュポイントを挿入するか
+
+    Returns:
+        list: Converse APIのコンテンツブロックのリスト
+    """
+    content = [{"text": static_prompt}]
+    if enable_cache:
+        content.append({"cachePoint": {"type": "default"}})
+    content.extend(image_blocks or [])
+    content.append({"text": document_prompt})
+    return content
@@ -0,0 +1,163 @@
+"""
+抽出結果の統合ユーティリティ
+分割して実行した抽出の結果（extracted_dataとindices）をスキーマに従って1つにまとめる
+"""
+import logging
+
+from utils.schema_validation import empty_field
+
+logger = logging.getLogger(__name__)
+
+
+def _is_empty(value) -> bool:
+    """抽出値が空かどうかを判定"""
+    return value is None or value == "" or value == [] or value == {}
+
+
+def _has_word_ids(indices) -> bool:
+    """indicesに単語IDが1つ以上含まれるかを判定"""
+    if isinstance(indices, dict):
+        return any(_has_word_ids(value) for value in indices.values())
+    if isinstance(indices, list):
+        return any(_has_word_ids(value) if isinstance(value, (dict, list)) else True
+                   for value in indices)
+    return False
+
+
+def _merge_field(field: dict, candidates: list) -> tuple:
+    """
+    1フィールド分の候補を統合する
+
+    Args:
+        field (dict): フィールド定義
+        candidates (list): (値, indices) のタプルのリスト（分割順）
+
+    Returns:
+        tuple: (統合した値, 統合したindices)
+    """
+    field_type = field.get("type", "string")
+
+    # list型は各分割の項目を順に連結する
+    if field_type == "list":
+        items = []
+        item_indices = []
+        for value, indices in candidates:
+            if not isinstance(value, list):
+                continue
+            if not isinstance(indices, list):
+                indices = []
+            for position, item in enumerate(value):
+                item_index = indices[position] if position < len(indices) else {}
+                # 同じ単語を指す同一の項目（ページ境界で重複抽出されたもの）は1つにまとめる
+                if _has_word_ids(item_index) and any(
+                        item == existing and item_index == existing_index
+                        for existing, existing_index in zip(items, item_indices)):
+                    continue
+                items.append(item)
+                item_indices.append(item_index)
+        return items, item_indices
+
+    # map型は子フィールドごとに再帰的に統合する
+    if field_type == "map" and "fields" in field:
+        merged_value = {}
+        merged_indices = {}
+        for child in field["fields"]:
+            child_name = child["name"]
+            child_candidates = [
+                (value.get(child_name) if isinstance(value, dict) else None,
+                 indices.get(child_name) if isinstance(indices, dict) else None)
+                for value, indices in candidates
+            ]
+            merged_value[child_name], merged_indices[child_name] = _merge_field(
+                child, child_candidates)
+        return merged_value, merged_indices
+
+    # string型などは最初に見つかった空でない値を採用する
+    for value, indices in candidates:
+        if not _is_empty(value):
+            return value, indices if indices is not None else []
+    return "", []
+
+
+def merge_extraction_results(results: list, fields: list) -> tuple:
+    """
+    分割して抽出した結果をスキーマに従って統合する
+
+    Args:
+        results (list): parse_extraction_responseの戻り値 (extracted_info, mapping) のリスト
+        fields (list): 抽出フィールド定義のリスト
+
+    Returns:
+        tuple: (extracted_info, mapping)
+    """
+    valid_results = [
+        (extracted_info, mapping) for extracted_info, mapping in results
+        if isinstance(extracted_info, dict) and "error" not in extracted_info
+    ]
+
+    if not valid_results:
+        # すべて失敗した場合は最初のエラー結果をそのまま返す
+        logger.error("分割抽出の結果がすべて失敗しました")
+        return results[0] if results else ({}, {})
+
+    if len(valid_results) < len(results):
+        logger.warning(
+            f"分割抽出の一部が失敗しました: 成功 {len(valid_results)}/{len(results)}")
+
+    extracted_info = {}
+    mapping = {}
+    for field in fields:
+        name = field["name"]
+        candidates = [
+            (info.get(name), field_mapping.get(name) if isinstance(field_mapping, dict) else None)
+            for info, field_mapping in valid_results
+        ]
+        extracted_info[name], mapping[name] = _merge_field(field, candidates)
+
+    return extracted_info, mapping
+
+
+def merge_shard_results(shard_results: list, shards: list, fields: list) -> tuple:
+    """
+    スキーマを分割して抽出した結果を統合する
+
+    各シャードの結果からは担当フィールドのみを採用し、スキーマ上の順序で並べる。
+    失敗したシャードの担当フィールドは空の値とする
+
+    Args:
+        shard_results (list): シャードごとの (extracted_info, mapping) のリスト
+        shards (list): シャードごとのフィールド定義のリスト（shard_resultsと同じ順序）
+        fields (list): スキーマ全体のフィールド定義のリスト
+
+    Returns:
+        tuple: (extracted_info, mapping)
+    """
+    owner = {}
+    failed_shards = 0
+    for (shard_info, shard_mapping), shard_fields in zip(shard_results, shards):
+        failed = not isinstance(shard_info, dict) or "error" in shard_info
+        failed_shards += failed
+        for field in shard_fields:
+            owner[field["name"]] = None if failed else (shard_info, shard_mapping)
+
+    if shard_results and failed_shards == len(shard_results):
+        logger.error("スキーマ分割抽出の結果がすべて失敗しました")
+        return shard_results[0]
+
+    if failed_shards:
+        logger.warning(
+            f"スキーマ分割抽出の一部が失敗しました: 失敗 {failed_shards}/{len(shard_results)}")
+
+    extracted_info = {}
+    mapping = {}
+    for field in fields:
+        name = field["name"]
+        result = owner.get(name)
+        if result is None or name not in result[0]:
+            extracted_info[name], mapping[name] = empty_field(field)
+            continue
+        shard_info, shard_mapping = result
+        extracted_info[name] = shard_info[name]
+        mapping[name] = shard_mapping.get(name, []) if isinstance(shard_mapping, dict) else []
+
+    return extracted_info, mapping
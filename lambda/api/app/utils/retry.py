@@ -0,0 +1,225 @@
+"""
+AWS API呼び出しの共通リトライポリシー
+エラー分類・フルジッター付き指数バックオフ・プロセス共有のトークンバケットを提供
+"""
+import json
+import logging
+import random
+import threading
+import time
+
+from botocore.exceptions import ClientError, ConnectionError as BotoConnectionError, HTTPClientError
+
+logger = logging.getLogger(__name__)
+
+# スロットリングとして扱うエラーコード（送信レートを下げて再試行）
+# converse_streamのイベントストリームでは先頭が小文字のコード（throttlingExceptionなど）になるため、
+# 比較は大文字・小文字を区別せずに行う
+THROTTLING_ERROR_CODES = {
+    "ThrottlingException",
+    "TooManyRequestsException",
+    "ServiceQuotaExceededException",
+    "ProvisionedThroughputExceededException",
+    "RequestLimitExceeded",
+}
+
+# 一時的な障害として扱うエラーコード（そのまま再試行）
+TRANSIENT_ERROR_CODES = {
+    "InternalServerException",
+    "ServiceUnavailableException",
+    "ModelNotReadyException",
+    "ModelTimeoutException",
+    "ModelStreamErrorException",
+}
+
+ERROR_THROTTLING = "throttling"
+ERROR_TRANSIENT = "transient"
+ERROR_FATAL = "fatal"
+
+_THROTTLING_ERROR_CODES_LOWER = {code.lower() for code in THROTTLING_ERROR_CODES}
+_TRANSIENT_ERROR_CODES_LOWER = {code.lower() for code in TRANSIENT_ERROR_CODES}
+
+
+def classify_error(error) -> str:
+    """
+    例外をリトライ可否の観点で分類する
+
+    Returns:
+        str: "throttling" | "transient" | "fatal"
+    """
+    if isinstance(error, ClientError):
+        # EventStreamErrorもClientErrorのサブクラスとしてここで分類する
+        code = error.response.get("Error", {}).get("Code", "").lower()
+        status = error.response.get(
+            "ResponseMetadata", {}).get("HTTPStatusCode", 0)
+        if code in _THROTTLING_ERROR_CODES_LOWER or status == 429:
+            return ERROR_THROTTLING
+        if code in _TRANSIENT_ERROR_CODES_LOWER or status >= 500:
+            return ERROR_TRANSIENT
+        # ValidationException・AccessDeniedExceptionなどは再試行しても成功しない
+        return ERROR_FATAL
+
+    # 接続エラー・タイムアウト（ReadTimeoutError・ConnectionClosedErrorなどはHTTPClientErrorの派生）のみ再試行する
+    # ParamValidationError・NoCredentialsErrorなど、その他のBotoCoreErrorは再試行しても成功しない
+    if isinstance(error, (BotoConnectionError, HTTPClientError)):
+        return ERROR_TRANSIENT
+
+    return ERROR_FATAL
+
+
+class TokenBucket:
+    """
+    プロセス内の全ワーカーで共有する適応型トークンバケット
+
+    スロットリング発生時は補充レートを半減し、成功時は徐々に元のレートへ戻す（AIMD）
+    """
+
+    def __init__(self, rate: float, capacity: float, min_rate: float = 0.1):
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens +
+                          (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def acquire(self) -> float:
+        """
+        トークンを1つ取得する（不足時は補充されるまで待機）
+
+        Returns:
+            float: 待機した秒数
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                wait_time = (1 - self.tokens) / self.rate
+            time.sleep(wait_time)
+            waited += wait_time
+
+    def on_throttled(self):
+        """スロットリング発生時に補充レートを下げる"""
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            logger.info(f"トークンバケットのレートを下げました: {self.rate:.2f} req/s")
+
+    def on_success(self):
+        """成功時に補充レートを徐々に戻す"""
+        with self._lock:
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate +
+                                self.max_rate * 0.1)
+
+
+class RetryMetrics:
+    """リトライ関連のカウンター"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = 0
+        self.retries = 0
+        self.throttles = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+
+    def record(self, **increments):
+        """カウンターを加算する（リトライ・失敗時はメトリクスをログ出力）"""
+        with self._lock:
+            for key, value in increments.items():
+                setattr(self, key, getattr(self, key) + value)
+            snapshot = self.snapshot()
+        if "calls" not in increments:
+            logger.info(f"リトライメトリクス: {json.dumps(snapshot)}")
+
+    def snapshot(self) -> dict:
+        return {
+            "name": self.name,
+            "calls": self.calls,
+            "retries": self.retries,
+            "throttles": self.throttles,
+            "failures": self.failures
+        }
+
+
+class RetryPolicy:
+    """
+    エラー分類に基づくリトライポリシー
+
+    - スロットリング・一時的障害のみ再試行し、検証エラーなどは即座に送出する
+    - 待機時間はフルジッター（0〜指数バックオフ上限の一様乱数）で、
+      同時に失敗したワーカーの再試行タイミングが揃わないようにする
+    - すべての試行でトークンバケットを経由し、プロセス全体の送信レートを制御する
+    """
+
+    def __init__(self, name: str, max_attempts: int = 5, base_delay: float = 1.0,
+                 max_delay: float = 60.0, token_bucket: TokenBucket = None):
+        self.name = name
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.token_bucket = token_bucket
+        self.metrics = RetryMetrics(name)
+
+    def compute_delay(self, attempt: int) -> float:
+        """フルジッター付きの待機時間を計算する（attemptは0始まり）"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def call(self, func, *args, max_attempts: int = None, **kwargs):
+        """
+        リトライポリシーに従って関数を呼び出す
+
+        Args:
+            func (callable): 呼び出す関数
+            max_attempts (int, optional): 最大試行回数（未指定時はポリシーの値）
+
+        Returns:
+            funcの戻り値
+        """
+        max_attempts = max_attempts or self.max_attempts
+        self.metrics.record(calls=1)
+
+        for attempt in range(max_attempts):
+            if self.token_bucket:
+                waited = self.token_bucket.acquire()
+                if waited > 0:
+                    logger.info(f"{self.name}: レート制限により {waited:.2f}秒待機しました")
+
+            try:
+                result = func(*args, **kwargs)
+                if self.token_bucket:
+                    self.token_bucket.on_success()
+                return result
+
+            except Exception as e:
+                error_class = classify_error(e)
+
+                if error_class == ERROR_THROTTLING:
+                    self.metrics.record(throttles=1)
+                    if self.token_bucket:
+                        self.token_bucket.on_throttled()
+
+                if error_class == ERROR_FATAL or attempt >= max_attempts - 1:
+                    self.metrics.record(failures=1)
+                    if error_class == ERROR_FATAL:
+                        logger.error(f"{self.name}: 再試行不可のエラーです: {str(e)}")
+                    else:
+                        logger.error(
+                            f"{self.name}: 最大試行回数 {max_attempts} 回で失敗しました: {str(e)}")
+                    raise
+
+                wait_time = self.compute_delay(attempt)
+                self.metrics.record(retries=1)
+                logger.warning(
+                    f"{self.name}: {error_class} エラーのため {wait_time:.2f}秒後に再試行します "
+                    f"（試行回数: {attempt + 1}/{max_attempts}）: {str(e)}")
+                time.sleep(wait_time)
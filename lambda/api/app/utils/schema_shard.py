@@ -0,0 +1,73 @@
+"""
+スキーマ分割ユーティリティ
+アプリのフィールド定義を独立したシャードに分割し、並列抽出できるようにする
+"""
+import logging
+import math
+
+logger = logging.getLogger(__name__)
+
+# list型の子フィールドは項目数分出力されるため重みを大きくする
+LIST_ITEM_WEIGHT = 3
+
+
+def field_weight(field: dict) -> int:
+    """
+    フィールドの出力量の目安となる重みを計算する
+
+    葉フィールドを1とし、map型は子フィールドの合計、
+    list型は項目内のフィールドの合計にLIST_ITEM_WEIGHTを掛けた値とする
+    """
+    field_type = field.get("type", "string")
+
+    if field_type == "map" and "fields" in field:
+        return max(sum(field_weight(child) for child in field["fields"]), 1)
+
+    if field_type == "list":
+        items = field.get("items", {})
+        if items.get("type") == "map" and "fields" in items:
+            item_weight = sum(field_weight(child) for child in items["fields"])
+        else:
+            item_weight = 1
+        return max(item_weight, 1) * LIST_ITEM_WEIGHT
+
+    return 1
+
+
+def partition_fields(fields: list, max_weight: int, max_shards: int) -> list:
+    """
+    トップレベルのフィールドを重みが均等になるようにシャードへ分割する
+
+    map型・list型は1つのシャードにまとめて割り当てる（子フィールドは分割しない）。
+    重みの大きいフィールドから順に最も軽いシャードへ割り当て、
+    各シャード内はスキーマ上の順序を保つ（同じスキーマからは常に同じ分割になる）
+
+    Args:
+        fields (list): トップレベルのフィールド定義のリスト
+        max_weight (int): 1シャードあたりの重みの目安
+        max_shards (int): 最大シャード数
+
+    Returns:
+        list: フィールド定義のリストのリスト（分割不要の場合は要素1つ）
+    """
+    weights = [field_weight(field) for field in fields]
+    total_weight = sum(weights)
+    shard_count = min(math.ceil(total_weight / max(max_weight, 1)),
+                      max(max_shards, 1), len(fields))
+
+    if shard_count <= 1:
+        return [list(fields)]
+
+    shard_weights = [0] * shard_count
+    assignments = [[] for _ in range(shard_count)]
+    for index in sorted(range(len(fields)), key=lambda i: (-weights[i], i)):
+        target = min(range(shard_count), key=lambda s: (shard_weights[s], s))
+        assignments[target].append(index)
+        shard_weights[target] += weights[index]
+
+    shards = [sorted(indices) for indices in assignments if indices]
+    shards.sort(key=lambda indices: indices[0])
+
+    logger.info(
+        f"スキーマを {len(shards)} シャードに分割しました: 重み {sorted(shard_weights, reverse=True)}")
+    return [[fields[index] for index in indices] for indices in shards]
@@ -0,0 +1,142 @@
+"""
+抽出結果のスキーマ検証ユーティリティ
+モデルの応答（extracted_dataとindices）をアプリのフィールド定義に合わせて補正する
+"""
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def empty_field(field: dict) -> tuple:
+    """抽出できなかったフィールドの空の値とindicesを作成"""
+    field_type = field.get("type", "string")
+    if field_type == "list":
+        return [], []
+    if field_type == "map" and "fields" in field:
+        values = {}
+        indices = {}
+        for child in field["fields"]:
+            values[child["name"]], indices[child["name"]] = empty_field(child)
+        return values, indices
+    return "", []
+
+
+def _coerce_word_ids(indices) -> list:
+    """単語IDのリストに補正する（数値文字列は数値に変換し、それ以外は除外）"""
+    if isinstance(indices, (int, float)) and not isinstance(indices, bool):
+        indices = [indices]
+    if not isinstance(indices, list):
+        return []
+    word_ids = []
+    for word_id in indices:
+        if isinstance(word_id, bool):
+            continue
+        if isinstance(word_id, (int, float)):
+            word_ids.append(int(word_id))
+        elif isinstance(word_id, str) and word_id.strip().isdigit():
+            word_ids.append(int(word_id.strip()))
+    return word_ids
+
+
+def _conform_field(field: dict, value, indices, path: str, issues: list) -> tuple:
+    """1フィールド分の値とindicesを型定義に合わせて補正する"""
+    field_type = field.get("type", "string")
+
+    if field_type == "map" and "fields" in field:
+        if not isinstance(value, dict):
+            if value not in (None, ""):
+                issues.append(f"{path}: map型ではありません")
+            value = {}
+        if not isinstance(indices, dict):
+            indices = {}
+        conformed_value = {}
+        conformed_indices = {}
+        for child in field["fields"]:
+            child_name = child["name"]
+            conformed_value[child_name], conformed_indices[child_name] = _conform_field(
+                child, value.get(child_name), indices.get(child_name),
+                f"{path}.{child_name}", issues)
+        # スキーマにないキーは末尾に残す
+        for key, extra_value in value.items():
+            conformed_value.setdefault(key, extra_value)
+        return conformed_value, conformed_indices
+
+    if field_type == "list":
+        if isinstance(value, dict):
+            issues.append(f"{path}: 単一の項目をリストに変換しました")
+            value = [value]
+            indices = [indices] if isinstance(indices, dict) else []
+        elif not isinstance(value, list):
+            if value not in (None, ""):
+                issues.append(f"{path}: list型ではありません")
+            value = []
+        if not isinstance(indices, list):
+            indices = []
+
+        items = field.get("items", {})
+        item_field = dict(items, name="item") if isinstance(items, dict) else {"type": "string"}
+        conformed_items = []
+        conformed_indices = []
+        for position, item in enumerate(value):
+            item_indices = indices[position] if position < len(indices) else None
+            item_value, item_index = _conform_field(
+                item_field, item, item_indices, f"{path}[{position}]", issues)
+            conformed_items.append(item_value)
+            conformed_indices.append(item_index)
+        return conformed_items, conformed_indices
+
+    # string型などのスカラー値
+    if value is None:
+        value = ""
+    elif isinstance(value, bool):
+        value = str(value).lower()
+    elif isinstance(value, (int, float)):
+        value = str(value)
+    elif isinstance(value, (dict, list)):
+        issues.append(f"{path}: 文字列ではない値を文字列に変換しました")
+        value = json.dumps(value, ensure_ascii=False)
+    return value, _coerce_word_ids(indices)
+
+
+def validate_extraction_result(extracted_data, indices, fields: list) -> tuple:
+    """
+    抽出結果をスキーマに合わせて検証・補正する
+
+    - スキーマにあるフィールドが欠けている場合は空の値を補う
+    - map型・list型の構造が異なる場合は補正し、indicesの形も値に揃える
+    - スカラー値は文字列に揃え、indicesは単語IDのリストに揃える
+    - スキーマにないフィールドは削除せずに残す
+
+    Args:
+        extracted_data (dict): モデルが返したextracted_data
+        indices (dict): モデルが返したindices（OCRなしの場合はNone）
+        fields (list): 抽出フィールド定義のリスト
+
+    Returns:
+        tuple: (補正後のextracted_data, 補正後のindices, 検出した問題のリスト)
+    """
+    issues = []
+    if not isinstance(extracted_data, dict):
+        issues.append("extracted_dataがオブジェクトではありません")
+        extracted_data = {}
+    if not isinstance(indices, dict):
+        indices = {}
+
+    conformed_data = {}
+    conformed_indices = {}
+    for field in fields:
+        name = field["name"]
+        if name not in extracted_data:
+            issues.append(f"{name}: フィールドがありません")
+        conformed_data[name], conformed_indices[name] = _conform_field(
+            field, extracted_data.get(name), indices.get(name), name, issues)
+
+    # スキーマにないフィールドは末尾に残す
+    for key, extra_value in extracted_data.items():
+        conformed_data.setdefault(key, extra_value)
+
+    if issues:
+        logger.warning(f"抽出結果をスキーマに合わせて補正しました: {issues[:20]}")
+
+    return conformed_data, conformed_indices, issues
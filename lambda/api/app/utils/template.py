@@ -9,6 +9,51 @@ import logging
 logger = logging.getLogger(__name__)
 
 
+def generate_extraction_targets(fields) -> str:
+    """
+    抽出対象の項目リスト（番号付きテキスト）を生成
+
+    Args:
+        fields (list): 抽出フィールド定義のリスト
+
+    Returns:
+        str: 「1. 表示名 (型)」形式の抽出対象リスト
+    """
+    def generate_extraction_fields(fields, prefix=""):
+        result = []
+        for field in fields:
+            display_name = field['display_name']
+            field_type = field.get('type', 'string')
+
+            if prefix:
+                field_desc = f"{prefix} > {display_name} ({field_type}型)"
+            else:
+                field_desc = f"{display_name} ({field_type}型)"
+
+            result.append(field_desc)
+
+            # map型の場合は子フィールドも追加
+            if field_type == "map" and "fields" in field:
+                child_fields = generate_extraction_fields(
+                    field["fields"], display_name)
+                result.extend(child_fields)
+
+            # list型の場合はitem内のフィールドも追加
+            elif field_type == "list" and "items" in field:
+                items = field["items"]
+                if items.get("type") == "map" and "fields" in items:
+                    child_prefix = f"{display_name} (各項目)"
+                    child_fields = generate_extraction_fields(
+                        items["fields"], child_prefix)
+                    result.extend(child_fields)
+
+        return result
+
+    extraction_fields = generate_extraction_fields(fields)
+    return "\n".join(
+        [f"{i+1}. {field}" for i, field in enumerate(extraction_fields)])
+
+
 def generate_unified_template(schema) -> str:
     """
     抽出データとindicesを含む統合されたJSONテンプレートを生成
@@ -0,0 +1,319 @@
+"""
+プロンプトのトークン予算管理
+送信前にトークン数を見積もり、必要に応じてOCRテキストの圧縮・分割を計画する
+"""
+import logging
+import math
+import re
+
+from utils.helpers import safe_get_from_dynamo_data
+from utils.layout import analyze_layout, group_words_into_lines
+
+logger = logging.getLogger(__name__)
+
+# 日本語（かな・漢字・全角記号）はおおむね1文字1トークン以上になるため別に数える
+CJK_PATTERN = re.compile(r"[\u3000-\u30ff\u3400-\u9fff\uf900-\ufaff\uff00-\uffef]")
+
+# ASCII文字列の1トークンあたりの平均文字数
+ASCII_CHARS_PER_TOKEN = 4
+
+
+def estimate_text_tokens(text: str) -> int:
+    """
+    テキストのトークン数を概算する
+
+    正確なトークナイザーは使用せず、CJK文字は1文字1トークン、
+    それ以外は4文字1トークンとして見積もる（予算判定用の安全側の概算）
+    """
+    if not text:
+        return 0
+    cjk_count = len(CJK_PATTERN.findall(text))
+    other_count = len(text) - cjk_count
+    return cjk_count + math.ceil(other_count / ASCII_CHARS_PER_TOKEN)
+
+
+def encode_id_ranges(ids: list) -> str:
+    """
+    単語IDのリストを範囲表記に変換する
+
+    例: [3, 4, 5, 9] -> "3-5,9"
+    """
+    if not ids:
+        return ""
+    ranges = []
+    start = prev = ids[0]
+    for word_id in ids[1:]:
+        if word_id == prev + 1:
+            prev = word_id
+            continue
+        ranges.append(f"{start}-{prev}" if start != prev else f"{start}")
+        start = prev = word_id
+    ranges.append(f"{start}-{prev}" if start != prev else f"{start}")
+    return ",".join(ranges)
+
+
+def prepare_ocr_pages(ocr_results: list, use_word_ids: bool = False) -> list:
+    """
+    ページ別OCR結果から、IDを付与した単語リストをページごとに作成する
+
+    Args:
+        ocr_results (list): ページ別OCR結果（"page"と"words"を持つ辞書のリスト）
+        use_word_ids (bool): Trueの場合はOCRエンジンが付与した単語IDを使用し、
+                             Falseの場合は空でない単語に全ページ通しの連番を付与する
+
+    Returns:
+        list: [{"index", "page", "words": [{"id", "content", "points"}]}] のリスト
+    """
+    pages = []
+    word_id = 0
+
+    for index, page_result in enumerate(ocr_results):
+        # page_resultが辞書でない場合はスキップ
+        if not isinstance(page_result, dict):
+            logger.warning(
+                f"ページ結果が辞書形式ではありません: {type(page_result)} - {page_result}")
+            continue
+
+        page_num = safe_get_from_dynamo_data(page_result, "page", 1)
+        page_words = safe_get_from_dynamo_data(page_result, "words", [])
+
+        # page_wordsがリストでない場合は空リストに
+        if not isinstance(page_words, list):
+            logger.warning(f"ページ {page_num} の単語リストが不正です: {type(page_words)}")
+            page_words = []
+
+        words = []
+        for position, word in enumerate(page_words):
+            # wordが辞書でない場合はスキップ
+            if not isinstance(word, dict):
+                continue
+
+            word_content = safe_get_from_dynamo_data(
+                word, "content", "").strip()
+            if not word_content:
+                continue
+
+            if use_word_ids:
+                current_id = int(safe_get_from_dynamo_data(
+                    word, "id", position))
+            else:
+                current_id = word_id
+                word_id += 1
+
+            words.append({
+                "id": current_id,
+                "content": word_content,
+                "points": safe_get_from_dynamo_data(word, "points", [])
+            })
+
+        pages.append({"index": index, "page": page_num, "words": words})
+
+    return pages
+
+
+def render_verbose_page(page: dict) -> str:
+    """ページの単語を「[ID:n] 単語」形式で並べたテキストを作成"""
+    page_text = " ".join(
+        f"[ID:{word['id']}] {word['content']}" for word in page["words"])
+    return f"=== ページ {page['page']} OCRテキスト ===\n{page_text}"
+
+
+def compact_page_lines(page: dict) -> list:
+    """
+    ページの単語を座標に基づいて行にまとめ、行ごとに単語IDを範囲表記したテキストを作成
+
+    Returns:
+        list: 「[ID:a-b] 行テキスト」形式の文字列のリスト
+    """
+    words = page["words"]
+    lines = []
+    for line in group_words_into_lines(words):
+        line_words = [words[index] for index in line]
+        ids = encode_id_ranges([word["id"] for word in line_words])
+        text = " ".join(word["content"] for word in line_words)
+        lines.append(f"[ID:{ids}] {text}")
+    return lines
+
+
+def assign_line_ids(pages: list) -> dict:
+    """
+    全ページの単語を行にまとめ、ページをまたいだ通し番号の行IDを付与する
+
+    各ページに "line_entries": [{"id", "word_ids", "text"}] を追加する。
+    行内で横方向の空白が大きい位置（表のセル境界）は " | " で区切る
+
+    Args:
+        pages (list): prepare_ocr_pagesで作成したページリスト
+
+    Returns:
+        dict: 行ID -> 単語IDリストの対応表
+    """
+    line_to_words = {}
+    line_id = 0
+    for page in pages:
+        words = page["words"]
+        entries = []
+        if words:
+            for line in analyze_layout(words)["lines"]:
+                word_ids = [words[index]["id"] for index in line["word_indices"]]
+                text = " | ".join(
+                    " ".join(words[index]["content"] for index in cell)
+                    for cell in line["cells"])
+                entries.append({"id": line_id, "word_ids": word_ids, "text": text})
+                line_to_words[line_id] = word_ids
+                line_id += 1
+        page["line_entries"] = entries
+    return line_to_words
+
+
+def line_id_page_lines(page: dict) -> list:
+    """行IDを付与したページの行を「[L:n] 行テキスト」形式の文字列にする"""
+    return [f"[L:{entry['id']}] {entry['text']}" for entry in page.get("line_entries", [])]
+
+
+def expand_line_indices(mapping, line_to_words: dict):
+    """
+    行IDで返されたindicesを単語IDに展開する
+
+    Args:
+        mapping: モデルが返したindices（辞書・リストの入れ子）
+        line_to_words (dict): assign_line_idsが返した行ID -> 単語IDリストの対応表
+
+    Returns:
+        単語IDに展開したindices（構造は入力と同じ）
+    """
+    if isinstance(mapping, dict):
+        return {key: expand_line_indices(value, line_to_words) for key, value in mapping.items()}
+
+    if isinstance(mapping, list):
+        if all(isinstance(item, (int, float)) and not isinstance(item, bool) for item in mapping):
+            word_ids = []
+            for line_id in mapping:
+                for word_id in line_to_words.get(int(line_id), []):
+                    if word_id not in word_ids:
+                        word_ids.append(word_id)
+            return word_ids
+        # list型フィールドの各項目は再帰的に展開する
+        return [expand_line_indices(item, line_to_words) for item in mapping]
+
+    return mapping
+
+
+def render_compact_page(page: dict, lines: list = None) -> str:
+    """行単位に圧縮したページテキストを作成"""
+    if lines is None:
+        lines = compact_page_lines(page)
+    return f"=== ページ {page['page']} OCRテキスト ===\n" + "\n".join(lines)
+
+
+def _split_page_lines(page: dict, lines: list, image_tokens: int, available_tokens: int) -> list:
+    """1ページが予算を超える場合に行単位で分割する"""
+    segments = []
+    current = []
+    current_tokens = image_tokens
+    for line in lines:
+        line_tokens = estimate_text_tokens(line) + 1
+        if current and current_tokens + line_tokens > available_tokens:
+            segments.append((dict(page, lines=current), current_tokens))
+            current = []
+            current_tokens = image_tokens
+        current.append(line)
+        current_tokens += line_tokens
+    if current or not segments:
+        segments.append((dict(page, lines=current), current_tokens))
+    return segments
+
+
+def plan_ocr_prompt(pages: list, fixed_tokens: int, verbose_tokens: int,
+                    image_tokens_per_page: int = 0, budget: int = None,
+                    compaction_threshold: int = None, line_ids: bool = False) -> dict:
+    """
+    トークン予算に収まるOCRテキストの送信方法を決める
+
+    1. 見積もりがしきい値・予算内であればそのまま送信する
+    2. 超える場合は単語を行単位にまとめ、IDを範囲表記して圧縮する
+    3. 圧縮後も予算を超える場合はページ（必要なら行）単位で分割する
+
+    Args:
+        pages (list): prepare_ocr_pagesで作成したページリスト
+        fixed_tokens (int): OCRテキスト以外（指示・システムプロンプトなど）のトークン数
+        verbose_tokens (int): 圧縮しない場合のOCRテキストのトークン数
+        image_tokens_per_page (int): ページごとに添付する画像のトークン数
+        budget (int, optional): 1リクエストあたりの入力トークン予算
+        compaction_threshold (int, optional): 圧縮を開始するOCRテキストのトークン数
+        line_ids (bool): Trueの場合は常に行ID形式（assign_line_ids済みのページが必要）で送信する
+
+    Returns:
+        dict: {"compact": bool, "chunks": [[page, ...], ...],
+               "tokens_before": int, "tokens_after": int}
+               圧縮時の各ページには行テキストのリスト "lines" が含まれる
+    """
+    from config import settings
+
+    budget = budget or settings.PROMPT_TOKEN_BUDGET
+    if compaction_threshold is None:
+        compaction_threshold = settings.OCR_COMPACTION_THRESHOLD_TOKENS
+
+    image_tokens = image_tokens_per_page * len(pages)
+    if not line_ids and verbose_tokens <= compaction_threshold and fixed_tokens + image_tokens + verbose_tokens <= budget:
+        return {
+            "compact": False,
+            "chunks": [pages],
+            "tokens_before": verbose_tokens,
+            "tokens_after": verbose_tokens
+        }
+
+    compact_pages = []
+    compact_tokens = 0
+    for page in pages:
+        lines = line_id_page_lines(page) if line_ids else compact_page_lines(page)
+        page_tokens = estimate_text_tokens(render_compact_page(page, lines))
+        compact_pages.append((dict(page, lines=lines), page_tokens))
+        compact_tokens += page_tokens
+
+    page_count = max(len(pages), 1)
+    logger.info(
+        f"OCRテキストを圧縮しました: {verbose_tokens} -> {compact_tokens} トークン "
+        f"(ページあたり {verbose_tokens // page_count} -> {compact_tokens // page_count})")
+
+    if fixed_tokens + image_tokens + compact_tokens <= budget:
+        return {
+            "compact": True,
+            "chunks": [[page for page, _ in compact_pages]],
+            "tokens_before": verbose_tokens,
+            "tokens_after": compact_tokens
+        }
+
+    # 圧縮後も予算を超える場合は分割する
+    available_tokens = max(budget - fixed_tokens, 1)
+    chunks = []
+    current = []
+    current_tokens = 0
+    for page, page_tokens in compact_pages:
+        segment_tokens = page_tokens + image_tokens_per_page
+        if segment_tokens > available_tokens:
+            segments = _split_page_lines(
+                page, page["lines"], image_tokens_per_page, available_tokens)
+        else:
+            segments = [(page, segment_tokens)]
+
+        for segment, tokens in segments:
+            if current and current_tokens + tokens > available_tokens:
+                chunks.append(current)
+                current = []
+                current_tokens = 0
+            current.append(segment)
+            current_tokens += tokens
+    if current:
+        chunks.append(current)
+
+    logger.warning(
+        f"圧縮後もトークン予算 {budget} を超えるため {len(chunks)} 分割で抽出します "
+        f"(OCRテキスト: {compact_tokens} トークン, 固定部分: {fixed_tokens} トークン)")
+
+    return {
+        "compact": True,
+        "chunks": chunks,
+        "tokens_before": verbose_tokens,
+        "tokens_after": compact_tokens
+    }
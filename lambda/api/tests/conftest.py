@@ -0,0 +1,16 @@
+"""
+APIのテスト共通設定
+アプリケーションのモジュールは lambda/api/app をルートとしてインポートする
+"""
+import os
+import sys
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app")
+if APP_DIR not in sys.path:
+    sys.path.insert(0, APP_DIR)
+
+# AWSリソースには接続しないため、設定の読み込みに必要な値だけを用意する
+os.environ.setdefault("AWS_DEFAULT_REGION", "ap-northeast-1")
+os.environ.setdefault("BUCKET_NAME", "test-bucket")
+os.environ.setdefault("IMAGES_TABLE_NAME", "test-images")
+os.environ.setdefault("JOBS_TABLE_NAME", "test-jobs")
@@ -0,0 +1,117 @@
+"""
+非同期APIの同時実行スループットの負荷テスト
+
+DynamoDB・Bedrockの呼び出しを一定時間待つ関数に置き換え、ASGIアプリに同時にリクエストを送る。
+単体で実行すると同時リクエスト数ごとのスループットを表示する:
+
+    python tests/test_async_io_load.py
+"""
+import asyncio
+import threading
+import time
+
+if __name__ == "__main__":
+    # 単体で実行する場合もpytestと同じ設定（conftest）でアプリをインポートする
+    import conftest  # noqa: F401
+
+import httpx
+import pytest
+
+import main
+import services.extraction_service as extraction_service_module
+from config import settings
+
+# 模擬するDynamoDB呼び出しと情報抽出の所要時間（秒）
+DB_LATENCY_SECONDS = 0.05
+EXTRACTION_SECONDS = 0.5
+
+_started_extractions = []
+_started_extractions_lock = threading.Lock()
+
+
+def _slow_get_image(image_id):
+    time.sleep(DB_LATENCY_SECONDS)
+    return {"id": image_id, "extraction_status": "processing", "page_processing_mode": "combined"}
+
+
+def _slow_extraction(image_id):
+    with _started_extractions_lock:
+        _started_extractions.append(image_id)
+    time.sleep(EXTRACTION_SECONDS)
+
+
+def install_simulated_backends(setattr_func):
+    """AWS呼び出しを一定時間待つ関数に置き換える"""
+    setattr_func(extraction_service_module, "get_image", _slow_get_image)
+    setattr_func(extraction_service_module, "update_image_status", lambda *args, **kwargs: None)
+    setattr_func(extraction_service_module, "extract_information_from_single_image_with_ocr", _slow_extraction)
+
+
+@pytest.fixture(autouse=True)
+def simulated_backends(monkeypatch):
+    install_simulated_backends(monkeypatch.setattr)
+    _started_extractions.clear()
+
+
+def _client():
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test")
+
+
+async def measure_throughput(concurrency: int, requests_per_worker: int = 4) -> float:
+    """
+    同時リクエスト数を指定してステータス取得APIを呼び出し、スループットを返す
+
+    Returns:
+        float: 1秒あたりのリクエスト数
+    """
+    async with _client() as client:
+        async def worker(worker_id):
+            for i in range(requests_per_worker):
+                response = await client.get(f"/ocr/extract/status/img-{worker_id}-{i}")
+                assert response.status_code == 200
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(worker_id) for worker_id in range(concurrency)))
+        return concurrency * requests_per_worker / (time.perf_counter() - started)
+
+
+def test_throughput_scales_with_concurrency():
+    sequential = asyncio.run(measure_throughput(1))
+    concurrent = asyncio.run(measure_throughput(16))
+
+    # 理想値は16倍（イベントループが塞がれていれば1倍程度になる）
+    assert concurrent >= sequential * 8
+
+
+def test_extractions_do_not_starve_io_requests():
+    async def scenario():
+        async with _client() as client:
+            # AWS呼び出し用のスレッド数と同じ数の情報抽出を同時に開始し、実行が始まるまで待つ
+            extractions = [
+                asyncio.create_task(client.post(f"/ocr/extract/ext-{i}", json={"image_id": f"ext-{i}"}))
+                for i in range(settings.AWS_IO_MAX_WORKERS)
+            ]
+            while len(_started_extractions) < settings.EXTRACTION_REQUEST_MAX_WORKERS:
+                await asyncio.sleep(0.01)
+
+            started = time.perf_counter()
+            responses = await asyncio.gather(
+                *(client.get(f"/ocr/extract/status/img-{i}") for i in range(32)))
+            elapsed = time.perf_counter() - started
+
+            assert all(response.status_code == 200 for response in responses)
+            assert all(response.status_code == 200 for response in await asyncio.gather(*extractions))
+            return elapsed
+
+    # 情報抽出の完了を待たずにステータス取得が返ること
+    assert asyncio.run(scenario()) < EXTRACTION_SECONDS / 2
+
+
+if __name__ == "__main__":
+    install_simulated_backends(setattr)
+    baseline = None
+    print("concurrency  req/s   speedup")
+    for concurrency in (1, 2, 4, 8, 16, 32, 64):
+        throughput = asyncio.run(measure_throughput(concurrency))
+        baseline = baseline or throughput
+        print(f"{concurrency:>11}  {throughput:6.1f}  {throughput / baseline:6.1f}x")
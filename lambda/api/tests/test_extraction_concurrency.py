@@ -0,0 +1,61 @@
+"""
+スキーマ分割抽出の同時実行数のテスト
+"""
+import threading
+import time
+
+import pytest
+
+import extraction
+
+
+class ConcurrencyCounter:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.active = 0
+        self.peak = 0
+        self.calls = 0
+
+    def call(self, messages, system_prompts):
+        with self._lock:
+            self.active += 1
+            self.calls += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(0.05)
+        with self._lock:
+            self.active -= 1
+        return {}
+
+
+@pytest.fixture
+def counter(monkeypatch):
+    counter = ConcurrencyCounter()
+    monkeypatch.setattr(extraction, "call_bedrock_with_cache", counter.call)
+    monkeypatch.setattr(extraction, "build_user_content", lambda *args, **kwargs: [])
+    monkeypatch.setattr(extraction, "parse_converse_response", lambda response: "{}")
+    monkeypatch.setattr(extraction, "parse_extraction_response", lambda *args: ({}, {}))
+    return counter
+
+
+def make_shards(count):
+    return [{
+        "single_static_prompt": "",
+        "extraction_fields": {"fields": [{"name": f"field{index}", "type": "string"}]},
+        "field_names": [f"field{index}"]
+    } for index in range(count)]
+
+
+@pytest.mark.parametrize("shard_count, chunk_count, max_workers", [
+    (2, 4, 4), (4, 4, 4), (3, 5, 8), (6, 2, 4), (2, 3, 1),
+])
+def test_sharded_extraction_stays_within_worker_budget(counter, monkeypatch, shard_count, chunk_count, max_workers):
+    monkeypatch.setattr(extraction.settings, "EXTRACTION_MAX_WORKERS", max_workers)
+
+    extraction.run_sharded_extraction(
+        make_shards(shard_count), "single_static_prompt", [],
+        [("", [])] * chunk_count, {"fields": []})
+
+    assert counter.calls == shard_count * chunk_count
+    assert counter.peak <= max_workers
+    # 予算を使い切れる場合は並列に実行される
+    assert counter.peak >= min(max_workers, shard_count)
@@ -0,0 +1,96 @@
+"""
+モデル応答のJSON抽出・修復のテスト
+"""
+import pytest
+
+from utils.json_stream import IncrementalJsonScanner, extract_json_object
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('{"a": 1, "b": "x"}', {"a": 1, "b": "x"}),
+    ('```json\n{"a": [1, 2]}\n```', {"a": [1, 2]}),
+    ('以下が抽出結果です。\n{"a": "x"}', {"a": "x"}),
+    # 後続の説明文やもう1つのオブジェクトは無視する
+    ('{"a": 1}\n以上です。{"b": 2}', {"a": 1}),
+    ('{"text": "波括弧 } と \\" を含む"}', {"text": '波括弧 } と " を含む'}),
+])
+def test_valid_json_is_parsed_without_repair(text, expected):
+    assert extract_json_object(text) == (expected, "ok")
+
+
+# よくある崩れ方をした応答と修復後の値
+MALFORMED_OUTPUTS = [
+    # 閉じ括弧直前の余分なカンマ
+    ('{"a": 1,}', {"a": 1}),
+    ('{"a": [1, 2,], "b": {"c": "x",},}', {"a": [1, 2], "b": {"c": "x"}}),
+    ('{"a": [1, 2 , ]\n}', {"a": [1, 2]}),
+    # 余分なカンマと後続の説明文
+    ('```json\n{"a": [1, 2,],}\n```\n以上です。', {"a": [1, 2]}),
+    ('結果: {"a": "x",} 確認してください', {"a": "x"}),
+    # 途中で切れたオブジェクト
+    ('{"a": "x", "b": {"c": [1, 2', {"a": "x", "b": {"c": [1, 2]}}),
+    ('{"a": "x", "b": "途中で切れた文', {"a": "x", "b": "途中で切れた文"}),
+    ('{"a": "x", "b', {"a": "x"}),
+    ('{"a": "x", "b":', {"a": "x"}),
+    ('{"a": "x", "b": ', {"a": "x"}),
+    ('{"a": [{"b": 1}, {"b": 2', {"a": [{"b": 1}, {"b": 2}]}),
+    ('{"a": [1, 2,', {"a": [1, 2]}),
+    ('{"a": "x\\', {"a": "x"}),
+    ('{"a": "x\\u30', {"a": "x"}),
+    # 途中で切れた数値は有効な部分までを残す
+    ('{"a": 12.', {"a": 12}),
+    ('{"a": 0.', {"a": 0}),
+    ('{"a": 1.5e-', {"a": 1.5}),
+    ('{"a": [1, 2.', {"a": [1, 2]}),
+    # 数値以外の途中で切れたリテラルはメンバーごと取り除く
+    ('{"a": 1, "b": tru', {"a": 1}),
+    ('{"a": 1, "b": nu', {"a": 1}),
+    ('{"a": 1, "b": -', {"a": 1}),
+]
+
+
+@pytest.mark.parametrize("text, expected", MALFORMED_OUTPUTS)
+def test_malformed_output_is_repaired(text, expected):
+    assert extract_json_object(text) == (expected, "repaired")
+
+
+@pytest.mark.parametrize("text", [
+    "",
+    "JSONを出力できませんでした",
+    '["a", "b"]',
+])
+def test_output_without_object_fails(text):
+    assert extract_json_object(text) == (None, "failed")
+
+
+def test_large_response_is_parsed():
+    items = ", ".join(f'{{"name": "item-{i}", "price": {i}.5}}' for i in range(2000))
+    text = f'```json\n{{"items": [{items}]}}\n```'
+
+    value, status = extract_json_object(text)
+    assert status == "ok"
+    assert len(value["items"]) == 2000
+
+    # 同じ応答が途中で切れた場合も、完成している要素までは取り出せる
+    value, status = extract_json_object(text[:len(text) // 2])
+    assert status == "repaired"
+    assert 0 < len(value["items"]) < 2000
+    assert value["items"][0] == {"name": "item-0", "price": 0.5}
+
+
+def test_scanner_reports_values_across_chunks():
+    values = []
+    scanner = IncrementalJsonScanner(lambda path, raw: values.append((path, raw)))
+    text = '```json\n{"a": "x, y", "b": {"c": [1, 2], "d": 3}, "e": true}\n```'
+
+    for i in range(0, len(text), 3):
+        scanner.feed(text[i:i + 3])
+
+    assert values == [
+        (("a",), '"x, y"'),
+        (("b", "c"), "[1, 2]"),
+        (("b", "d"), "3"),
+        (("b",), '{"c": [1, 2], "d": 3}'),
+        (("e",), "true"),
+    ]
+    assert scanner.finished
@@ -0,0 +1,129 @@
+"""
+S3イベントによるアップロード取り込みのテスト
+
+build_s3_object_created_eventで作成したイベントを POST /events に送信し、
+S3からの通知と同じ経路で取り込まれることを確認する
+"""
+import io
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+import services.ingestion_service as ingestion_module
+from services.ingestion_service import build_s3_object_created_event
+
+IMAGE_ID = "0f8fad5b-d9cb-469f-a165-70867728950e"
+S3_KEY = f"uploads/{IMAGE_ID}_2026-01-01T00:00:00_invoice.pdf"
+
+
+class FakeS3Client:
+    """先頭バイトの取得のみに対応するS3クライアント"""
+
+    def get_object(self, Bucket, Key, Range=None):
+        return {"Body": io.BytesIO(b"%PDF-1.7\n"), "ContentType": "application/pdf"}
+
+
+class FakeImagesTable:
+    """画像レコードと冪等性キーをメモリ上に保持する"""
+
+    def __init__(self):
+        self.images = {IMAGE_ID: {"id": IMAGE_ID, "filename": "invoice.pdf", "status": "uploading"}}
+
+    def get_image(self, image_id):
+        return self.images.get(image_id)
+
+    def claim_ingestion(self, image_id, ingest_key, content_type=None):
+        image = self.images.get(image_id)
+        if image is None or image.get("ingest_key") == ingest_key:
+            return False
+        image["ingest_key"] = ingest_key
+        return True
+
+    def release_ingestion(self, image_id, ingest_key):
+        if self.images[image_id].get("ingest_key") == ingest_key:
+            del self.images[image_id]["ingest_key"]
+
+    def update_image_status(self, image_id, status, job_id=None):
+        self.images[image_id]["status"] = status
+
+
+@pytest.fixture
+def images(monkeypatch):
+    table = FakeImagesTable()
+    monkeypatch.setattr(ingestion_module.settings, "BUCKET_NAME", "test-bucket")
+    monkeypatch.setattr(ingestion_module, "get_s3_client", lambda: FakeS3Client())
+    for name in ("get_image", "claim_ingestion", "release_ingestion", "update_image_status"):
+        monkeypatch.setattr(ingestion_module, name, getattr(table, name))
+    return table
+
+
+@pytest.fixture
+def submitted_tasks(monkeypatch):
+    tasks = []
+    monkeypatch.setattr(
+        ingestion_module, "submit_task",
+        lambda name, payload, dedup_key=None: tasks.append((name, payload)) or f"task-{len(tasks)}")
+    return tasks
+
+
+@pytest.fixture
+def client():
+    return TestClient(main.app)
+
+
+def test_duplicate_delivery_is_skipped(client, images, submitted_tasks):
+    event = build_s3_object_created_event(S3_KEY, etag='"etag-1"', bucket="test-bucket")
+
+    first = client.post("/events", json=event)
+    assert first.status_code == 200
+    assert first.json() == {"ingested": 1, "skipped": 0, "failed": 0}
+    assert images.images[IMAGE_ID]["status"] == "converting"
+
+    # 同じオブジェクトの通知が再度届いても取り込みは1回だけ
+    duplicate = client.post("/events", json=event)
+    assert duplicate.status_code == 200
+    assert duplicate.json() == {"ingested": 0, "skipped": 1, "failed": 0}
+    assert [name for name, _ in submitted_tasks] == ["convert_pdf"]
+
+
+def test_new_version_of_object_is_ingested_again(client, images, submitted_tasks):
+    client.post("/events", json=build_s3_object_created_event(S3_KEY, etag="etag-1", bucket="test-bucket"))
+    response = client.post("/events", json=build_s3_object_created_event(S3_KEY, etag="etag-2", bucket="test-bucket"))
+
+    assert response.json()["ingested"] == 1
+    assert len(submitted_tasks) == 2
+
+
+def test_failed_ingestion_is_retried(client, images, monkeypatch):
+    def unavailable_queue(name, payload, dedup_key=None):
+        raise RuntimeError("queue unavailable")
+
+    monkeypatch.setattr(ingestion_module, "submit_task", unavailable_queue)
+    event = build_s3_object_created_event(S3_KEY, etag="etag-1", bucket="test-bucket")
+
+    # 失敗時は502を返し（Lambda Web Adapterが呼び出しエラーにする）、冪等性キーを解除する
+    failed = client.post("/events", json=event)
+    assert failed.status_code == 502
+    assert "ingest_key" not in images.images[IMAGE_ID]
+
+    # 再配信されたイベントで取り込み直せる
+    monkeypatch.setattr(ingestion_module, "submit_task", lambda name, payload, dedup_key=None: "task-1")
+    retried = client.post("/events", json=event)
+    assert retried.status_code == 200
+    assert retried.json()["ingested"] == 1
+
+
+def test_objects_outside_uploads_are_skipped(client, images, submitted_tasks):
+    event = build_s3_object_created_event("converted/page_1.jpeg", etag="etag-1", bucket="test-bucket")
+
+    response = client.post("/events", json=event)
+    assert response.json() == {"ingested": 0, "skipped": 1, "failed": 0}
+    assert submitted_tasks == []
+
+
+def test_api_gateway_requests_are_rejected(client, images):
+    event = build_s3_object_created_event(S3_KEY, etag="etag-1", bucket="test-bucket")
+
+    response = client.post("/events", json=event, headers={"x-amzn-request-context": "{}"})
+    assert response.status_code == 403
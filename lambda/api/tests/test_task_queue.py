@@ -0,0 +1,167 @@
+"""
+タスクキューのテスト（SQLiteバックエンドとSQSへの投入パラメーター）
+"""
+import threading
+
+import pytest
+
+import task_queue
+from task_queue import SqliteTaskQueue, SqsTaskQueue, TaskWorker, task_handler
+
+calls = []
+
+
+@task_handler("test_record")
+def record_call(value):
+    calls.append(value)
+
+
+@task_handler("test_flaky")
+def flaky(value, failures):
+    calls.append(value)
+    if len(calls) <= failures:
+        raise RuntimeError(f"failure {len(calls)}")
+
+
+@pytest.fixture(autouse=True)
+def queue_settings(monkeypatch):
+    calls.clear()
+    monkeypatch.setattr(task_queue.settings, "TASK_RETRY_BASE_DELAY_SECONDS", 0)
+    monkeypatch.setattr(task_queue.settings, "TASK_MAX_RECEIVE_COUNT", 3)
+    monkeypatch.setattr(task_queue.settings, "TASK_VISIBILITY_TIMEOUT_SECONDS", 60)
+
+
+@pytest.fixture
+def queue():
+    return SqliteTaskQueue(":memory:")
+
+
+def drain(queue):
+    worker = TaskWorker(queue)
+    while worker.run_once():
+        pass
+
+
+def test_duplicate_is_ignored_while_queued_or_running(queue):
+    first = queue.enqueue("test_record", {"value": 1}, dedup_key="k")
+    assert queue.enqueue("test_record", {"value": 2}, dedup_key="k") == first
+
+    [message] = queue.receive()
+    # 処理中も同じキーのタスクは投入されない
+    assert queue.enqueue("test_record", {"value": 3}, dedup_key="k") == first
+    assert queue.receive() == []
+    assert message.payload == {"value": 1}
+
+
+def test_tasks_without_key_are_not_deduplicated(queue):
+    assert queue.enqueue("test_record", {"value": 1}) != queue.enqueue("test_record", {"value": 1})
+    drain(queue)
+    assert calls == [1, 1]
+
+
+def test_same_key_can_be_resubmitted_after_ack(queue):
+    first = queue.enqueue("test_record", {"value": 1}, dedup_key="k")
+    drain(queue)
+
+    second = queue.enqueue("test_record", {"value": 2}, dedup_key="k")
+    assert second != first
+    drain(queue)
+    assert calls == [1, 2]
+
+
+def test_failed_task_is_retried_until_it_succeeds(queue):
+    queue.enqueue("test_flaky", {"value": "x", "failures": 2}, dedup_key="k")
+    drain(queue)
+
+    assert calls == ["x", "x", "x"]
+    assert queue.dead_letters() == []
+
+
+def test_task_is_dead_lettered_after_max_receive_count(queue):
+    queue.enqueue("test_flaky", {"value": "x", "failures": 10}, dedup_key="k")
+    drain(queue)
+
+    assert len(calls) == 3
+    [dead] = queue.dead_letters()
+    assert dead["name"] == "test_flaky"
+    assert dead["receive_count"] == 3
+    assert dead["error"] == "failure 3"
+
+    # デッドレターになったタスクのキーは再投入できる
+    assert queue.enqueue("test_flaky", {"value": "y", "failures": 0}, dedup_key="k") != dead["id"]
+
+
+def test_unacked_task_is_redelivered_after_visibility_timeout(queue):
+    queue.enqueue("test_record", {"value": 1}, dedup_key="k")
+    [stale] = queue.receive(visibility_timeout=0.01)
+    threading.Event().wait(0.02)
+
+    [redelivered] = queue.receive()
+    assert redelivered.message_id == stale.message_id
+    assert redelivered.receive_count == 2
+
+    # 先に受信したワーカーの完了通知は無視される
+    queue.ack(stale)
+    assert queue.receive() == []
+    assert queue.enqueue("test_record", {"value": 2}, dedup_key="k") == stale.message_id
+
+    queue.ack(redelivered)
+    assert queue.enqueue("test_record", {"value": 2}, dedup_key="k") != stale.message_id
+
+
+def test_unknown_task_is_dead_lettered(queue):
+    queue.enqueue("test_unknown", {})
+    drain(queue)
+
+    [dead] = queue.dead_letters()
+    assert "test_unknown" in dead["error"]
+
+
+def test_workers_sharing_a_file_receive_each_task_once(tmp_path):
+    path = str(tmp_path / "tasks.sqlite3")
+    producer = SqliteTaskQueue(path)
+    for i in range(50):
+        producer.enqueue("test_record", {"value": i}, dedup_key=f"k{i}")
+
+    workers = [threading.Thread(target=drain, args=(SqliteTaskQueue(path),)) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert sorted(calls) == list(range(50))
+
+
+def test_keys_of_finished_tasks_are_released_on_open(tmp_path):
+    path = str(tmp_path / "tasks.sqlite3")
+    queue = SqliteTaskQueue(path)
+    first = queue.enqueue("test_record", {"value": 1}, dedup_key="k")
+    # 以前の形式（完了時にキーを解除しない）で完了したタスク
+    queue._conn.execute("UPDATE tasks SET state = 'done' WHERE id = ?", (first,))
+
+    assert SqliteTaskQueue(path).enqueue("test_record", {"value": 2}, dedup_key="k") != first
+
+
+class FakeSqsClient:
+    def __init__(self):
+        self.sent = []
+
+    def send_message(self, **params):
+        self.sent.append(params)
+        return {"MessageId": f"m{len(self.sent)}"}
+
+
+def test_fifo_deduplication_id_is_unique_per_submission(monkeypatch):
+    client = FakeSqsClient()
+    queue = SqsTaskQueue(queue_url="https://sqs.example/123/tasks.fifo", dead_letter_queue_url="")
+    monkeypatch.setattr(queue, "_client", lambda: client)
+
+    queue.enqueue("test_record", {"value": 1}, dedup_key="convert_pdf:image-1")
+    queue.enqueue("test_record", {"value": 1}, dedup_key="convert_pdf:image-1")
+    queue.enqueue("test_record", {"value": 1})
+
+    first, second, without_key = client.sent
+    # 同じキーのタスクは同じグループで順番に処理し、失敗後の再投入も破棄されない
+    assert first["MessageGroupId"] == second["MessageGroupId"] == "convert_pdf:image-1"
+    assert first["MessageDeduplicationId"] != second["MessageDeduplicationId"]
+    assert without_key["MessageGroupId"] != first["MessageGroupId"]
@@ -10,8 +10,10 @@ import {
   BlockPublicAccess,
   Bucket,
   BucketEncryption,
+  EventType,
   HttpMethods,
 } from "aws-cdk-lib/aws-s3";
+import { LambdaDestination } from "aws-cdk-lib/aws-s3-notifications";
 import {
   PolicyStatement,
   Role,
@@ -37,11 +39,14 @@ import {
 import { UserPool } from "aws-cdk-lib/aws-cognito";
 import { Platform } from "aws-cdk-lib/aws-ecr-assets";
 import { Table } from "aws-cdk-lib/aws-dynamodb";
+import { Queue } from "aws-cdk-lib/aws-sqs";
+import { SqsEventSource } from "aws-cdk-lib/aws-lambda-event-sources";
 
 export interface ApiProps {
   imagesTable: Table;
   jobsTable: Table;
   schemasTable: Table;
+  syncManifestTable: Table;
   userPoolId: string;
   userPoolClientId: string;
   enableOcr: boolean;
@@ -87,6 +92,37 @@ export class Api extends Construct {
       ],
     });
 
+    // 非同期タスクのキュー（inprocess以外のバックエンドを使う場合に使用）
+    const taskQueueBackend =
+      this.node.tryGetContext("task_queue_backend") || "inprocess";
+    // タスク投入時の重複排除（dedup_key）を有効にするためFIFOキューとする
+    const taskDeadLetterQueue = new Queue(this, "TaskDeadLetterQueue", {
+      fifo: true,
+      retentionPeriod: Duration.days(14),
+      enforceSSL: true,
+    });
+    const taskQueue = new Queue(this, "TaskQueue", {
+      fifo: true,
+      // Lambdaのタイムアウト（15分）より長くする
+      visibilityTimeout: Duration.minutes(16),
+      enforceSSL: true,
+      deadLetterQueue: {
+        queue: taskDeadLetterQueue,
+        maxReceiveCount: 5,
+      },
+    });
+
+    // アップロード時の取り込み設定
+    // S3のObjectCreatedイベントで取り込む場合、クライアントからの完了通知は不要になる
+    const enableS3EventIngestion =
+      this.node.tryGetContext("enable_s3_event_ingestion") === true;
+    const autoStartOcrOnUpload =
+      this.node.tryGetContext("auto_start_ocr_on_upload") === true;
+
+    // 一括OCRジョブの抽出をBedrockのバッチ推論で実行する
+    const enableBatchExtraction =
+      this.node.tryGetContext("enable_batch_extraction") === true;
+
     // Lambda実行ロール
     const lambdaRole = new Role(this, "LambdaExecutionRole", {
       assumedBy: new ServicePrincipal("lambda.amazonaws.com"),
@@ -126,6 +162,57 @@ export class Api extends Construct {
       })
     );
 
+    // Bedrockバッチ推論の権限（バッチ推論が有効な場合のみ）
+    // バッチ推論のジョブはサービスロールでS3の入出力（batch-inference/ 以下）にアクセスする
+    let batchInferenceRole: Role | undefined;
+    if (enableBatchExtraction) {
+      batchInferenceRole = new Role(this, "BatchInferenceRole", {
+        assumedBy: new ServicePrincipal("bedrock.amazonaws.com", {
+          conditions: {
+            StringEquals: { "aws:SourceAccount": Stack.of(this).account },
+          },
+        }),
+      });
+      batchInferenceRole.addToPolicy(
+        new PolicyStatement({
+          actions: ["s3:GetObject", "s3:PutObject"],
+          resources: [`${documentBucket.bucketArn}/batch-inference/*`],
+        })
+      );
+      batchInferenceRole.addToPolicy(
+        new PolicyStatement({
+          actions: ["s3:ListBucket"],
+          resources: [documentBucket.bucketArn],
+        })
+      );
+      // クロスリージョン推論プロファイルを使用する場合に必要
+      batchInferenceRole.addToPolicy(
+        new PolicyStatement({
+          actions: ["bedrock:InvokeModel"],
+          resources: ["*"],
+        })
+      );
+
+      lambdaRole.addToPolicy(
+        new PolicyStatement({
+          actions: [
+            "bedrock:CreateModelInvocationJob",
+            "bedrock:GetModelInvocationJob",
+          ],
+          resources: ["*"],
+        })
+      );
+      lambdaRole.addToPolicy(
+        new PolicyStatement({
+          actions: ["iam:PassRole"],
+          resources: [batchInferenceRole.roleArn],
+          conditions: {
+            StringEquals: { "iam:PassedToService": "bedrock.amazonaws.com" },
+          },
+        })
+      );
+    }
+
     // DynamoDBへのアクセス権限
     lambdaRole.addToPolicy(
       new PolicyStatement({
@@ -136,11 +223,14 @@ export class Api extends Construct {
           "dynamodb:DeleteItem",
           "dynamodb:Query",
           "dynamodb:Scan",
+          "dynamodb:BatchWriteItem",
+          "dynamodb:BatchGetItem",
         ],
         resources: [
           imagesTable.tableArn,
           jobsTable.tableArn,
           props.schemasTable.tableArn,
+          props.syncManifestTable.tableArn,
           `${imagesTable.tableArn}/index/*`, // GSIへのアクセス権限も追加
         ],
       })
@@ -158,20 +248,52 @@ export class Api extends Construct {
         IMAGES_TABLE_NAME: imagesTable.tableName,
         JOBS_TABLE_NAME: jobsTable.tableName,
         SCHEMAS_TABLE_NAME: props.schemasTable.tableName,
+        SYNC_MANIFEST_TABLE_NAME: props.syncManifestTable.tableName,
         ENABLE_OCR: props.enableOcr.toString(),
         SAGEMAKER_ENDPOINT_NAME: props.sagemakerEndpointName || "",
         SAGEMAKER_INFERENCE_COMPONENT_NAME:
           props.sagemakerInferenceComponentName || "",
         MODEL_ID: modelId,
         MODEL_REGION: modelRegion,
+        TASK_QUEUE_BACKEND: taskQueueBackend,
+        TASK_QUEUE_URL: taskQueue.queueUrl,
+        TASK_DEAD_LETTER_QUEUE_URL: taskDeadLetterQueue.queueUrl,
+        AUTO_START_OCR_ON_UPLOAD: autoStartOcrOnUpload.toString(),
+        ENABLE_BATCH_EXTRACTION: enableBatchExtraction.toString(),
+        BATCH_INFERENCE_ROLE_ARN: batchInferenceRole?.roleArn || "",
         PORT: "8080",
         // Lambda Web Adapter関連の環境変数
         AWS_LWA_PORT: "8080",
         AWS_LWA_READINESS_CHECK_PATH: "/health",
+        // /events がS3イベントの取り込み失敗時に返すステータス（呼び出しエラーとして再試行させる）
+        AWS_LWA_ERROR_STATUS_CODES: "502",
       },
       role: lambdaRole,
     });
 
+    // タスクキューへのアクセス権限とイベントソース
+    // （SQSイベントはLambda Web Adapterにより /events に転送される）
+    taskQueue.grantSendMessages(lambdaFunction);
+    taskDeadLetterQueue.grantSendMessages(lambdaFunction);
+    if (taskQueueBackend === "sqs") {
+      lambdaFunction.addEventSource(
+        new SqsEventSource(taskQueue, {
+          batchSize: 1,
+          reportBatchItemFailures: true,
+        })
+      );
+    }
+
+    // アップロードされたファイルの取り込み
+    // （S3イベントもLambda Web Adapterにより /events に転送される）
+    if (enableS3EventIngestion) {
+      documentBucket.addEventNotification(
+        EventType.OBJECT_CREATED,
+        new LambdaDestination(lambdaFunction),
+        { prefix: "uploads/" }
+      );
+    }
+
     // Cognitoユーザープール参照
     const userPool = UserPool.fromUserPoolId(
       this,
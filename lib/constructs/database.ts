@@ -10,6 +10,7 @@ export class Database extends Construct {
   public readonly imagesTable: Table;
   public readonly jobsTable: Table;
   public readonly schemasTable: Table;
+  public readonly syncManifestTable: Table;
 
   constructor(scope: Construct, id: string, props: DatabaseProps = {}) {
     super(scope, id);
@@ -29,6 +30,13 @@ export class Database extends Construct {
       sortKey: { name: "upload_time", type: AttributeType.STRING },
     });
 
+    // GSI を追加（同じ内容のドキュメントの検索用、content_hash を持つレコードのみ）
+    this.imagesTable.addGlobalSecondaryIndex({
+      indexName: "ContentHashIndex",
+      partitionKey: { name: "content_hash", type: AttributeType.STRING },
+      sortKey: { name: "app_name", type: AttributeType.STRING },
+    });
+
     // ジョブ情報を保存するテーブル
     this.jobsTable = new Table(this, "JobsTable", {
       partitionKey: { name: "id", type: AttributeType.STRING },
@@ -46,6 +54,15 @@ export class Database extends Construct {
       pointInTimeRecovery: true,
     });
 
+    // S3同期で取り込み済みのオブジェクトを記録するテーブル（オブジェクトごとに1アイテム）
+    this.syncManifestTable = new Table(this, "SyncManifestTable", {
+      partitionKey: { name: "app_name", type: AttributeType.STRING },
+      sortKey: { name: "source", type: AttributeType.STRING },
+      billingMode: BillingMode.PAY_PER_REQUEST,
+      removalPolicy: RemovalPolicy.DESTROY, // 開発環境用
+      pointInTimeRecovery: true,
+    });
+
     // テーブル名を出力
     new CfnOutput(this, "ImagesTableName", {
       value: this.imagesTable.tableName,
@@ -61,5 +78,10 @@ export class Database extends Construct {
       value: this.schemasTable.tableName,
       description: "DynamoDB Schemas Table Name",
     });
+
+    new CfnOutput(this, "SyncManifestTableName", {
+      value: this.syncManifestTable.tableName,
+      description: "DynamoDB Sync Manifest Table Name",
+    });
   }
 }
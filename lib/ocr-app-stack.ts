@@ -29,6 +29,7 @@ export class OcrAppStack extends cdk.Stack {
       imagesTable: database.imagesTable,
       jobsTable: database.jobsTable,
       schemasTable: database.schemasTable,
+      syncManifestTable: database.syncManifestTable,
       userPoolId: auth.userPool.userPoolId,
       userPoolClientId: auth.client.userPoolClientId,
       enableOcr: enableOcr,
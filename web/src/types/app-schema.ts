@@ -38,6 +38,8 @@ export interface S3SyncFile {
   size: number;
   last_modified: string;
   filename: string;
+  etag?: string;
+  sync_status?: 'new' | 'changed' | 'imported';
 }
 
 export interface S3SyncResponse {
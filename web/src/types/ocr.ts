@@ -71,12 +71,20 @@ export interface OcrStatusResponse {
   }[];
 }
 
+// 一覧・プレビュー用の縮小画像のURL（作成済みの階層のみ含まれる）
+export interface ImageTierUrls {
+  thumbnail?: string;
+  preview?: string;
+}
+
 export interface PresignedDownloadUrlResponse {
   presigned_url: string;
+  tier_urls?: ImageTierUrls;
   presigned_urls: Array<{
     page: number;
     presigned_url: string;
     s3_key: string;
+    tier_urls?: ImageTierUrls;
   }>;
   total_pages: number;
   is_multipage: boolean;